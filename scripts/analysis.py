@@ -1,133 +1,708 @@
 #!/usr/bin/env python3
 
 import sqlite3
+import heapq
 import json
-from datetime import datetime
-from database import DatabaseManager
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Optional
+from database import DatabaseManager, BUSY_TIMEOUT
+from metrics import instrumented
+from sketches import DDSketch, HyperLogLog, SpaceSaving, load_daily_sketches, period_key
+
+# Moteurs de calcul des analyses: requêtes SQL sur l'agrégat, ou colonnes NumPy en mémoire
+BACKENDS = ('sql', 'numpy')
+
+# Politique de rétention: un résultat par heure pendant horaire_jours, puis un par jour
+# jusqu'à max_jours (None: sans limite)
+DEFAULT_RETENTION = {'horaire_jours': 7, 'max_jours': 365}
+
+# Écriture des résultats en cache: attente maximale d'un verrou SQLite tenu par un autre processus
+# (millisecondes), et nombre maximal de résultats gardés en mémoire en attendant l'écrivain
+RESULTS_BUSY_TIMEOUT_MS = 100
+MAX_PENDING_RESULTS = 1000
+
+# Regroupement temporel des analyses paramétrées (semaine: lundi de la semaine)
+GRANULARITES = {
+    'jour': "Date",
+    'semaine': "date(Date, '-6 days', 'weekday 1')",
+    'mois': "substr(Date, 1, 7)"
+}
 
 class SalesAnalyzer:
     
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(self, db_manager: DatabaseManager, use_cache: bool = True, max_workers: int = 4,
+                 backend: str = 'sql', persist_results: bool = True, verbose: bool = True):
+        if backend not in BACKENDS:
+            raise ValueError(f"Moteur d'analyse inconnu: {backend} (attendu: {', '.join(BACKENDS)})")
+        
         self.db_manager = db_manager
+        self.metrics = db_manager.metrics
+        self.use_cache = use_cache
+        # Sans écriture des résultats dans ANALYSE_RESULTATS (lecteur seul, comme l'API): le cache
+        # n'est alors que lu
+        self.persist_results = persist_results
+        self.backend = backend
+        # Sans messages de progression (API: une analyse par requête); les étapes restent mesurées
+        self.verbose = verbose
+        self._columnar = None
+        self.max_workers = max_workers
+        self.cache_stats = {'hits': 0, 'misses': 0}
+        self._pending_results = []
+        # Profondeur des blocs batch_results ouverts (imbriqués ou dans plusieurs threads), sous _lock
+        self._batching = 0
+        self._lock = threading.Lock()
         
-    def get_chiffre_affaires_total(self):
-        print("Calcul du chiffre d'affaires total...")
+    @instrumented('analyse_ca_total')
+    def get_chiffre_affaires_total(self, date_debut: Optional[str] = None, date_fin: Optional[str] = None):
+        self._print("Calcul du chiffre d'affaires total...")
         
-        cursor = self.db_manager.connection.cursor()
+        parametres = self._period_parameters(date_debut, date_fin)
+        with self.db_manager.reader() as connection:
+            version = self.db_manager.get_data_version(connection)
+            cached = self._get_cached_result(connection, version, 'CA_TOTAL', parametres)
+            if cached is not None:
+                self._print(f"CA Total: {cached['chiffre_affaires_total']}€")
+                return cached
+            
+            where, valeurs = self._cube_filter(date_debut, date_fin)
+            cursor = connection.cursor()
+            
+            self._execute(cursor, 'CA_TOTAL', f"""
+                SELECT 
+                    SUM(Montant_Total) as CA_Total,
+                    COALESCE(SUM(Nombre_Ventes), 0) as Nombre_Ventes,
+                    MIN(Date) as Date_Debut,
+                    MAX(Date) as Date_Fin
+                FROM VENTE_AGREGAT_JOUR
+                {where}
+            """, valeurs)
+            
+            result = cursor.fetchone()
+            
+            analysis_result = {
+                'type_analyse': 'CA_TOTAL',
+                'date_analyse': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'chiffre_affaires_total': round(result[0], 2) if result[0] else 0,
+                'nombre_ventes': result[1],
+                'periode_debut': result[2],
+                'periode_fin': result[3]
+            }
+            
+        self._store_analysis_result(analysis_result, version, parametres)
         
-        cursor.execute("""
-            SELECT 
-                SUM(Montant_Total) as CA_Total,
-                COUNT(*) as Nombre_Ventes,
-                MIN(Date) as Date_Debut,
-                MAX(Date) as Date_Fin
-            FROM VENTE
-        """)
+        self._print(f"CA Total: {analysis_result['chiffre_affaires_total']}€")
+        return analysis_result
+    
+    @instrumented('analyse_ventes_produit')
+    def get_ventes_par_produit(self, date_debut: Optional[str] = None, date_fin: Optional[str] = None):
+        self._print("Analyse des ventes par produit...")
         
-        result = cursor.fetchone()
+        parametres = self._period_parameters(date_debut, date_fin)
+        with self.db_manager.reader() as connection:
+            version = self.db_manager.get_data_version(connection)
+            cached = self._get_cached_result(connection, version, 'VENTES_PRODUIT', parametres)
+            if cached is not None:
+                self._print(f"Analyse de {cached['nombre_produits']} produits terminée")
+                return cached
+            
+            if self.backend == 'numpy':
+                produits_analysis = self._columnar_store(connection, version).ventes_par_produit(
+                    date_debut, date_fin)
+            else:
+                where, valeurs = self._cube_filter(date_debut, date_fin)
+                cursor = connection.cursor()
+                
+                self._execute(cursor, 'VENTES_PRODUIT', f"""
+                    SELECT 
+                        p.ID_Reference,
+                        p.Nom,
+                        p.Prix,
+                        a.Quantite_Totale,
+                        a.CA_Produit,
+                        a.Nombre_Ventes
+                    FROM PRODUIT p
+                    LEFT JOIN (
+                        SELECT 
+                            ID_Reference_Produit,
+                            SUM(Quantite_Totale) as Quantite_Totale,
+                            SUM(Montant_Total) as CA_Produit,
+                            SUM(Nombre_Ventes) as Nombre_Ventes
+                        FROM VENTE_AGREGAT_JOUR
+                        {where}
+                        GROUP BY ID_Reference_Produit
+                    ) a ON p.ID_Reference = a.ID_Reference_Produit
+                    ORDER BY a.CA_Produit DESC
+                """, valeurs)
+                
+                results = cursor.fetchall()
+                
+                produits_analysis = []
+                for row in results:
+                    produits_analysis.append({
+                        'reference': row[0],
+                        'nom': row[1],
+                        'prix_unitaire': row[2],
+                        'quantite_totale': row[3] or 0,
+                        'ca_produit': round(row[4] or 0, 2),
+                        'nombre_ventes': row[5] or 0
+                    })
+            
+            analysis_result = {
+                'type_analyse': 'VENTES_PRODUIT',
+                'date_analyse': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'produits': produits_analysis,
+                'nombre_produits': len(produits_analysis)
+            }
+            
+        self._store_analysis_result(analysis_result, version, parametres)
         
-        analysis_result = {
-            'type_analyse': 'CA_TOTAL',
-            'date_analyse': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'chiffre_affaires_total': round(result[0], 2) if result[0] else 0,
-            'nombre_ventes': result[1],
-            'periode_debut': result[2],
-            'periode_fin': result[3]
-        }
+        self._print(f"Analyse de {len(produits_analysis)} produits terminée")
+        return analysis_result
+    
+    @instrumented('analyse_ventes_region')
+    def get_ventes_par_region(self, date_debut: Optional[str] = None, date_fin: Optional[str] = None):
+        self._print("Analyse des ventes par région...")
         
-        self._store_analysis_result(analysis_result)
+        parametres = self._period_parameters(date_debut, date_fin)
+        with self.db_manager.reader() as connection:
+            version = self.db_manager.get_data_version(connection)
+            cached = self._get_cached_result(connection, version, 'VENTES_REGION', parametres)
+            if cached is not None:
+                self._print(f"Analyse de {cached['nombre_regions']} régions terminée")
+                return cached
+            
+            if self.backend == 'numpy':
+                regions_analysis = self._columnar_store(connection, version).ventes_par_region(
+                    date_debut, date_fin)
+            else:
+                where, valeurs = self._cube_filter(date_debut, date_fin)
+                cursor = connection.cursor()
+                
+                self._execute(cursor, 'VENTES_REGION', f"""
+                    SELECT 
+                        m.Region,
+                        COUNT(DISTINCT m.ID_Magasin) as Nombre_Magasins,
+                        SUM(a.CA_Magasin) as CA_Region,
+                        SUM(a.Nombre_Ventes) as Nombre_Ventes,
+                        SUM(a.Quantite_Totale) as Quantite_Totale
+                    FROM MAGASIN m
+                    LEFT JOIN (
+                        SELECT 
+                            ID_Magasin,
+                            SUM(Montant_Total) as CA_Magasin,
+                            SUM(Nombre_Ventes) as Nombre_Ventes,
+                            SUM(Quantite_Totale) as Quantite_Totale
+                        FROM VENTE_AGREGAT_JOUR
+                        {where}
+                        GROUP BY ID_Magasin
+                    ) a ON m.ID_Magasin = a.ID_Magasin
+                    GROUP BY m.Region
+                    ORDER BY CA_Region DESC
+                """, valeurs)
+                
+                results = cursor.fetchall()
+                
+                regions_analysis = []
+                for row in results:
+                    regions_analysis.append({
+                        'region': row[0],
+                        'nombre_magasins': row[1],
+                        'ca_region': round(row[2] or 0, 2),
+                        'nombre_ventes': row[3] or 0,
+                        'quantite_totale': row[4] or 0
+                    })
+            
+            analysis_result = {
+                'type_analyse': 'VENTES_REGION',
+                'date_analyse': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'regions': regions_analysis,
+                'nombre_regions': len(regions_analysis)
+            }
+            
+        self._store_analysis_result(analysis_result, version, parametres)
         
-        print(f"CA Total: {analysis_result['chiffre_affaires_total']}€")
+        self._print(f"Analyse de {len(regions_analysis)} régions terminée")
         return analysis_result
     
-    def get_ventes_par_produit(self):
-        print("Analyse des ventes par produit...")
+    @instrumented('analyse_evolution_ventes')
+    def get_evolution_ventes(self, date_debut: Optional[str] = None, date_fin: Optional[str] = None,
+                             granularite: str = 'jour', id_magasin: Optional[int] = None,
+                             region: Optional[str] = None):
+        self._print(f"Analyse de l'évolution des ventes par {granularite}...")
         
-        cursor = self.db_manager.connection.cursor()
+        if granularite not in GRANULARITES:
+            raise ValueError(f"Granularité inconnue: {granularite} (attendu: {', '.join(GRANULARITES)})")
         
-        cursor.execute("""
-            SELECT 
-                p.ID_Reference,
-                p.Nom,
-                p.Prix,
-                SUM(v.Quantite) as Quantite_Totale,
-                SUM(v.Montant_Total) as CA_Produit,
-                COUNT(v.ID_Vente) as Nombre_Ventes
-            FROM PRODUIT p
-            LEFT JOIN VENTE v ON p.ID_Reference = v.ID_Reference_Produit
-            GROUP BY p.ID_Reference, p.Nom, p.Prix
-            ORDER BY CA_Produit DESC
-        """)
-        
-        results = cursor.fetchall()
-        
-        produits_analysis = []
-        for row in results:
-            produits_analysis.append({
+        parametres = {'date_debut': date_debut, 'date_fin': date_fin, 'granularite': granularite,
+                      'id_magasin': id_magasin, 'region': region}
+        with self.db_manager.reader() as connection:
+            version = self.db_manager.get_data_version(connection)
+            cached = self._get_cached_result(connection, version, 'EVOLUTION_VENTES', parametres)
+            if cached is not None:
+                return cached
+            
+            if self.backend == 'numpy':
+                periodes = self._columnar_store(connection, version).evolution(
+                    date_debut, date_fin, granularite, id_magasin, region)
+            else:
+                where, valeurs = self._cube_filter(date_debut, date_fin, id_magasin, region)
+                cursor = connection.cursor()
+                self._execute(cursor, 'EVOLUTION_VENTES', f"""
+                    SELECT 
+                        {GRANULARITES[granularite]} as Periode,
+                        SUM(Nombre_Ventes) as Nombre_Ventes,
+                        SUM(Montant_Total) as CA_Periode,
+                        SUM(Quantite_Totale) as Quantite_Totale
+                    FROM VENTE_AGREGAT_JOUR
+                    {where}
+                    GROUP BY Periode
+                    ORDER BY Periode
+                """, valeurs)
+                
+                periodes = [{
+                    'periode': row[0],
+                    'nombre_ventes': row[1],
+                    'ca_periode': round(row[2], 2),
+                    'quantite_totale': row[3]
+                } for row in cursor.fetchall()]
+            
+            analysis_result = {
+                'type_analyse': 'EVOLUTION_VENTES',
+                'date_analyse': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'parametres': parametres,
+                'periodes': periodes,
+                'ca_total': round(sum(periode['ca_periode'] for periode in periodes), 2)
+            }
+            
+        self._store_analysis_result(analysis_result, version, parametres)
+        
+        self._print(f"Analyse de {len(periodes)} périodes terminée")
+        return analysis_result
+    
+    @instrumented('analyse_top_magasins')
+    def get_top_magasins(self, date_debut: Optional[str] = None, date_fin: Optional[str] = None,
+                         region: Optional[str] = None, limit: int = 5):
+        self._print(f"Analyse du top {limit} des magasins...")
+        
+        parametres = {'date_debut': date_debut, 'date_fin': date_fin, 'region': region, 'limit': limit}
+        with self.db_manager.reader() as connection:
+            version = self.db_manager.get_data_version(connection)
+            cached = self._get_cached_result(connection, version, 'TOP_MAGASINS', parametres)
+            if cached is not None:
+                return cached
+            
+            where, valeurs = self._cube_filter(date_debut, date_fin, region=region)
+            cursor = connection.cursor()
+            self._execute(cursor, 'TOP_MAGASINS', f"""
+                SELECT 
+                    m.ID_Magasin,
+                    m.Ville,
+                    m.Region,
+                    a.CA_Magasin,
+                    a.Nombre_Ventes
+                FROM MAGASIN m
+                JOIN (
+                    SELECT 
+                        ID_Magasin,
+                        SUM(Montant_Total) as CA_Magasin,
+                        SUM(Nombre_Ventes) as Nombre_Ventes
+                    FROM VENTE_AGREGAT_JOUR
+                    {where}
+                    GROUP BY ID_Magasin
+                ) a ON m.ID_Magasin = a.ID_Magasin
+                ORDER BY a.CA_Magasin DESC
+                LIMIT ?
+            """, valeurs + [limit])
+            
+            magasins = [{
+                'id_magasin': row[0],
+                'ville': row[1],
+                'region': row[2],
+                'ca_magasin': round(row[3], 2),
+                'nombre_ventes': row[4]
+            } for row in cursor.fetchall()]
+            
+            analysis_result = {
+                'type_analyse': 'TOP_MAGASINS',
+                'date_analyse': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'parametres': parametres,
+                'magasins': magasins
+            }
+            
+        self._store_analysis_result(analysis_result, version, parametres)
+        
+        self._print(f"Analyse de {len(magasins)} magasins terminée")
+        return analysis_result
+    
+    @instrumented('analyse_stocks_ventes')
+    def get_stocks_vs_ventes(self, date_debut: Optional[str] = None, date_fin: Optional[str] = None,
+                             id_magasin: Optional[int] = None, region: Optional[str] = None,
+                             limit: Optional[int] = None):
+        self._print("Analyse des stocks par rapport aux ventes...")
+        
+        parametres = {'date_debut': date_debut, 'date_fin': date_fin, 'id_magasin': id_magasin,
+                      'region': region, 'limit': limit}
+        with self.db_manager.reader() as connection:
+            version = self.db_manager.get_data_version(connection)
+            cached = self._get_cached_result(connection, version, 'STOCKS_VENTES', parametres)
+            if cached is not None:
+                return cached
+            
+            where, valeurs = self._cube_filter(date_debut, date_fin, id_magasin, region)
+            cursor = connection.cursor()
+            self._execute(cursor, 'STOCKS_VENTES', f"""
+                SELECT 
+                    p.ID_Reference,
+                    p.Nom,
+                    p.Stock,
+                    a.Quantite_Vendue,
+                    ROUND((a.Quantite_Vendue * 100.0 / p.Stock), 2) as Pourcentage_Stock_Vendu
+                FROM PRODUIT p
+                LEFT JOIN (
+                    SELECT ID_Reference_Produit, SUM(Quantite_Totale) as Quantite_Vendue
+                    FROM VENTE_AGREGAT_JOUR
+                    {where}
+                    GROUP BY ID_Reference_Produit
+                ) a ON p.ID_Reference = a.ID_Reference_Produit
+                ORDER BY Pourcentage_Stock_Vendu DESC
+                LIMIT ?
+            """, valeurs + [limit if limit is not None else -1])
+            
+            produits = [{
                 'reference': row[0],
                 'nom': row[1],
-                'prix_unitaire': row[2],
-                'quantite_totale': row[3] or 0,
-                'ca_produit': round(row[4] or 0, 2),
-                'nombre_ventes': row[5] or 0
-            })
+                'stock': row[2],
+                'quantite_vendue': row[3] or 0,
+                'pourcentage_stock_vendu': row[4]
+            } for row in cursor.fetchall()]
+            
+            analysis_result = {
+                'type_analyse': 'STOCKS_VENTES',
+                'date_analyse': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'parametres': parametres,
+                'produits': produits
+            }
+            
+        self._store_analysis_result(analysis_result, version, parametres)
+        
+        self._print(f"Analyse de {len(produits)} produits terminée")
+        return analysis_result
+    
+    @instrumented('analyse_top_ventes')
+    def get_top_ventes(self, date_debut: Optional[str] = None, date_fin: Optional[str] = None,
+                       id_magasin: Optional[int] = None, region: Optional[str] = None, limit: int = 10):
+        self._print(f"Analyse des {limit} plus grosses ventes...")
+        
+        parametres = {'date_debut': date_debut, 'date_fin': date_fin, 'id_magasin': id_magasin,
+                      'region': region, 'limit': limit}
+        with self.db_manager.reader() as connection:
+            version = self.db_manager.get_data_version(connection)
+            cached = self._get_cached_result(connection, version, 'TOP_VENTES', parametres)
+            if cached is not None:
+                return cached
+            
+            # Ventes détaillées: en stockage partitionné, seules les partitions de la période sont lues
+            source = self.db_manager.vente_source(date_debut, date_fin, connection)
+            where, valeurs = self._cube_filter(date_debut, date_fin, id_magasin, region)
+            cursor = connection.cursor()
+            self._execute(cursor, 'TOP_VENTES', f"""
+                SELECT 
+                    v.Date,
+                    v.ID_Reference_Produit,
+                    p.Nom,
+                    v.ID_Magasin,
+                    m.Ville,
+                    v.Quantite,
+                    v.Montant_Total
+                FROM (
+                    SELECT Date, ID_Reference_Produit, ID_Magasin, Quantite, Montant_Total
+                    FROM {source}
+                    {where}
+                    ORDER BY Montant_Total DESC
+                    LIMIT ?
+                ) v
+                LEFT JOIN PRODUIT p ON p.ID_Reference = v.ID_Reference_Produit
+                LEFT JOIN MAGASIN m ON m.ID_Magasin = v.ID_Magasin
+                ORDER BY v.Montant_Total DESC
+            """, valeurs + [limit])
+            
+            ventes = [{
+                'date': row[0],
+                'reference': row[1],
+                'nom': row[2],
+                'id_magasin': row[3],
+                'ville': row[4],
+                'quantite': row[5],
+                'montant_total': round(row[6], 2)
+            } for row in cursor.fetchall()]
+            
+            analysis_result = {
+                'type_analyse': 'TOP_VENTES',
+                'date_analyse': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'parametres': parametres,
+                'ventes': ventes
+            }
+            
+        self._store_analysis_result(analysis_result, version, parametres)
         
+        self._print(f"Analyse de {len(ventes)} ventes terminée")
+        return analysis_result
+    
+    # Analyses approchées: servies par les sketches de VENTE_SKETCH_JOUR (un enregistrement par
+    # jour, fusionnés sur la période) au lieu d'un parcours des ventes, avec leur borne d'erreur
+    
+    @instrumented('analyse_actifs_approx')
+    def get_actifs_approx(self, date_debut: Optional[str] = None, date_fin: Optional[str] = None,
+                          granularite: str = 'mois'):
+        self._print(f"Estimation des magasins et produits actifs par {granularite}...")
+        
+        if granularite not in GRANULARITES:
+            raise ValueError(f"Granularité inconnue: {granularite} (attendu: {', '.join(GRANULARITES)})")
+        
+        parametres = {'date_debut': date_debut, 'date_fin': date_fin, 'granularite': granularite}
+        with self.db_manager.reader() as connection:
+            version = self.db_manager.get_data_version(connection)
+            cached = self._get_cached_result(connection, version, 'ACTIFS_APPROX', parametres)
+            if cached is not None:
+                return cached
+            
+            jours = load_daily_sketches(connection, date_debut, date_fin, ('hll_produits', 'hll_magasins'))
+        
+        par_periode = {}
+        for jour, sketches in jours:
+            par_periode.setdefault(period_key(jour, granularite), []).append(sketches)
+        
+        def distincts(jours_periode: list, sketch: str) -> int:
+            return round(HyperLogLog.union([sketches[sketch] for sketches in jours_periode]).estimate())
+        
+        periodes = [{
+            'periode': periode,
+            'nombre_ventes': sum(sketches['nombre_ventes'] for sketches in jours_periode),
+            'magasins_actifs': distincts(jours_periode, 'hll_magasins'),
+            'produits_actifs': distincts(jours_periode, 'hll_produits')
+        } for periode, jours_periode in par_periode.items()]
+        
+        tous_les_jours = [sketches for _, sketches in jours]
         analysis_result = {
-            'type_analyse': 'VENTES_PRODUIT',
+            'type_analyse': 'ACTIFS_APPROX',
             'date_analyse': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'produits': produits_analysis,
-            'nombre_produits': len(produits_analysis)
+            'parametres': parametres,
+            'periodes': periodes,
+            'magasins_actifs': distincts(tous_les_jours, 'hll_magasins'),
+            'produits_actifs': distincts(tous_les_jours, 'hll_produits'),
+            # Erreur type relative; ±2 erreurs types couvrent ~95 % des estimations
+            'erreur_relative': round(HyperLogLog().relative_error(), 4)
         }
         
-        self._store_analysis_result(analysis_result)
+        self._store_analysis_result(analysis_result, version, parametres)
         
-        print(f"Analyse de {len(produits_analysis)} produits terminée")
+        self._print(f"Estimation sur {len(periodes)} périodes terminée "
+                    f"(±{analysis_result['erreur_relative']:.1%} par estimation)")
         return analysis_result
     
-    def get_ventes_par_region(self):
-        print("Analyse des ventes par région...")
+    @instrumented('analyse_top_produits_approx')
+    def get_top_produits_approx(self, date_debut: Optional[str] = None, date_fin: Optional[str] = None,
+                                limit: int = 10):
+        self._print(f"Estimation des {limit} produits au plus fort chiffre d'affaires...")
         
-        cursor = self.db_manager.connection.cursor()
+        parametres = {'date_debut': date_debut, 'date_fin': date_fin, 'limit': limit}
+        with self.db_manager.reader() as connection:
+            version = self.db_manager.get_data_version(connection)
+            cached = self._get_cached_result(connection, version, 'TOP_PRODUITS_APPROX', parametres)
+            if cached is not None:
+                return cached
+            
+            jours = load_daily_sketches(connection, date_debut, date_fin, ('top_produits',))
+            resume = SpaceSaving.union([sketches['top_produits'] for _, sketches in jours])
+            candidats = resume.top(limit + 1)
+            
+            references = [reference for reference, _ in candidats[:limit]]
+            cursor = connection.execute(f"""
+                SELECT ID_Reference, Nom FROM PRODUIT WHERE ID_Reference IN ({', '.join('?' * len(references))})
+            """, references)
+            noms = dict(cursor.fetchall())
         
-        cursor.execute("""
-            SELECT 
-                m.Region,
-                COUNT(DISTINCT m.ID_Magasin) as Nombre_Magasins,
-                SUM(v.Montant_Total) as CA_Region,
-                COUNT(v.ID_Vente) as Nombre_Ventes,
-                SUM(v.Quantite) as Quantite_Totale
-            FROM MAGASIN m
-            LEFT JOIN VENTE v ON m.ID_Magasin = v.ID_Magasin
-            GROUP BY m.Region
-            ORDER BY CA_Region DESC
-        """)
-        
-        results = cursor.fetchall()
-        
-        regions_analysis = []
-        for row in results:
-            regions_analysis.append({
-                'region': row[0],
-                'nombre_magasins': row[1],
-                'ca_region': round(row[2] or 0, 2),
-                'nombre_ventes': row[3] or 0,
-                'quantite_totale': row[4] or 0
-            })
+        # CA maximal d'un produit hors de la liste: le suivant du résumé, ou le plus petit
+        # compteur d'un résumé plein (un produit non suivi ne peut le dépasser)
+        seuil = max(candidats[limit][1][0] if len(candidats) > limit else 0.0, resume.minimum())
+        produits = [{
+            'reference': reference,
+            'nom': noms.get(reference),
+            'ca_estime': round(estimation, 2),
+            'erreur_max': round(erreur, 2),
+            'ca_minimum': round(estimation - erreur, 2),
+            # Son CA minimal dépasse celui de tout produit hors liste: sa présence est certaine
+            'garanti': estimation - erreur >= seuil
+        } for reference, (estimation, erreur) in candidats[:limit]]
         
         analysis_result = {
-            'type_analyse': 'VENTES_REGION',
+            'type_analyse': 'TOP_PRODUITS_APPROX',
             'date_analyse': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'regions': regions_analysis,
-            'nombre_regions': len(regions_analysis)
+            'parametres': parametres,
+            'produits': produits,
+            'ca_total': round(resume.total, 2),
+            'ca_max_hors_liste': round(seuil, 2)
         }
         
-        self._store_analysis_result(analysis_result)
+        self._store_analysis_result(analysis_result, version, parametres)
         
-        print(f"Analyse de {len(regions_analysis)} régions terminée")
+        self._print(f"Estimation de {len(produits)} produits terminée "
+                    f"({sum(produit['garanti'] for produit in produits)} garantis dans le top)")
         return analysis_result
     
-    def _store_analysis_result(self, result):
-        cursor = self.db_manager.connection.cursor()
+    @instrumented('analyse_quantiles_montant_approx')
+    def get_quantiles_montant_approx(self, date_debut: Optional[str] = None, date_fin: Optional[str] = None,
+                                     quantiles: tuple = (0.5, 0.9, 0.99)):
+        self._print("Estimation des quantiles du montant des ventes...")
+        
+        parametres = {'date_debut': date_debut, 'date_fin': date_fin, 'quantiles': list(quantiles)}
+        with self.db_manager.reader() as connection:
+            version = self.db_manager.get_data_version(connection)
+            cached = self._get_cached_result(connection, version, 'QUANTILES_MONTANT_APPROX', parametres)
+            if cached is not None:
+                return cached
+            
+            jours = load_daily_sketches(connection, date_debut, date_fin, ('quantiles_montant',))
+        
+        sketch = DDSketch.union([sketches['quantiles_montant'] for _, sketches in jours])
+        estimations = {q: sketch.quantile(q) for q in quantiles}
+        analysis_result = {
+            'type_analyse': 'QUANTILES_MONTANT_APPROX',
+            'date_analyse': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'parametres': parametres,
+            'nombre_ventes': sketch.count,
+            'quantiles': [{
+                'quantile': q,
+                'montant': round(valeur, 2) if valeur is not None else None
+            } for q, valeur in estimations.items()],
+            'montant_min': sketch.minimum,
+            'montant_max': sketch.maximum,
+            # Chaque montant estimé est à moins de cette erreur relative d'un montant réel de ce rang
+            'erreur_relative': sketch.precision
+        }
+        
+        self._store_analysis_result(analysis_result, version, parametres)
+        
+        self._print(f"Quantiles estimés sur {sketch.count} ventes (±{sketch.precision:.0%})")
+        return analysis_result
+    
+    def _columnar_store(self, connection: sqlite3.Connection, version: int):
+        # Import différé: NumPy n'est chargé que si le moteur en colonnes est utilisé
+        if self._columnar is None:
+            from columnar import ColumnarStore
+            self._columnar = ColumnarStore(self.db_manager, verbose=self.verbose)
+        return self._columnar.refresh(connection, version)
+    
+    def _print(self, message: str):
+        # Messages de progression, omis sans verbose
+        if self.verbose:
+            print(message)
+    
+    def _execute(self, cursor: sqlite3.Cursor, type_analyse: str, sql: str, parametres=()):
+        # Requête principale d'une analyse: son plan est joint aux métriques de l'exécution
+        self.metrics.record_query_plan(type_analyse, cursor.connection, sql, parametres)
+        return cursor.execute(sql, parametres)
+    
+    @staticmethod
+    def _cube_filter(date_debut: Optional[str] = None, date_fin: Optional[str] = None,
+                     id_magasin: Optional[int] = None, region: Optional[str] = None) -> tuple:
+        # Sur l'agrégat, les bornes sur Date utilisent la clé primaire (Date, produit, magasin) et
+        # le magasin l'index couvrant idx_agregat_magasin_date; sur les ventes détaillées,
+        # idx_vente_date (ou l'index de date de chaque partition) et idx_vente_magasin
+        conditions = []
+        valeurs = []
+        if date_debut:
+            conditions.append("Date >= ?")
+            valeurs.append(date_debut)
+        if date_fin:
+            conditions.append("Date <= ?")
+            valeurs.append(date_fin)
+        if id_magasin is not None:
+            conditions.append("ID_Magasin = ?")
+            valeurs.append(id_magasin)
+        if region:
+            conditions.append("ID_Magasin IN (SELECT ID_Magasin FROM MAGASIN WHERE Region = ?)")
+            valeurs.append(region)
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return where, valeurs
+    
+    @staticmethod
+    def _period_parameters(date_debut: Optional[str] = None, date_fin: Optional[str] = None) -> Optional[dict]:
+        # Sans période, mêmes paramètres (aucun) que les résultats du rafraîchissement incrémental
+        if date_debut is None and date_fin is None:
+            return None
+        return {'date_debut': date_debut, 'date_fin': date_fin}
+    
+    def _get_cached_result(self, connection: sqlite3.Connection, version: int, type_analyse: str,
+                           parametres: Optional[dict] = None) -> Optional[dict]:
+        if not self.use_cache:
+            return None
+        
+        # Un résultat stocké pour la version des données lue par cette connexion est encore exact
+        parametres_encodes = self._encode_parametres(parametres)
+        
+        resultat = None
+        with self._lock:
+            for pending in reversed(self._pending_results):
+                if pending[0] == type_analyse and pending[5] == version and pending[6] == parametres_encodes:
+                    resultat = self._decode_resultat(pending[2], pending[4])
+                    break
+        
+        if resultat is None:
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT Resultat, Resultat_Compresse FROM ANALYSE_RESULTATS
+                WHERE Type_Analyse = ? AND Version_Donnees = ? AND Parametres = ?
+                ORDER BY ID_Analyse DESC LIMIT 1
+            """, (type_analyse, version, parametres_encodes))
+            row = cursor.fetchone()
+            if row is not None:
+                resultat = self._decode_resultat(row[0], row[1])
+        
+        with self._lock:
+            self.cache_stats['hits' if resultat is not None else 'misses'] += 1
+        self.metrics.count('cache_hits' if resultat is not None else 'cache_misses')
+        if resultat is None:
+            return None
+        
+        self._print(f"Résultat {type_analyse} servi depuis le cache (version des données {version})")
+        return resultat
+    
+    @staticmethod
+    def _encode_parametres(parametres: Optional[dict]) -> str:
+        return json.dumps(parametres or {}, sort_keys=True)
+    
+    @staticmethod
+    def _encode_resultat(result: dict) -> tuple:
+        # Resultat ne garde que les valeurs scalaires (lisible en SQL); le résultat
+        # complet est stocké en JSON compact compressé dans Resultat_Compresse
+        resume = {cle: valeur for cle, valeur in result.items() if not isinstance(valeur, (list, dict))}
+        complet = json.dumps(result, ensure_ascii=False, separators=(',', ':'))
+        return (json.dumps(resume, ensure_ascii=False, separators=(',', ':')),
+                zlib.compress(complet.encode('utf-8')))
+    
+    @staticmethod
+    def _decode_resultat(resultat: str, resultat_compresse: Optional[bytes]) -> dict:
+        if resultat_compresse is not None:
+            return json.loads(zlib.decompress(resultat_compresse).decode('utf-8'))
+        return json.loads(resultat)
+    
+    def get_cache_stats(self) -> dict:
+        total = self.cache_stats['hits'] + self.cache_stats['misses']
+        return {
+            'hits': self.cache_stats['hits'],
+            'misses': self.cache_stats['misses'],
+            'taux_hit': round(self.cache_stats['hits'] / total, 3) if total else 0.0
+        }
+    
+    def _store_analysis_result(self, result, version: int, parametres: Optional[dict] = None):
+        if not self.persist_results:
+            return
         
         valeur_numerique = None
         if 'chiffre_affaires_total' in result:
@@ -135,51 +710,262 @@ class SalesAnalyzer:
         elif 'ca_total' in result:
             valeur_numerique = result['ca_total']
         
-        cursor.execute("""
-            INSERT INTO ANALYSE_RESULTATS 
-            (Type_Analyse, Date_Analyse, Resultat, Valeur_Numerique)
-            VALUES (?, ?, ?, ?)
-        """, (
-            result['type_analyse'],
-            result['date_analyse'],
-            json.dumps(result, ensure_ascii=False),
-            valeur_numerique
-        ))
+        resume, compresse = self._encode_resultat(result)
+        with self._lock:
+            self._pending_results.append((
+                result['type_analyse'],
+                result['date_analyse'],
+                resume,
+                valeur_numerique,
+                compresse,
+                version,
+                self._encode_parametres(parametres)
+            ))
+            differe = self._batching > 0
+        
+        if not differe:
+            self.flush_results()
+    
+    @contextmanager
+    def batch_results(self):
+        # Les résultats produits dans le bloc sont écrits en une fois, avec un seul commit, à la
+        # sortie du dernier bloc ouvert
+        with self._lock:
+            self._batching += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batching -= 1
+                dernier = self._batching == 0
+            if dernier:
+                self.flush_results()
+    
+    def store_results(self, resultats: list, version: int):
+        # Résultats calculés hors des méthodes d'analyse (rafraîchissement incrémental):
+        # [(résultat, paramètres)], servis ensuite depuis le cache pour cette version
+        with self.batch_results():
+            for result, parametres in resultats:
+                self._store_analysis_result(result, version, parametres)
+    
+    @instrumented('ecriture_resultats')
+    def flush_results(self):
+        with self._lock:
+            resultats, self._pending_results = self._pending_results, []
+        if not resultats:
+            return
+        
+        # Les résultats ne sont qu'un cache: ils n'attendent pas l'écrivain (import ou chargement
+        # massif en cours, ici ou dans un autre processus). Différés, ils restent servis depuis la
+        # mémoire et sont écrits au prochain flush
+        with self.db_manager.try_writer() as connection:
+            if connection is not None:
+                connection.execute(f"PRAGMA busy_timeout = {RESULTS_BUSY_TIMEOUT_MS}")
+                try:
+                    connection.executemany("""
+                        INSERT INTO ANALYSE_RESULTATS 
+                        (Type_Analyse, Date_Analyse, Resultat, Valeur_Numerique, Resultat_Compresse, 
+                         Version_Donnees, Parametres)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, resultats)
+                    self.db_manager.commit()
+                    return
+                except sqlite3.OperationalError as e:
+                    print(f"Écriture des résultats d'analyse différée: {e}")
+                    self.db_manager.rollback()
+                finally:
+                    connection.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT * 1000}")
+        
+        with self._lock:
+            self._pending_results = (resultats + self._pending_results)[-MAX_PENDING_RESULTS:]
+        self.metrics.count('resultats_differes', len(resultats))
+    
+    @instrumented('analyses')
+    def run_analyses(self, analyses: Optional[dict] = None, max_workers: Optional[int] = None) -> dict:
+        # Analyses indépendantes exécutées en parallèle, chacune sur une connexion du pool
+        # de lecture (sqlite3 libère le GIL pendant les requêtes); résultats écrits en un lot
+        if analyses is None:
+            analyses = {
+                'chiffre_affaires': (self.get_chiffre_affaires_total, {}),
+                'ventes_produit': (self.get_ventes_par_produit, {}),
+                'ventes_region': (self.get_ventes_par_region, {}),
+                'evolution_mensuelle': (self.get_evolution_ventes, {'granularite': 'mois'}),
+                'top_magasins': (self.get_top_magasins, {}),
+                'stocks_ventes': (self.get_stocks_vs_ventes, {}),
+                'synthese': (self.generate_summary_report, {})
+            }
+        
+        max_workers = max_workers or self.max_workers
+        self._print(f"Exécution de {len(analyses)} analyses ({max_workers} en parallèle)...")
+        
+        with self.batch_results():
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {nom: executor.submit(self.metrics.propagate(methode), **kwargs)
+                           for nom, (methode, kwargs) in analyses.items()}
+                return {nom: future.result() for nom, future in futures.items()}
+    
+    @instrumented('retention_analyses')
+    def purge_analysis_results(self, horaire_jours: int = DEFAULT_RETENTION['horaire_jours'],
+                               max_jours: Optional[int] = DEFAULT_RETENTION['max_jours']) -> int:
+        self._print("Application de la politique de rétention des analyses...")
+        
+        maintenant = datetime.now()
+        limite_horaire = (maintenant - timedelta(days=horaire_jours)).strftime('%Y-%m-%d %H:%M:%S')
+        supprimes = 0
         
-        self.db_manager.connection.commit()
+        with self.db_manager.writer() as connection:
+            cursor = connection.cursor()
+            
+            if max_jours is not None:
+                limite_max = (maintenant - timedelta(days=max_jours)).strftime('%Y-%m-%d %H:%M:%S')
+                cursor.execute("DELETE FROM ANALYSE_RESULTATS WHERE Date_Analyse < ?", (limite_max,))
+                supprimes += cursor.rowcount
+            
+            # Garde le dernier résultat de chaque heure (récent) ou de chaque jour (ancien)
+            for condition, longueur_periode in (("Date_Analyse >= ?", 13), ("Date_Analyse < ?", 10)):
+                cursor.execute(f"""
+                    DELETE FROM ANALYSE_RESULTATS
+                    WHERE {condition} AND ID_Analyse NOT IN (
+                        SELECT MAX(ID_Analyse) FROM ANALYSE_RESULTATS
+                        WHERE {condition}
+                        GROUP BY Type_Analyse, Parametres, substr(Date_Analyse, 1, {longueur_periode})
+                    )
+                """, (limite_horaire, limite_horaire))
+                supprimes += cursor.rowcount
+            
+            self.db_manager.commit()
+        self._print(f"{supprimes} résultats d'analyse supprimés")
+        return supprimes
+    
+    def get_analysis_history(self, type_analyse: str, date_debut: Optional[str] = None,
+                             date_fin: Optional[str] = None) -> list:
+        # Servi par l'index couvrant idx_analyse_historique
+        with self.db_manager.reader() as connection:
+            cursor = connection.execute("""
+                SELECT Date_Analyse, Valeur_Numerique FROM ANALYSE_RESULTATS
+                WHERE Type_Analyse = ? AND Date_Analyse >= ? AND Date_Analyse <= ?
+                ORDER BY Date_Analyse
+            """, (type_analyse, date_debut or '', date_fin or '9999'))
+            return [{'date_analyse': row[0], 'valeur': row[1]} for row in cursor.fetchall()]
     
-    def generate_summary_report(self):
-        print("Génération du rapport de synthèse...")
+    @instrumented('analyse_synthese')
+    def generate_summary_report(self, top_n: int = 5, date_debut: Optional[str] = None,
+                                date_fin: Optional[str] = None):
+        self._print("Génération du rapport de synthèse...")
         
-        ca_total = self.get_chiffre_affaires_total()
-        ventes_produits = self.get_ventes_par_produit()
-        ventes_regions = self.get_ventes_par_region()
+        parametres = {'top_n': top_n, **(self._period_parameters(date_debut, date_fin) or {})}
+        with self.db_manager.reader() as connection:
+            version = self.db_manager.get_data_version(connection)
+            synthese = self._get_cached_result(connection, version, 'SYNTHESE', parametres)
+            if synthese is None:
+                synthese = self._compute_summary(connection, top_n, date_debut, date_fin)
+                self._store_analysis_result(synthese, version, parametres)
         
-        produit_top = max(ventes_produits['produits'], key=lambda x: x['ca_produit'])
-        region_top = max(ventes_regions['regions'], key=lambda x: x['ca_region'])
+        produit_top = synthese['top_produits'][0] if synthese['top_produits'] else {}
+        region_top = synthese['top_regions'][0] if synthese['top_regions'] else {}
         
+        # date_generation: ce rapport; date_calcul: la synthèse, qui peut venir du cache
         summary = {
             'date_generation': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'chiffre_affaires_total': ca_total['chiffre_affaires_total'],
-            'nombre_ventes_total': ca_total['nombre_ventes'],
+            'date_calcul': synthese['date_analyse'],
+            'chiffre_affaires_total': synthese['chiffre_affaires_total'],
+            'nombre_ventes_total': synthese['nombre_ventes'],
             'produit_top': {
-                'nom': produit_top['nom'],
-                'reference': produit_top['reference'],
-                'ca': produit_top['ca_produit']
+                'nom': produit_top.get('nom'),
+                'reference': produit_top.get('reference'),
+                'ca': produit_top.get('ca_produit')
             },
             'region_top': {
-                'nom': region_top['region'],
-                'ca': region_top['ca_region'],
-                'magasins': region_top['nombre_magasins']
+                'nom': region_top.get('region'),
+                'ca': region_top.get('ca_region'),
+                'magasins': region_top.get('nombre_magasins')
             },
             'periode_analyse': {
-                'debut': ca_total['periode_debut'],
-                'fin': ca_total['periode_fin']
+                'debut': synthese['periode_debut'],
+                'fin': synthese['periode_fin']
             }
         }
         
-        print("Rapport de synthèse généré")
+        self._print("Rapport de synthèse généré")
         return summary
+    
+    def _compute_summary(self, connection: sqlite3.Connection, top_n: int, date_debut: Optional[str] = None,
+                         date_fin: Optional[str] = None) -> dict:
+        # Un seul parcours de l'agrégat, groupé par (produit, magasin); les totaux, la période
+        # et les cumuls par produit et par région sont ensuite consolidés en Python
+        cursor = connection.cursor()
+        
+        cursor.execute("SELECT ID_Reference, Nom, Prix FROM PRODUIT")
+        produits = {row[0]: {'reference': row[0], 'nom': row[1], 'prix_unitaire': row[2],
+                             'quantite_totale': 0, 'ca_produit': 0.0, 'nombre_ventes': 0}
+                    for row in cursor.fetchall()}
+        
+        cursor.execute("SELECT ID_Magasin, Region FROM MAGASIN")
+        region_par_magasin = dict(cursor.fetchall())
+        regions = {}
+        for id_magasin, region in region_par_magasin.items():
+            cumul = regions.setdefault(region, {'region': region, 'nombre_magasins': 0, 'ca_region': 0.0,
+                                                'nombre_ventes': 0, 'quantite_totale': 0})
+            cumul['nombre_magasins'] += 1
+        
+        ca_total = 0.0
+        nombre_ventes = 0
+        periode_debut = None
+        periode_fin = None
+        
+        where, valeurs = self._cube_filter(date_debut, date_fin)
+        self._execute(cursor, 'SYNTHESE', f"""
+            SELECT 
+                ID_Reference_Produit,
+                ID_Magasin,
+                SUM(Quantite_Totale),
+                SUM(Montant_Total),
+                SUM(Nombre_Ventes),
+                MIN(Date),
+                MAX(Date)
+            FROM VENTE_AGREGAT_JOUR
+            {where}
+            GROUP BY ID_Reference_Produit, ID_Magasin
+        """, valeurs)
+        
+        for reference, id_magasin, quantite, montant, ventes, debut, fin in cursor:
+            ca_total += montant
+            nombre_ventes += ventes
+            if periode_debut is None or debut < periode_debut:
+                periode_debut = debut
+            if periode_fin is None or fin > periode_fin:
+                periode_fin = fin
+            
+            produit = produits.get(reference)
+            if produit is not None:
+                produit['quantite_totale'] += quantite
+                produit['ca_produit'] += montant
+                produit['nombre_ventes'] += ventes
+            
+            region = region_par_magasin.get(id_magasin)
+            if region is not None:
+                cumul = regions[region]
+                cumul['ca_region'] += montant
+                cumul['nombre_ventes'] += ventes
+                cumul['quantite_totale'] += quantite
+        
+        for produit in produits.values():
+            produit['ca_produit'] = round(produit['ca_produit'], 2)
+        for cumul in regions.values():
+            cumul['ca_region'] = round(cumul['ca_region'], 2)
+        
+        return {
+            'type_analyse': 'SYNTHESE',
+            'date_analyse': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'chiffre_affaires_total': round(ca_total, 2),
+            'nombre_ventes': nombre_ventes,
+            'periode_debut': periode_debut,
+            'periode_fin': periode_fin,
+            'nombre_produits': len(produits),
+            'nombre_regions': len(regions),
+            'top_produits': heapq.nlargest(top_n, produits.values(), key=lambda x: x['ca_produit']),
+            'top_regions': heapq.nlargest(top_n, regions.values(), key=lambda x: x['ca_region'])
+        }
 
 if __name__ == "__main__":
     print("Début de l'analyse des ventes...")
@@ -188,6 +974,7 @@ if __name__ == "__main__":
     
     try:
         db_manager.connect()
+        db_manager.create_tables()
         
         analyzer = SalesAnalyzer(db_manager)
         summary = analyzer.generate_summary_report()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+from database import DatabaseManager
+from analysis import SalesAnalyzer, BACKENDS
+from metrics import MetricsRecorder
+
+def _date(valeur: str) -> str:
+    if len(valeur) != 10:
+        raise ValueError
+    date.fromisoformat(valeur)
+    return valeur
+
+def _entier_positif(valeur: str) -> int:
+    entier = int(valeur)
+    if entier < 1:
+        raise ValueError
+    return entier
+
+def _quantiles(valeur: str) -> tuple:
+    quantiles = tuple(float(quantile) for quantile in valeur.split(','))
+    if not all(0 < quantile < 1 for quantile in quantiles):
+        raise ValueError
+    return quantiles
+
+# Paramètres d'URL: nom -> conversion (ValueError: réponse 400)
+QUERY_PARAMETERS = {
+    'date_debut': _date,
+    'date_fin': _date,
+    'top': _entier_positif,
+    'granularite': str,
+    'magasin': int,
+    'region': str,
+    'quantiles': _quantiles
+}
+
+# Chemin -> (méthode de SalesAnalyzer, {paramètre d'URL: argument de la méthode})
+PERIODE = {'date_debut': 'date_debut', 'date_fin': 'date_fin'}
+ENDPOINTS = {
+    '/api/chiffre-affaires': ('get_chiffre_affaires_total', PERIODE),
+    '/api/ventes-produit': ('get_ventes_par_produit', PERIODE),
+    '/api/ventes-region': ('get_ventes_par_region', PERIODE),
+    '/api/evolution': ('get_evolution_ventes', {**PERIODE, 'granularite': 'granularite', 'magasin': 'id_magasin',
+                                               'region': 'region'}),
+    '/api/top-magasins': ('get_top_magasins', {**PERIODE, 'region': 'region', 'top': 'limit'}),
+    '/api/stocks': ('get_stocks_vs_ventes', {**PERIODE, 'magasin': 'id_magasin', 'region': 'region',
+                                            'top': 'limit'}),
+    '/api/top-ventes': ('get_top_ventes', {**PERIODE, 'magasin': 'id_magasin', 'region': 'region', 'top': 'limit'}),
+    '/api/synthese': ('generate_summary_report', {**PERIODE, 'top': 'top_n'}),
+    '/api/actifs-approx': ('get_actifs_approx', {**PERIODE, 'granularite': 'granularite'}),
+    '/api/top-produits-approx': ('get_top_produits_approx', {**PERIODE, 'top': 'limit'}),
+    '/api/quantiles-montant-approx': ('get_quantiles_montant_approx', {**PERIODE, 'quantiles': 'quantiles'})
+}
+
+# Intervalle d'écriture (puis remise à zéro) du relevé de métriques, en secondes
+METRICS_INTERVAL = 3600
+
+class ResponseCache:
+    # Réponses JSON encodées (corps, ETag) les plus récemment demandées, valables pour une seule
+    # version des données: un changement de version vide le cache
+    
+    def __init__(self, capacity: int = 256):
+        self.capacity = capacity
+        self.version = None
+        self.entrees = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        self._lock = threading.Lock()
+    
+    def get(self, version: int, cle: tuple, compter: bool = True) -> Optional[tuple]:
+        with self._lock:
+            if version != self.version:
+                if self.entrees:
+                    self.stats['invalidations'] += 1
+                self.entrees.clear()
+                self.version = version
+            entree = self.entrees.get(cle)
+            if entree is not None:
+                self.entrees.move_to_end(cle)
+            if compter:
+                self.stats['hits' if entree is not None else 'misses'] += 1
+            return entree
+    
+    def put(self, version: int, cle: tuple, entree: tuple):
+        with self._lock:
+            if version != self.version:
+                return
+            self.entrees[cle] = entree
+            self.entrees.move_to_end(cle)
+            while len(self.entrees) > self.capacity:
+                self.entrees.popitem(last=False)
+    
+    def to_dict(self) -> dict:
+        with self._lock:
+            total = self.stats['hits'] + self.stats['misses']
+            return {
+                'version_donnees': self.version,
+                'entrees': len(self.entrees),
+                'capacite': self.capacity,
+                **self.stats,
+                'taux_hit': round(self.stats['hits'] / total, 3) if total else 0.0
+            }
+
+class AnalysisAPI:
+    # Analyses de SalesAnalyzer servies en JSON: chaque requête lit la version des données sur une
+    # connexion du pool de lecture, puis la réponse est prise dans le cache ou calculée une seule
+    # fois même si plusieurs requêtes identiques arrivent en même temps
+    
+    def __init__(self, db_manager: DatabaseManager, analyzer: SalesAnalyzer, cache_size: int = 256,
+                 metrics_dir: Optional[str] = None):
+        self.db_manager = db_manager
+        self.analyzer = analyzer
+        self.cache = ResponseCache(cache_size)
+        self.metrics_dir = metrics_dir
+        self.derniere_maintenance = time.monotonic()
+        self._calculs = {}
+        self._calculs_lock = threading.Lock()
+    
+    def handle(self, url: str, if_none_match: Optional[str] = None) -> tuple:
+        # (statut HTTP, ETag ou None, corps JSON encodé)
+        decoupe = urlsplit(url)
+        chemin = decoupe.path.rstrip('/') or '/'
+        if chemin == '/api/statut':
+            return 200, None, self._encode(self.status())
+        
+        endpoint = ENDPOINTS.get(chemin)
+        if endpoint is None:
+            return 404, None, self._encode({'erreur': f"Chemin inconnu: {chemin}",
+                                            'chemins': sorted(ENDPOINTS) + ['/api/statut']})
+        methode, arguments = endpoint
+        
+        try:
+            kwargs = self._parse_query(decoupe.query, arguments)
+        except ValueError as e:
+            return 400, None, self._encode({'erreur': str(e)})
+        
+        with self.db_manager.reader() as connection:
+            version = self.db_manager.get_data_version(connection)
+        cle = (chemin, tuple(sorted(kwargs.items())))
+        
+        entree = self.cache.get(version, cle)
+        if entree is None:
+            try:
+                entree = self._compute(version, cle, methode, kwargs)
+            except ValueError as e:
+                return 400, None, self._encode({'erreur': str(e)})
+        
+        corps, etag = entree
+        if if_none_match is not None and etag in (valeur.strip() for valeur in if_none_match.split(',')):
+            return 304, etag, b''
+        return 200, etag, corps
+    
+    def _parse_query(self, query: str, arguments: dict) -> dict:
+        kwargs = {}
+        for nom, valeurs in parse_qs(query, keep_blank_values=True).items():
+            if nom not in arguments:
+                attendus = ', '.join(arguments) or 'aucun'
+                raise ValueError(f"Paramètre inconnu: {nom} (attendu: {attendus})")
+            try:
+                kwargs[arguments[nom]] = QUERY_PARAMETERS[nom](valeurs[-1])
+            except ValueError:
+                raise ValueError(f"Valeur invalide pour {nom}: {valeurs[-1]}")
+        return kwargs
+    
+    def _compute(self, version: int, cle: tuple, methode: str, kwargs: dict) -> tuple:
+        # Un verrou par requête distincte: les requêtes identiques concurrentes attendent le premier calcul
+        with self._calculs_lock:
+            verrou = self._calculs.setdefault(cle, threading.Lock())
+        try:
+            with verrou:
+                entree = self.cache.get(version, cle, compter=False)
+                if entree is not None:
+                    return entree
+                
+                corps = self._encode(getattr(self.analyzer, methode)(**kwargs))
+                entree = (corps, f'"{hashlib.sha1(corps).hexdigest()[:20]}"')
+                # L'analyse lit ses propres instantanés: si un import a changé la version depuis
+                # sa lecture, la réponse peut venir des nouvelles données et n'est pas gardée
+                # sous l'ancienne version
+                with self.db_manager.reader() as connection:
+                    if self.db_manager.get_data_version(connection) == version:
+                        self.cache.put(version, cle, entree)
+                return entree
+        finally:
+            with self._calculs_lock:
+                self._calculs.pop(cle, None)
+    
+    def maintenance(self):
+        # Processus de longue durée: relevé écrit périodiquement puis remis à zéro, comme le démon
+        self.derniere_maintenance = time.monotonic()
+        metrics = self.db_manager.metrics
+        if self.metrics_dir:
+            try:
+                print(f"Métriques d'exécution écrites dans {metrics.write_json(self.metrics_dir)}")
+            except OSError as e:
+                print(f"Impossible d'écrire les métriques d'exécution: {e}")
+        metrics.reset()
+    
+    def status(self) -> dict:
+        return {'cache_reponses': self.cache.to_dict(), 'cache_analyses': self.analyzer.get_cache_stats()}
+    
+    @staticmethod
+    def _encode(resultat: dict) -> bytes:
+        return json.dumps(resultat, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+class APIRequestHandler(BaseHTTPRequestHandler):
+    # Connexions keep-alive: chaque réponse porte sa longueur
+    protocol_version = 'HTTP/1.1'
+    
+    def do_GET(self):
+        self._respond(with_body=True)
+    
+    def do_HEAD(self):
+        self._respond(with_body=False)
+    
+    def _respond(self, with_body: bool):
+        try:
+            statut, etag, corps = self.server.api.handle(self.path, self.headers.get('If-None-Match'))
+        except Exception as e:
+            print(f"Erreur lors du traitement de {self.path}: {e}")
+            statut, etag, corps = 500, None, AnalysisAPI._encode({'erreur': str(e)})
+        
+        self.send_response(statut)
+        if etag is not None:
+            self.send_header('ETag', etag)
+            # Le client garde la réponse mais la revalide (304) à chaque utilisation
+            self.send_header('Cache-Control', 'no-cache')
+        if statut != 304:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(corps)))
+        self.end_headers()
+        if with_body and statut != 304:
+            self.wfile.write(corps)
+    
+    def log_message(self, format, *args):
+        # Pas de journal par requête: les erreurs sont affichées par _respond
+        pass
+
+class APIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # File d'attente des connexions pour les rafales de requêtes des tableaux de bord
+    request_queue_size = 128
+    
+    def __init__(self, address: tuple, api: AnalysisAPI):
+        super().__init__(address, APIRequestHandler)
+        self.api = api
+    
+    def service_actions(self):
+        # Appelé par serve_forever entre deux attentes de connexion, dans le thread principal
+        if time.monotonic() - self.api.derniere_maintenance >= METRICS_INTERVAL:
+            self.api.maintenance()
+
+if __name__ == "__main__":
+    host = os.getenv('API_HOST', 'localhost')
+    port = int(os.getenv('API_PORT', '8080'))
+    
+    # Lecture seule: le schéma et les données sont créés par main.py et daemon.py
+    db_manager = DatabaseManager(pool_size=int(os.getenv('API_READERS', '8')), metrics=MetricsRecorder(),
+                                 read_only=True)
+    try:
+        db_manager.connect()
+        db_manager.check_schema()
+        
+        backend = os.getenv('ANALYSES_BACKEND', 'sql').lower()
+        if backend not in BACKENDS:
+            print(f"ANALYSES_BACKEND inconnu: {backend}, utilisation de sql")
+            backend = 'sql'
+        # Les réponses sont gardées par le cache de l'API: les analyses calculées ici n'écrivent pas
+        # dans ANALYSE_RESULTATS, qui reste alimenté par les imports et le démon; pas de messages
+        # de progression par requête
+        analyzer = SalesAnalyzer(db_manager, backend=backend, persist_results=False, verbose=False)
+        api = AnalysisAPI(db_manager, analyzer,
+                          cache_size=int(os.getenv('API_CACHE_SIZE', '256')),
+                          metrics_dir=os.getenv('METRICS_DIR', os.path.join('data', 'metrics')))
+        
+        server = APIServer((host, port), api)
+        # docker stop: SIGTERM interrompt serve_forever comme Ctrl+C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        print(f"API des analyses démarrée sur http://{host}:{port} ({', '.join(sorted(ENDPOINTS))}, /api/statut)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Arrêt de l'API")
+        finally:
+            server.server_close()
+            # Relevé de la dernière période
+            api.maintenance()
+    
+    except Exception as e:
+        print(f"Erreur de l'API des analyses: {e}")
+        sys.exit(1)
+    finally:
+        db_manager.close()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from database import DatabaseManager
+from import_data import DataImporter
+from analysis import SalesAnalyzer
+from generate_data import generate_dataset, DEFAULT_OUTPUT_DIR
+from metrics import peak_rss_mb
+
+DEFAULT_RESULTS_DIR = os.path.join('results', 'benchmarks')
+
+# Variation relative au-delà de laquelle une mesure est signalée comme régression
+REGRESSION_THRESHOLD = 0.2
+
+# Durées (secondes) trop courtes pour être comparées de façon fiable
+MIN_COMPARED_DURATION = 0.005
+
+# Analyses mesurées: nom -> (méthode de SalesAnalyzer, paramètres)
+ANALYSES = {
+    'chiffre_affaires': ('get_chiffre_affaires_total', {}),
+    'ventes_produit': ('get_ventes_par_produit', {}),
+    'ventes_region': ('get_ventes_par_region', {}),
+    'evolution_jour': ('get_evolution_ventes', {}),
+    'evolution_mois': ('get_evolution_ventes', {'granularite': 'mois'}),
+    'top_magasins': ('get_top_magasins', {}),
+    'stocks_ventes': ('get_stocks_vs_ventes', {}),
+    'top_ventes': ('get_top_ventes', {}),
+    'synthese': ('generate_summary_report', {})
+}
+
+def _count_data_lines(csv_file: str) -> int:
+    with open(csv_file, 'rb') as f:
+        return max(0, sum(bloc.count(b'\n') for bloc in iter(lambda: f.read(1 << 20), b'')) - 1)
+
+def _measure_import(etapes: dict, nom: str, csv_file: str, importer_fonction):
+    lignes = _count_data_lines(csv_file)
+    debut = time.perf_counter()
+    importer_fonction()
+    duree = time.perf_counter() - debut
+    etapes[nom] = {
+        'duree': round(duree, 4),
+        'lignes': lignes,
+        'lignes_par_seconde': round(lignes / duree, 1) if duree > 0 else None,
+        'octets': os.path.getsize(csv_file),
+        'rss_pic_mo': peak_rss_mb()
+    }
+
+def measure_cold_start(repetitions: int = 3) -> dict:
+    # Démarrage d'un nouvel interpréteur jusqu'au chargement de main.py (modules importés
+    # compris), comparé à un interpréteur vide; le minimum écarte les perturbations
+    dossier_scripts = os.path.dirname(os.path.abspath(__file__))
+    durees = {}
+    for nom, code in (('interpreteur', 'pass'), ('main', 'import main')):
+        mesures = []
+        for _ in range(repetitions):
+            debut = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], cwd=dossier_scripts, check=True)
+            mesures.append(time.perf_counter() - debut)
+        durees[nom] = min(mesures)
+    return {
+        'duree': round(durees['main'], 4),
+        'duree_imports': round(durees['main'] - durees['interpreteur'], 4),
+        'rss_pic_mo': peak_rss_mb()
+    }
+
+def run_benchmark(dataset_dir: str, db_path: str, chunksize: int = 100000, bulk_load: bool = True,
+                  pipeline: bool = False, backend: str = 'sql', partitioned: bool = False,
+                  repetitions: int = 3, csv_backend: str = 'pandas') -> dict:
+    db_manager = DatabaseManager(db_path, partitioned=partitioned)
+    etapes = {}
+    
+    try:
+        debut = time.perf_counter()
+        db_manager.connect()
+        db_manager.create_tables()
+        etapes['initialisation'] = {'duree': round(time.perf_counter() - debut, 4), 'rss_pic_mo': peak_rss_mb()}
+        
+        importer = DataImporter(db_manager, csv_backend=csv_backend)
+        fichiers = {nom: os.path.join(dataset_dir, f"{nom}.csv") for nom in ('magasins', 'produits', 'ventes')}
+        
+        debut = time.perf_counter()
+        with db_manager.bulk_load() if bulk_load else nullcontext():
+            _measure_import(etapes, 'import_magasins', fichiers['magasins'],
+                            lambda: importer.import_magasins(fichiers['magasins']))
+            _measure_import(etapes, 'import_produits', fichiers['produits'],
+                            lambda: importer.import_produits(fichiers['produits']))
+            if pipeline:
+                _measure_import(etapes, 'import_ventes', fichiers['ventes'],
+                                lambda: importer.import_ventes_pipeline(fichiers['ventes'], batch_size=chunksize,
+                                                                        final=True))
+            else:
+                _measure_import(etapes, 'import_ventes', fichiers['ventes'],
+                                lambda: importer.import_ventes(fichiers['ventes'], chunksize=chunksize, final=True))
+        # Inclut la reconstruction des index et ANALYZE en mode chargement massif
+        etapes['import_total'] = {'duree': round(time.perf_counter() - debut, 4), 'rss_pic_mo': peak_rss_mb()}
+        etapes['import_ventes']['ventes_stockees'] = db_manager.get_table_count('VENTE')
+        
+        analyses = {}
+        for nom, (methode, kwargs) in ANALYSES.items():
+            # À froid: sans cache, répété; à chaud: servi depuis ANALYSE_RESULTATS
+            froid = SalesAnalyzer(db_manager, use_cache=False, backend=backend)
+            latences = []
+            for _ in range(repetitions):
+                debut = time.perf_counter()
+                getattr(froid, methode)(**kwargs)
+                latences.append(time.perf_counter() - debut)
+            
+            chaud = SalesAnalyzer(db_manager, backend=backend)
+            getattr(chaud, methode)(**kwargs)
+            debut = time.perf_counter()
+            getattr(chaud, methode)(**kwargs)
+            latence_cache = time.perf_counter() - debut
+            
+            analyses[nom] = {
+                'latence_min': round(min(latences), 5),
+                'latence_mediane': round(statistics.median(latences), 5),
+                'latence_max': round(max(latences), 5),
+                'latence_cache': round(latence_cache, 5),
+                'rss_pic_mo': peak_rss_mb()
+            }
+        
+        return {'etapes': etapes, 'analyses': analyses, 'taille_base_octets': os.path.getsize(db_path)}
+    
+    finally:
+        db_manager.close()
+
+def _metrics(resultat: dict) -> dict:
+    # Mesures comparées d'une exécution à l'autre: (valeur, True si plus grand = mieux)
+    mesures = {}
+    for nom, etape in resultat['etapes'].items():
+        if etape['duree'] < MIN_COMPARED_DURATION:
+            continue
+        if etape.get('lignes_par_seconde'):
+            mesures[f"etapes.{nom}.lignes_par_seconde"] = (etape['lignes_par_seconde'], True)
+        mesures[f"etapes.{nom}.duree"] = (etape['duree'], False)
+    for nom, analyse in resultat['analyses'].items():
+        if analyse['latence_mediane'] >= MIN_COMPARED_DURATION:
+            mesures[f"analyses.{nom}.latence_mediane"] = (analyse['latence_mediane'], False)
+    mesures['rss_pic_mo'] = (resultat['rss_pic_mo'], False)
+    return mesures
+
+def compare_with_previous(resultat: dict, results_dir: str, seuil: float = REGRESSION_THRESHOLD) -> dict:
+    # Référence: la dernière exécution enregistrée sur le même jeu de données et la même configuration
+    precedent = None
+    for chemin in sorted(glob.glob(os.path.join(results_dir, 'benchmark_*.json')), reverse=True):
+        with open(chemin, encoding='utf-8') as f:
+            candidat = json.load(f)
+        if candidat.get('jeu_donnees') == resultat['jeu_donnees'] and candidat.get('config') == resultat['config']:
+            precedent = (chemin, candidat)
+            break
+    
+    if precedent is None:
+        return {'reference': None, 'regressions': [], 'ameliorations': []}
+    
+    regressions = []
+    ameliorations = []
+    anciennes = _metrics(precedent[1])
+    for nom, (valeur, plus_grand_mieux) in _metrics(resultat).items():
+        if nom not in anciennes or not anciennes[nom][0] or valeur is None:
+            continue
+        variation = (valeur - anciennes[nom][0]) / anciennes[nom][0]
+        ecart = {'mesure': nom, 'precedent': anciennes[nom][0], 'actuel': valeur, 'variation': round(variation, 3)}
+        if (variation < -seuil) if plus_grand_mieux else (variation > seuil):
+            regressions.append(ecart)
+        elif (variation > seuil) if plus_grand_mieux else (variation < -seuil):
+            ameliorations.append(ecart)
+    
+    return {'reference': os.path.basename(precedent[0]), 'regressions': regressions, 'ameliorations': ameliorations}
+
+def benchmark_scale(nombre_ventes: int, args) -> dict:
+    dataset_dir = os.path.join(args.donnees, str(nombre_ventes))
+    description = {}
+    if os.path.exists(os.path.join(dataset_dir, 'dataset.json')):
+        with open(os.path.join(dataset_dir, 'dataset.json'), encoding='utf-8') as f:
+            description = json.load(f)
+    if (description.get('ventes'), description.get('skew'), description.get('seed')) != (nombre_ventes, args.skew, args.seed):
+        generate_dataset(dataset_dir, nombre_ventes, skew=args.skew, seed=args.seed)
+    
+    config = {
+        'chunksize': args.chunksize,
+        'bulk_load': not args.sans_bulk_load,
+        'pipeline': args.pipeline,
+        'backend': args.backend,
+        'partitionne': args.partitionne,
+        'lecteur_csv': args.lecteur_csv,
+        'repetitions': args.repetitions
+    }
+    
+    dossier_base = tempfile.mkdtemp(prefix='bench_')
+    try:
+        debut = time.perf_counter()
+        mesures = run_benchmark(dataset_dir, os.path.join(dossier_base, 'ventes.db'), args.chunksize,
+                                config['bulk_load'], args.pipeline, args.backend, args.partitionne,
+                                args.repetitions, args.lecteur_csv)
+        mesures['etapes']['demarrage'] = measure_cold_start(args.repetitions)
+        duree_totale = time.perf_counter() - debut
+    finally:
+        shutil.rmtree(dossier_base, ignore_errors=True)
+    
+    resultat = {
+        'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'machine': {
+            'plateforme': platform.platform(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'cpus': os.cpu_count()
+        },
+        'jeu_donnees': {'ventes': nombre_ventes, 'skew': args.skew, 'seed': args.seed},
+        'config': config,
+        **mesures,
+        'duree_totale': round(duree_totale, 3),
+        'rss_pic_mo': peak_rss_mb()
+    }
+    resultat['comparaison'] = compare_with_previous(resultat, args.resultats, args.seuil)
+    
+    os.makedirs(args.resultats, exist_ok=True)
+    chemin = os.path.join(args.resultats, f"benchmark_{nombre_ventes}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(chemin, 'w', encoding='utf-8') as f:
+        json.dump(resultat, f, indent=2, ensure_ascii=False)
+    
+    _print_report(resultat, chemin)
+    return resultat
+
+def _print_report(resultat: dict, chemin: str):
+    print("\n" + "=" * 60)
+    print(f"BENCHMARK {resultat['jeu_donnees']['ventes']} VENTES ({resultat['duree_totale']}s)")
+    print("=" * 60)
+    for nom, etape in resultat['etapes'].items():
+        debit = f", {etape['lignes_par_seconde']:.0f} lignes/s" if etape.get('lignes_par_seconde') else ""
+        print(f"{nom:<20} {etape['duree']:>9.3f}s{debit}")
+    for nom, analyse in resultat['analyses'].items():
+        print(f"{nom:<20} {analyse['latence_mediane'] * 1000:>9.2f}ms (cache: {analyse['latence_cache'] * 1000:.2f}ms)")
+    print(f"RSS pic: {resultat['rss_pic_mo']} Mo")
+    
+    comparaison = resultat['comparaison']
+    if comparaison['reference'] is None:
+        print("Aucune exécution précédente comparable")
+    else:
+        print(f"Comparaison avec {comparaison['reference']}: {len(comparaison['regressions'])} régression(s), "
+              f"{len(comparaison['ameliorations'])} amélioration(s)")
+        for ecart in comparaison['regressions']:
+            print(f"   REGRESSION {ecart['mesure']}: {ecart['precedent']} -> {ecart['actuel']} "
+                  f"({ecart['variation']:+.0%})")
+    print(f"Résultats enregistrés dans {chemin}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mesure l'import et les analyses sur des jeux de données synthétiques")
+    parser.add_argument('--ventes', default='1e3,1e5', help="volumes à mesurer, séparés par des virgules")
+    parser.add_argument('--donnees', default=DEFAULT_OUTPUT_DIR, help="dossier des jeux de données générés")
+    parser.add_argument('--resultats', default=DEFAULT_RESULTS_DIR, help="dossier des résultats JSON")
+    parser.add_argument('--chunksize', type=int, default=100000, help="taille des lots d'import des ventes")
+    parser.add_argument('--sans-bulk-load', action='store_true', help="importer sans chargement massif")
+    parser.add_argument('--pipeline', action='store_true', help="importer les ventes en pipeline")
+    parser.add_argument('--backend', default='sql', choices=['sql', 'numpy'])
+    parser.add_argument('--partitionne', action='store_true', help="stockage des ventes partitionné par mois")
+    parser.add_argument('--lecteur-csv', default='pandas', choices=['pandas', 'csv'], help="lecture des CSV importés")
+    parser.add_argument('--repetitions', type=int, default=3, help="exécutions à froid de chaque analyse")
+    parser.add_argument('--skew', type=float, default=1.1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--seuil', type=float, default=REGRESSION_THRESHOLD, help="variation signalée comme régression")
+    args = parser.parse_args()
+    
+    volumes = [int(float(volume)) for volume in args.ventes.split(',')]
+    if len(volumes) > 1:
+        # Un processus par volume: le pic de mémoire (ru_maxrss) n'est pas réinitialisable
+        regressions = 0
+        for volume in volumes:
+            commande = [sys.executable, os.path.abspath(__file__), '--ventes', str(volume)]
+            arguments = iter(sys.argv[1:])
+            for argument in arguments:
+                if argument == '--ventes':
+                    next(arguments, None)
+                elif not argument.startswith('--ventes='):
+                    commande.append(argument)
+            regressions += subprocess.run(commande).returncode
+        sys.exit(1 if regressions else 0)
+    
+    resultat = benchmark_scale(volumes[0], args)
+    sys.exit(1 if resultat['comparaison']['regressions'] else 0)
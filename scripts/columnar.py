@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+import sqlite3
+import threading
+import numpy as np
+from typing import Optional
+from database import DatabaseManager
+
+# Lignes de VENTE lues par lot lors du chargement en colonnes
+LOAD_BATCH_SIZE = 100000
+
+# Écart toléré sur les montants entre les deux moteurs (arrondi au centime)
+MONTANT_TOLERANCE = 0.01
+
+class ColumnarStore:
+    # Copie de VENTE en colonnes NumPy, triée par date: les produits et magasins sont
+    # encodés en entiers denses, les dates en numéros de jour depuis 1970-01-01
+    
+    def __init__(self, db_manager: DatabaseManager, verbose: bool = True):
+        self.db_manager = db_manager
+        self.verbose = verbose
+        self.version = None
+        self._lock = threading.Lock()
+    
+    def refresh(self, connection: sqlite3.Connection, version: int) -> 'ColumnarStore':
+        # Rechargé seulement quand la version des données a changé depuis le dernier chargement
+        with self._lock:
+            if self.version != version:
+                self._load(connection)
+                self.version = version
+        return self
+    
+    def _load(self, connection: sqlite3.Connection):
+        if self.verbose:
+            print("Chargement de VENTE en colonnes...")
+        cursor = connection.cursor()
+        
+        cursor.execute("SELECT ID_Reference, Nom, Prix FROM PRODUIT ORDER BY ID_Reference")
+        self.produits = cursor.fetchall()
+        codes_produits = {row[0]: code for code, row in enumerate(self.produits)}
+        
+        cursor.execute("SELECT ID_Magasin, Region FROM MAGASIN ORDER BY ID_Magasin")
+        magasins = cursor.fetchall()
+        codes_magasins = {row[0]: code for code, row in enumerate(magasins)}
+        self.magasin_ids = np.array([row[0] for row in magasins], dtype=np.int64)
+        self.regions, magasin_regions = np.unique(np.array([row[1] for row in magasins], dtype=object),
+                                                  return_inverse=True)
+        self.magasin_regions = magasin_regions.astype(np.int32)
+        
+        # Les ventes dont le produit ou le magasin est absent des référentiels reçoivent
+        # le code hors dictionnaire (len), ignoré par les jointures comme en SQL
+        produit_inconnu = len(self.produits)
+        magasin_inconnu = len(magasins)
+        
+        lots = {'jour': [], 'produit': [], 'magasin': [], 'quantite': [], 'montant': []}
+        cursor.execute(f"""
+            SELECT CAST(julianday(Date) - 2440587.5 AS INTEGER), ID_Reference_Produit, ID_Magasin,
+                   Quantite, Montant_Total
+            FROM {self.db_manager.vente_source()}
+        """)
+        while True:
+            rows = cursor.fetchmany(LOAD_BATCH_SIZE)
+            if not rows:
+                break
+            jours, produits, magasins_vente, quantites, montants = zip(*rows)
+            lots['jour'].append(np.array(jours, dtype=np.int32))
+            lots['produit'].append(np.fromiter(
+                (codes_produits.get(reference, produit_inconnu) for reference in produits),
+                dtype=np.int32, count=len(rows)))
+            lots['magasin'].append(np.fromiter(
+                (codes_magasins.get(id_magasin, magasin_inconnu) for id_magasin in magasins_vente),
+                dtype=np.int32, count=len(rows)))
+            lots['quantite'].append(np.array(quantites, dtype=np.int64))
+            lots['montant'].append(np.array(montants, dtype=np.float64))
+        
+        colonnes = {nom: np.concatenate(valeurs) if valeurs else np.empty(0, dtype=dtype)
+                    for (nom, valeurs), dtype in zip(lots.items(),
+                                                     (np.int32, np.int32, np.int32, np.int64, np.float64))}
+        
+        # Tri par jour: les filtres de période deviennent des tranches (searchsorted)
+        ordre = np.argsort(colonnes['jour'], kind='stable')
+        self.jour = colonnes['jour'][ordre]
+        self.produit = colonnes['produit'][ordre]
+        self.magasin = colonnes['magasin'][ordre]
+        self.quantite = colonnes['quantite'][ordre]
+        self.montant = colonnes['montant'][ordre]
+        
+        if self.verbose:
+            print(f"{len(self.jour)} ventes chargées en colonnes")
+    
+    def _period_slice(self, date_debut: Optional[str] = None, date_fin: Optional[str] = None) -> slice:
+        # Ventes triées par jour: une période est une tranche contiguë
+        debut = 0 if date_debut is None else np.searchsorted(self.jour, self._day_number(date_debut), 'left')
+        fin = len(self.jour) if date_fin is None else np.searchsorted(self.jour, self._day_number(date_fin), 'right')
+        return slice(debut, fin)
+    
+    def ventes_par_produit(self, date_debut: Optional[str] = None, date_fin: Optional[str] = None) -> list:
+        nombre_produits = len(self.produits)
+        periode = self._period_slice(date_debut, date_fin)
+        produit = self.produit[periode]
+        # minlength + troncature: le code hors dictionnaire est écarté
+        quantites = np.bincount(produit, weights=self.quantite[periode], minlength=nombre_produits + 1)
+        montants = np.bincount(produit, weights=self.montant[periode], minlength=nombre_produits + 1)
+        ventes = np.bincount(produit, minlength=nombre_produits + 1)
+        
+        produits_analysis = []
+        for code in np.argsort(-montants[:nombre_produits], kind='stable'):
+            reference, nom, prix = self.produits[code]
+            produits_analysis.append({
+                'reference': reference,
+                'nom': nom,
+                'prix_unitaire': prix,
+                'quantite_totale': int(quantites[code]),
+                'ca_produit': round(float(montants[code]), 2),
+                'nombre_ventes': int(ventes[code])
+            })
+        return produits_analysis
+    
+    def ventes_par_region(self, date_debut: Optional[str] = None, date_fin: Optional[str] = None) -> list:
+        nombre_magasins = len(self.magasin_ids)
+        nombre_regions = len(self.regions)
+        periode = self._period_slice(date_debut, date_fin)
+        
+        # Agrégation par magasin puis consolidation par région (petits tableaux)
+        par_magasin = [np.bincount(self.magasin[periode], weights=None if poids is None else poids[periode],
+                                   minlength=nombre_magasins + 1)[:nombre_magasins]
+                       for poids in (self.montant, None, self.quantite)]
+        montants, ventes, quantites = (np.bincount(self.magasin_regions, weights=valeurs, minlength=nombre_regions)
+                                       for valeurs in par_magasin)
+        magasins = np.bincount(self.magasin_regions, minlength=nombre_regions)
+        
+        regions_analysis = []
+        for code in np.argsort(-montants, kind='stable'):
+            regions_analysis.append({
+                'region': self.regions[code],
+                'nombre_magasins': int(magasins[code]),
+                'ca_region': round(float(montants[code]), 2),
+                'nombre_ventes': int(ventes[code]),
+                'quantite_totale': int(quantites[code])
+            })
+        return regions_analysis
+    
+    def evolution(self, date_debut: Optional[str] = None, date_fin: Optional[str] = None,
+                  granularite: str = 'jour', id_magasin: Optional[int] = None,
+                  region: Optional[str] = None) -> list:
+        periode = self._period_slice(date_debut, date_fin)
+        jour = self.jour[periode]
+        quantite = self.quantite[periode]
+        montant = self.montant[periode]
+        
+        if id_magasin is not None or region:
+            masque = np.ones(len(jour), dtype=bool)
+            magasin = self.magasin[periode]
+            if id_magasin is not None:
+                codes = np.flatnonzero(self.magasin_ids == id_magasin)
+                masque &= magasin == (codes[0] if len(codes) else -1)
+            if region:
+                magasins_region = np.flatnonzero(self.regions[self.magasin_regions] == region)
+                masque &= np.isin(magasin, magasins_region)
+            jour, quantite, montant = jour[masque], quantite[masque], montant[masque]
+        
+        if len(jour) == 0:
+            return []
+        
+        periode = self._period_keys(jour, granularite)
+        # Les jours étant triés, chaque période est un segment contigu: reduceat sur ses débuts
+        debuts = np.concatenate(([0], np.flatnonzero(np.diff(periode)) + 1))
+        montants = np.add.reduceat(montant, debuts)
+        quantites = np.add.reduceat(quantite, debuts)
+        ventes = np.diff(np.append(debuts, len(periode)))
+        libelles = self._period_labels(periode[debuts], granularite)
+        
+        return [{
+            'periode': libelle,
+            'nombre_ventes': int(nombre),
+            'ca_periode': round(float(ca), 2),
+            'quantite_totale': int(quantite_totale)
+        } for libelle, nombre, ca, quantite_totale in zip(libelles, ventes, montants, quantites)]
+    
+    @staticmethod
+    def _day_number(date: str) -> int:
+        return int(np.datetime64(date, 'D').astype(np.int64))
+    
+    @staticmethod
+    def _period_keys(jour: np.ndarray, granularite: str) -> np.ndarray:
+        if granularite == 'jour':
+            return jour
+        if granularite == 'semaine':
+            # 1970-01-01 est un jeudi: (jour + 3) % 7 vaut 0 le lundi
+            return jour - (jour + 3) % 7
+        if granularite == 'mois':
+            return jour.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        raise ValueError(f"Granularité inconnue: {granularite}")
+    
+    @staticmethod
+    def _period_labels(cles: np.ndarray, granularite: str) -> list:
+        unite = 'M' if granularite == 'mois' else 'D'
+        return [str(valeur) for valeur in cles.astype(f'datetime64[{unite}]')]
+
+def compare_with_sql(db_manager: DatabaseManager) -> dict:
+    # Exécute les analyses sur les deux moteurs (sans cache) et liste les écarts par analyse
+    from analysis import SalesAnalyzer
+    
+    moteurs = {backend: SalesAnalyzer(db_manager, use_cache=False, backend=backend)
+               for backend in ('sql', 'numpy')}
+    analyses = {
+        'VENTES_PRODUIT': (lambda analyzer: analyzer.get_ventes_par_produit()['produits'], 'reference'),
+        'VENTES_REGION': (lambda analyzer: analyzer.get_ventes_par_region()['regions'], 'region'),
+        'EVOLUTION_VENTES': (lambda analyzer: analyzer.get_evolution_ventes()['periodes'], 'periode'),
+        'EVOLUTION_MENSUELLE': (lambda analyzer: analyzer.get_evolution_ventes(granularite='mois')['periodes'],
+                                'periode')
+    }
+    
+    ecarts = {}
+    for type_analyse, (executer, cle) in analyses.items():
+        sql, numpy_ = (executer(moteurs[backend]) for backend in ('sql', 'numpy'))
+        lignes_sql = {ligne[cle]: ligne for ligne in sql}
+        lignes_numpy = {ligne[cle]: ligne for ligne in numpy_}
+        differences = []
+        for valeur_cle in sorted(set(lignes_sql) | set(lignes_numpy)):
+            ligne_sql = lignes_sql.get(valeur_cle)
+            ligne_numpy = lignes_numpy.get(valeur_cle)
+            if ligne_sql is None or ligne_numpy is None:
+                differences.append({'cle': valeur_cle, 'sql': ligne_sql, 'numpy': ligne_numpy})
+                continue
+            for champ, valeur in ligne_sql.items():
+                autre = ligne_numpy.get(champ)
+                if isinstance(valeur, float) or isinstance(autre, float):
+                    egal = abs((valeur or 0) - (autre or 0)) <= MONTANT_TOLERANCE
+                else:
+                    egal = valeur == autre
+                if not egal:
+                    differences.append({'cle': valeur_cle, 'champ': champ, 'sql': valeur, 'numpy': autre})
+        ecarts[type_analyse] = differences
+    return ecarts
+
+if __name__ == "__main__":
+    print("Vérification du moteur en colonnes contre SQL...")
+    
+    db_manager = DatabaseManager()
+    
+    try:
+        db_manager.connect()
+        db_manager.create_tables()
+        
+        ecarts = compare_with_sql(db_manager)
+        for type_analyse, differences in ecarts.items():
+            statut = "identique" if not differences else f"{len(differences)} écart(s)"
+            print(f"{type_analyse}: {statut}")
+            for difference in differences[:5]:
+                print(f"   {difference}")
+    
+    except Exception as e:
+        print(f"Erreur lors de la vérification: {e}")
+    finally:
+        db_manager.close()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+import os
+import signal
+import sys
+import threading
+import time
+from typing import Optional
+from database import DatabaseManager
+from import_data import DataImporter
+from analysis import SalesAnalyzer
+from incremental import IncrementalAnalyses
+from metrics import MetricsRecorder
+from http_collector import DataCollector
+
+# Fichiers de référence du dossier surveillé, importés avant les ventes; les autres *.csv sont des ventes
+REFERENCE_FILES = ('magasins.csv', 'produits.csv')
+
+# Fichiers demandés à la source HTTP (requêtes conditionnelles) et déposés dans le dossier surveillé
+HTTP_FILES = ('magasins.csv', 'produits.csv', 'ventes.csv')
+
+# Intervalle de la rétention des analyses et de l'écriture du relevé de métriques, en secondes
+MAINTENANCE_INTERVAL = 3600
+
+DEFAULT_INPUT_DIR = os.path.join('data', 'entrees')
+
+class IngestionDaemon:
+    # Surveille un dossier de CSV (et en option la source HTTP), importe les nouvelles lignes de ventes
+    # en micro-lots déclenchés par taille ou par latence, et rafraîchit les analyses standard
+    # de façon incrémentale après chaque lot
+    
+    def __init__(self, db_manager: DatabaseManager, importer: DataImporter, analyzer: SalesAnalyzer,
+                 input_dir: str = DEFAULT_INPUT_DIR, batch_size: int = 5000, max_latency: float = 2.0,
+                 poll_interval: float = 1.0, collector: Optional[DataCollector] = None,
+                 http_interval: float = 60.0, delta: bool = False, metrics_dir: Optional[str] = None,
+                 retention: Optional[dict] = None):
+        self.db_manager = db_manager
+        self.importer = importer
+        self.analyzer = analyzer
+        self.metrics = db_manager.metrics
+        self.input_dir = input_dir
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.poll_interval = poll_interval
+        # Collecte HTTP déposant les fichiers dans le dossier surveillé; l'importeur lit toujours
+        # les fichiers locaux
+        self.collector = collector
+        self.http_interval = http_interval if collector is not None else None
+        self.delta = delta
+        self.metrics_dir = metrics_dir
+        # Paramètres de purge_analysis_results: chaque micro-lot publie un jeu de résultats
+        self.retention = retention or {}
+        self.suivi = IncrementalAnalyses(analyzer)
+        
+        # Position de lecture de chaque fichier de ventes: {'signature', 'identite', 'octets', 'lignes'}
+        self.positions = {}
+        self.signatures_reference = {}
+        self.tampon = []
+        self.lignes_tampon = 0
+        self.debut_tampon = None
+        self.derniere_collecte = None
+        self.derniere_maintenance = time.monotonic()
+        self.statistiques = {'lots': 0, 'lignes': 0, 'nouvelles_ventes': 0, 'reconstructions': 0}
+        self.arret = threading.Event()
+    
+    def stop(self, *args):
+        self.arret.set()
+    
+    def run(self, max_cycles: Optional[int] = None):
+        os.makedirs(self.input_dir, exist_ok=True)
+        print(f"Surveillance de {self.input_dir}: micro-lots de {self.batch_size} lignes ou {self.max_latency}s, "
+              f"scrutation toutes les {self.poll_interval}s"
+              + (f", source HTTP toutes les {self.http_interval}s" if self.http_interval else ""))
+        self._rebuild()
+        
+        cycles = 0
+        try:
+            while not self.arret.is_set():
+                self.run_once()
+                cycles += 1
+                if max_cycles is not None and cycles >= max_cycles:
+                    break
+                self.arret.wait(self._next_wait())
+        finally:
+            # Arrêt: les dernières lignes, y compris une dernière ligne sans fin de ligne, sont lues
+            # et écrites avant de rendre la main
+            try:
+                self.scan_ventes(final=True)
+            finally:
+                self.flush()
+        
+        print(f"Arrêt de la surveillance: {self.statistiques['lots']} micro-lots, "
+              f"{self.statistiques['nouvelles_ventes']} nouvelles ventes")
+        return self.statistiques
+    
+    def run_once(self):
+        maintenant = time.monotonic()
+        if self.http_interval and (self.derniere_collecte is None
+                                   or maintenant - self.derniere_collecte >= self.http_interval):
+            self.poll_http()
+            self.derniere_collecte = maintenant
+        
+        self.import_references()
+        self.scan_ventes()
+        if self.tampon and time.monotonic() - self.debut_tampon >= self.max_latency:
+            self.flush()
+        
+        # Une autre écriture (import ponctuel, archivage) rend l'état incrémental caduc
+        if self.db_manager.get_data_version() != self.suivi.version:
+            self._rebuild()
+        
+        if time.monotonic() - self.derniere_maintenance >= MAINTENANCE_INTERVAL:
+            self.maintenance()
+    
+    def _next_wait(self) -> float:
+        # Le lot en attente est écrit dès que sa latence maximale est atteinte
+        if not self.tampon:
+            return self.poll_interval
+        restant = self.max_latency - (time.monotonic() - self.debut_tampon)
+        return max(0.0, min(self.poll_interval, restant))
+    
+    def poll_http(self):
+        for nom in HTTP_FILES:
+            self.collector.collect_file(os.path.join(self.input_dir, nom), f"{self.collector.base_url}/{nom}")
+    
+    def import_references(self):
+        for nom, methode in zip(REFERENCE_FILES, (self.importer.import_magasins, self.importer.import_produits)):
+            chemin = os.path.join(self.input_dir, nom)
+            try:
+                stat = os.stat(chemin)
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+            if self.signatures_reference.get(nom) == signature:
+                continue
+            
+            # Les ventes déjà lues sont écrites (et valorisées) avant la mise à jour des référentiels
+            self.flush()
+            methode(chemin, delta=self.delta, incremental=True)
+            self.signatures_reference[nom] = signature
+    
+    def scan_ventes(self, final: bool = False):
+        # final (arrêt de la surveillance): la dernière ligne sans fin de ligne est lue aussi
+        with os.scandir(self.input_dir) as entrees:
+            fichiers = sorted((entree for entree in entrees if entree.name.endswith('.csv')
+                               and entree.name not in REFERENCE_FILES and entree.is_file()),
+                              key=lambda entree: entree.name)
+        
+        # Fichiers suivis qui ont disparu de leur chemin: peut-être renommés dans le dossier surveillé
+        chemins = {entree.path for entree in fichiers}
+        disparus = {position['identite']: chemin for chemin, position in self.positions.items()
+                    if chemin not in chemins}
+        
+        for entree in fichiers:
+            try:
+                stat = entree.stat()
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            identite = (stat.st_dev, stat.st_ino)
+            termine = final
+            renomme = False
+            if entree.path not in self.positions and identite in disparus:
+                # Renommé: l'écriture du fichier est terminée; la lecture continue à sa position,
+                # enregistrée sous le nouveau chemin
+                ancien = disparus.pop(identite)
+                if any(resultat['fichier'] == ancien for resultat in self.tampon):
+                    self.flush()
+                position = self.positions.pop(ancien, None)
+                if position is not None:
+                    self.positions[entree.path] = position
+                    termine = renomme = True
+            
+            position = self.positions.get(entree.path)
+            if position is not None and position['signature'] == signature and not termine:
+                continue
+            
+            if position is None or position['identite'] != identite or stat.st_size < position['octets']:
+                # Fichier nouveau, remplacé ou tronqué: reprise depuis l'état validé en base,
+                # après écriture des lignes de ce fichier encore en attente
+                if any(resultat['fichier'] == entree.path for resultat in self.tampon):
+                    self.flush()
+                octets, lignes = self.importer.resume_position(entree.path)
+                position = self.positions[entree.path] = {'identite': identite, 'octets': octets, 'lignes': lignes}
+            position['signature'] = signature
+            if stat.st_size == position['octets'] and not renomme:
+                continue
+            
+            # Seules les lignes complètes sont lues: une dernière ligne sans fin de ligne peut être
+            # en cours d'écriture et reste en attente tant que le fichier n'est pas terminé
+            self._read_ventes(entree.path, position, lignes_completes=True, enregistrer=renomme)
+            if termine and stat.st_size > position['octets']:
+                self._read_ventes(entree.path, position, lignes_completes=False)
+    
+    def _read_ventes(self, chemin: str, position: dict, lignes_completes: bool, enregistrer: bool = False):
+        # enregistrer: le résultat rejoint le lot même sans nouvelle ligne, pour l'état d'ingestion
+        resultat = self.importer.parse_ventes_file(chemin, position['octets'], position['lignes'],
+                                                   lignes_completes=lignes_completes)
+        if resultat['statut'] == 'erreur':
+            print(f"   {chemin}: erreur de lecture ({resultat['erreur']})")
+            return
+        if resultat['octets'] == position['octets'] and not enregistrer:
+            return
+        if not lignes_completes and resultat['rejets']:
+            # Dernière ligne du fichier rejetée: laissée en attente plutôt que sautée
+            print(f"   {chemin}: dernière ligne sans fin de ligne laissée en attente "
+                  f"({'; '.join(resultat['exemples_rejets'])})")
+            return
+        if resultat['rejets']:
+            print(f"   {chemin}: {resultat['rejets']} lignes rejetées "
+                  f"({'; '.join(resultat['exemples_rejets'])})")
+        
+        position['octets'] = resultat['octets']
+        position['lignes'] += resultat['lignes']
+        self.tampon.append(resultat)
+        self.lignes_tampon += len(resultat['ventes'])
+        if self.debut_tampon is None:
+            self.debut_tampon = time.monotonic()
+        if self.lignes_tampon >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        if not self.tampon:
+            return
+        
+        lot, self.tampon = self.tampon, []
+        lignes = self.lignes_tampon
+        attente = time.monotonic() - self.debut_tampon
+        self.lignes_tampon = 0
+        self.debut_tampon = None
+        version_attendue = self.suivi.version
+        
+        debut = time.perf_counter()
+        try:
+            with self.metrics.stage('micro_lot'):
+                nouvelles_ventes = self.importer.write_parsed_ventes(lot, suivi=self.suivi)
+                if nouvelles_ventes:
+                    # Une seule version de plus: aucun autre écrivain depuis le dernier relevé
+                    version = self.db_manager.get_data_version()
+                    if version_attendue is not None and version == version_attendue + 1:
+                        self.suivi.publish(version)
+                    else:
+                        self._rebuild()
+        except Exception as e:
+            # Lot abandonné: ses fichiers seront relus depuis l'état validé en base
+            print(f"Erreur lors de l'écriture du micro-lot: {e}")
+            for resultat in lot:
+                self.positions.pop(resultat['fichier'], None)
+            return
+        
+        duree = time.perf_counter() - debut
+        self.statistiques['lots'] += 1
+        self.statistiques['lignes'] += lignes
+        self.statistiques['nouvelles_ventes'] += nouvelles_ventes
+        print(f"Micro-lot: {lignes} lignes de {len({resultat['fichier'] for resultat in lot})} fichiers, "
+              f"{nouvelles_ventes} nouvelles ventes "
+              f"(attente {attente:.2f}s, écriture et analyses {duree:.3f}s)")
+    
+    def _rebuild(self):
+        with self.metrics.stage('reconstruction_analyses'):
+            version = self.suivi.rebuild()
+            self.suivi.publish()
+        self.statistiques['reconstructions'] += 1
+        print(f"Analyses incrémentales reconstruites (version des données {version})")
+    
+    def maintenance(self):
+        self.derniere_maintenance = time.monotonic()
+        self.analyzer.purge_analysis_results(**self.retention)
+        if self.metrics_dir:
+            try:
+                print(f"Métriques d'exécution écrites dans {self.metrics.write_json(self.metrics_dir)}")
+            except OSError as e:
+                print(f"Impossible d'écrire les métriques d'exécution: {e}")
+        self.metrics.reset()
+
+if __name__ == "__main__":
+    print("Démarrage de l'ingestion continue des ventes...")
+    
+    metrics = MetricsRecorder()
+    db_manager = DatabaseManager(partitioned=os.getenv('VENTE_PARTITIONS', 'false').lower() == 'true',
+                                 metrics=metrics)
+    
+    try:
+        db_manager.connect()
+        db_manager.create_tables()
+        
+        collector = None
+        if os.getenv('USE_HTTP', 'false').lower() == 'true':
+            collector = DataCollector(os.getenv('HTTP_BASE_URL', 'http://localhost:8000'), metrics=metrics)
+        retention = os.getenv('ANALYSES_RETENTION', '7,365').split(',')
+        importer = DataImporter(db_manager, csv_backend=os.getenv('IMPORT_CSV_BACKEND', 'pandas').lower())
+        daemon = IngestionDaemon(
+            db_manager, importer, SalesAnalyzer(db_manager),
+            input_dir=os.getenv('DAEMON_INPUT_DIR', DEFAULT_INPUT_DIR),
+            batch_size=int(os.getenv('DAEMON_BATCH_SIZE', '5000')),
+            max_latency=float(os.getenv('DAEMON_MAX_LATENCY', '2')),
+            poll_interval=float(os.getenv('DAEMON_POLL_INTERVAL', '1')),
+            collector=collector,
+            http_interval=float(os.getenv('DAEMON_HTTP_INTERVAL', '60')),
+            delta=os.getenv('IMPORT_DELTA', 'false').lower() == 'true',
+            metrics_dir=os.getenv('METRICS_DIR', os.path.join('data', 'metrics')),
+            retention={'horaire_jours': int(retention[0]),
+                       'max_jours': int(retention[1]) if len(retention) > 1 and retention[1] else None}
+        )
+        signal.signal(signal.SIGTERM, daemon.stop)
+        signal.signal(signal.SIGINT, daemon.stop)
+        daemon.run()
+    
+    except Exception as e:
+        print(f"Erreur de l'ingestion continue: {e}")
+        sys.exit(1)
+    finally:
+        db_manager.close()
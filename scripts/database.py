@@ -2,25 +2,162 @@
 
 import sqlite3
 import os
+import queue
+import re
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
 from typing import Optional
+from metrics import MetricsRecorder, instrumented
+from sketches import build_daily_sketches, merge_daily_sketches
+
+REGIONS = {
+    'Paris': 'Île-de-France',
+    'Marseille': 'Provence-Alpes-Côte d\'Azur',
+    'Lyon': 'Auvergne-Rhône-Alpes',
+    'Bordeaux': 'Nouvelle-Aquitaine',
+    'Lille': 'Hauts-de-France',
+    'Nantes': 'Pays de la Loire',
+    'Strasbourg': 'Grand Est'
+}
+
+REGION_INCONNUE = 'Région inconnue'
+
+# Index secondaires de VENTE, supprimés puis reconstruits par bulk_load()
+VENTE_SECONDARY_INDEXES = {
+    'idx_vente_date': "CREATE INDEX IF NOT EXISTS idx_vente_date ON VENTE(Date)",
+    'idx_vente_magasin': "CREATE INDEX IF NOT EXISTS idx_vente_magasin ON VENTE(ID_Magasin)",
+    'idx_vente_produit': "CREATE INDEX IF NOT EXISTS idx_vente_produit ON VENTE(ID_Reference_Produit)",
+}
+
+# Origine d'une vente (fichier source, numéro de ligne de données), ajoutée aux bases existantes
+VENTE_ORIGIN_COLUMNS = {'Source': 'TEXT', 'Ligne_Source': 'INTEGER'}
+
+BULK_LOAD_PRAGMAS = {
+    'synchronous': 'OFF',
+    'cache_size': '-262144',
+    'temp_store': 'MEMORY',
+}
+
+# Ventes regroupées (par jours complets) lors de la reconstruction des sketches
+SKETCH_REBUILD_BATCH = 500000
+
+# Attente maximale (secondes) d'un verrou SQLite tenu par une autre connexion
+BUSY_TIMEOUT = 30
+
+# Partitions mensuelles de VENTE (VENTE_AAAA_MM) et vue qui les réunit
+PARTITION_GLOB = 'VENTE_[0-9][0-9][0-9][0-9]_[0-9][0-9]'
+PARTITION_VIEW = 'VENTE_PARTITIONS'
+MOIS_PATTERN = re.compile(r'^\d{4}-\d{2}$')
+
+# Valeur de PRAGMA auto_vacuum: les pages libres sont rendues sur demande (PRAGMA incremental_vacuum)
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Tables lues par les analyses: une base ouverte en lecture seule doit déjà les contenir
+ANALYSIS_TABLES = ('MAGASIN', 'PRODUIT', 'VENTE', 'ANALYSE_RESULTATS', 'METADONNEES',
+                   'VENTE_AGREGAT_JOUR', 'VENTE_SKETCH_JOUR')
 
 class DatabaseManager:
     
-    def __init__(self, db_path: str = "data/ventes.db"):
+    def __init__(self, db_path: str = "data/ventes.db", pool_size: int = 4, partitioned: bool = False,
+                 metrics: Optional[MetricsRecorder] = None, read_only: bool = False):
         self.db_path = db_path
+        # Lecture seule (API): aucune création de fichier, de schéma ni écriture
+        self.read_only = read_only
+        # Partagé avec l'importeur et l'analyseur: une exécution produit un seul relevé
+        self.metrics = metrics or MetricsRecorder()
         self.connection: Optional[sqlite3.Connection] = None
+        self.bulk_loading = False
+        self.partitioned = partitioned
+        # Une seule connexion écrit (protégée par write_lock); les lectures passent par
+        # un pool de connexions en lecture seule, qui voient le dernier état validé
+        self.pool_size = pool_size
+        self.write_lock = threading.RLock()
+        self._readers = queue.Queue()
+        self._readers_ouverts = 0
+        self._pool_lock = threading.Lock()
         
+    @instrumented('connexion')
     def connect(self) -> sqlite3.Connection:
         try:
+            if self.read_only:
+                if not os.path.isfile(self.db_path):
+                    raise FileNotFoundError(f"Base de données absente: {self.db_path} "
+                                            "(lancer d'abord main.py ou daemon.py pour la créer)")
+                self.connection = self._open_reader()
+                print(f"Connexion à la base de données établie en lecture seule: {self.db_path}")
+                return self.connection
             os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-            self.connection = sqlite3.connect(self.db_path)
+            self.connection = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
             self.connection.row_factory = sqlite3.Row
+            # WAL: les lecteurs ne bloquent pas l'écrivain et ne sont pas bloqués par lui
+            self.connection.execute("PRAGMA journal_mode = WAL")
             print(f"Connexion à la base de données établie: {self.db_path}")
             return self.connection
         except Exception as e:
             print(f"Erreur de connexion à la base de données: {e}")
             raise
     
+    def _open_reader(self) -> sqlite3.Connection:
+        uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+        # isolation_level=None: les transactions de lecture sont ouvertes par reader()
+        connection = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                                     isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+    
+    @contextmanager
+    def reader(self):
+        if not self.connection:
+            self.connect()
+        
+        try:
+            connection = self._readers.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                ouvrir = self._readers_ouverts < self.pool_size
+                if ouvrir:
+                    self._readers_ouverts += 1
+            connection = self._open_reader() if ouvrir else self._readers.get()
+        
+        # Une transaction par emprunt: toutes les requêtes du bloc lisent le même instantané
+        connection.execute("BEGIN")
+        try:
+            yield connection
+        finally:
+            connection.execute("COMMIT")
+            self._readers.put(connection)
+    
+    @contextmanager
+    def writer(self):
+        # Sérialise les transactions d'écriture des différents threads sur la connexion principale
+        if self.read_only:
+            raise RuntimeError(f"Base de données ouverte en lecture seule: {self.db_path}")
+        if not self.connection:
+            self.connect()
+        with self.write_lock:
+            yield self.connection
+    
+    @contextmanager
+    def try_writer(self):
+        # Comme writer(), sans attendre: None si une autre écriture (import, chargement massif)
+        # tient déjà la connexion principale, ou si la base est ouverte en lecture seule
+        if self.read_only:
+            yield None
+            return
+        if not self.connection:
+            self.connect()
+        if not self.write_lock.acquire(blocking=False):
+            yield None
+            return
+        try:
+            yield None if self.bulk_loading else self.connection
+        finally:
+            self.write_lock.release()
+    
+    @instrumented('creation_tables')
     def create_tables(self):
         if not self.connection:
             self.connect()
@@ -54,10 +191,13 @@ class DatabaseManager:
                     Quantite INTEGER NOT NULL CHECK (Quantite > 0),
                     ID_Magasin INTEGER NOT NULL,
                     Montant_Total REAL NOT NULL,
+                    Source TEXT,
+                    Ligne_Source INTEGER,
                     FOREIGN KEY (ID_Reference_Produit) REFERENCES PRODUIT(ID_Reference),
                     FOREIGN KEY (ID_Magasin) REFERENCES MAGASIN(ID_Magasin)
                 )
             """)
+            self._add_missing_columns(cursor, 'VENTE', VENTE_ORIGIN_COLUMNS)
             
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS ANALYSE_RESULTATS (
@@ -65,14 +205,94 @@ class DatabaseManager:
                     Type_Analyse TEXT NOT NULL,
                     Date_Analyse TEXT NOT NULL,
                     Resultat TEXT NOT NULL,
-                    Valeur_Numerique REAL
+                    Valeur_Numerique REAL,
+                    Version_Donnees INTEGER,
+                    Parametres TEXT,
+                    Resultat_Compresse BLOB
                 )
             """)
+            self._add_missing_columns(cursor, 'ANALYSE_RESULTATS', {
+                'Version_Donnees': 'INTEGER',
+                'Parametres': 'TEXT',
+                'Resultat_Compresse': 'BLOB'
+            })
             
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_vente_date ON VENTE(Date)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_vente_magasin ON VENTE(ID_Magasin)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_vente_produit ON VENTE(ID_Reference_Produit)")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS METADONNEES (
+                    Cle TEXT PRIMARY KEY,
+                    Valeur INTEGER NOT NULL
+                )
+            """)
+            cursor.execute("INSERT OR IGNORE INTO METADONNEES (Cle, Valeur) VALUES ('version_donnees', 0)")
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS INGESTION_ETAT (
+                    Source TEXT PRIMARY KEY,
+                    Identite_Fichier TEXT,
+                    Octets_Consommes INTEGER NOT NULL,
+                    Nombre_Lignes INTEGER NOT NULL,
+                    Hash_Prefixe TEXT NOT NULL,
+                    Date_Import TEXT NOT NULL
+                )
+            """)
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS VENTE_AGREGAT_JOUR (
+                    Date TEXT NOT NULL,
+                    ID_Reference_Produit TEXT NOT NULL,
+                    ID_Magasin INTEGER NOT NULL,
+                    Quantite_Totale INTEGER NOT NULL,
+                    Montant_Total REAL NOT NULL,
+                    Nombre_Ventes INTEGER NOT NULL,
+                    PRIMARY KEY (Date, ID_Reference_Produit, ID_Magasin)
+                ) WITHOUT ROWID
+            """)
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_agregat_magasin_date 
+                ON VENTE_AGREGAT_JOUR(ID_Magasin, Date, Quantite_Totale, Montant_Total, Nombre_Ventes)
+            """)
+            
+            # Sketches journaliers (distincts, produits les plus lourds, quantiles des montants)
+            # servant les analyses approchées sans parcourir VENTE
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS VENTE_SKETCH_JOUR (
+                    Date TEXT PRIMARY KEY,
+                    Nombre_Ventes INTEGER NOT NULL,
+                    HLL_Produits BLOB NOT NULL,
+                    HLL_Magasins BLOB NOT NULL,
+                    Top_Produits BLOB NOT NULL,
+                    Quantiles_Montant BLOB NOT NULL
+                ) WITHOUT ROWID
+            """)
+            
+            self._create_vente_origin_key(cursor, 'VENTE')
+            self._setup_partitions(cursor)
+            for table in self.vente_tables():
+                self._index_legacy_ventes(cursor, table)
+            
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM VENTE_AGREGAT_JOUR)")
+            cube_vide = cursor.fetchone()[0] == 0
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM VENTE_SKETCH_JOUR)")
+            sketches_vides = cursor.fetchone()[0] == 0
+            cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {self.vente_source()})")
+            if cursor.fetchone()[0] == 1:
+                if cube_vide:
+                    self.rebuild_sales_cube(cursor)
+                if sketches_vides:
+                    self.rebuild_sketches(cursor)
+            
+            for index_sql in VENTE_SECONDARY_INDEXES.values():
+                cursor.execute(index_sql)
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_analyse_type ON ANALYSE_RESULTATS(Type_Analyse)")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_analyse_historique 
+                ON ANALYSE_RESULTATS(Type_Analyse, Date_Analyse, Valeur_Numerique)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_analyse_cache 
+                ON ANALYSE_RESULTATS(Type_Analyse, Version_Donnees, Parametres)
+            """)
             
             self.connection.commit()
             print("Tables créées avec succès")
@@ -82,17 +302,471 @@ class DatabaseManager:
             self.connection.rollback()
             raise
     
+    def check_schema(self):
+        # Base ouverte en lecture seule: le schéma n'est pas créé ici, il doit exister
+        with self.reader() as connection:
+            tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            manquantes = [table for table in ANALYSIS_TABLES if table not in tables]
+            if manquantes:
+                raise RuntimeError(f"Schéma absent ou incomplet dans {self.db_path} "
+                                   f"(tables manquantes: {', '.join(manquantes)}): "
+                                   "lancer d'abord main.py ou daemon.py pour créer la base")
+            # Mode partitionné mémorisé par create_tables
+            row = connection.execute(
+                "SELECT Valeur FROM METADONNEES WHERE Cle = 'ventes_partitionnees'").fetchone()
+            if row is not None and row[0] == 1:
+                self.partitioned = True
+    
+    def _add_missing_columns(self, cursor: sqlite3.Cursor, table_name: str, columns: dict):
+        cursor.execute(f"PRAGMA table_info({table_name})")
+        existing = {row[1] for row in cursor.fetchall()}
+        for column, column_type in columns.items():
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {column_type}")
+    
+    def get_data_version(self, connection: Optional[sqlite3.Connection] = None) -> int:
+        if not self.connection:
+            self.connect()
+        
+        cursor = (connection or self.connection).cursor()
+        cursor.execute("SELECT Valeur FROM METADONNEES WHERE Cle = 'version_donnees'")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    
+    def bump_data_version(self, cursor: sqlite3.Cursor):
+        # Appelé dans la transaction qui modifie VENTE, PRODUIT ou MAGASIN: invalide le cache d'analyses
+        cursor.execute("UPDATE METADONNEES SET Valeur = Valeur + 1 WHERE Cle = 'version_donnees'")
+    
+    def commit(self):
+        # Pendant un chargement massif, la transaction est validée par bulk_load()
+        if not self.bulk_loading:
+            self.connection.commit()
+            self.metrics.count('commits')
+    
+    def rollback(self):
+        if not self.bulk_loading:
+            self.connection.rollback()
+    
+    @contextmanager
+    def bulk_load(self):
+        if not self.connection:
+            self.connect()
+        # Le verrou d'écriture est tenu pendant tout le chargement: une seule transaction
+        with self.write_lock:
+            if self.bulk_loading:
+                raise RuntimeError("Un chargement massif est déjà en cours")
+            
+            cursor = self.connection.cursor()
+            self.connection.commit()
+            
+            pragmas_initiaux = {}
+            for pragma, valeur in BULK_LOAD_PRAGMAS.items():
+                pragmas_initiaux[pragma] = cursor.execute(f"PRAGMA {pragma}").fetchone()[0]
+                cursor.execute(f"PRAGMA {pragma} = {valeur}")
+            
+            print("Chargement massif: index secondaires suspendus")
+            # Le DROP INDEX fait partie de la transaction: un échec les restaure au rollback
+            cursor.execute("BEGIN")
+            for index_name in VENTE_SECONDARY_INDEXES:
+                cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+            self.bulk_loading = True
+            
+            try:
+                yield self
+            
+                print("Chargement massif: reconstruction des index")
+                with self.metrics.stage('reconstruction_index'):
+                    for index_sql in VENTE_SECONDARY_INDEXES.values():
+                        cursor.execute(index_sql)
+                    self.connection.commit()
+                self.metrics.count('commits')
+            
+            except Exception:
+                print("Chargement massif interrompu: annulation de la transaction")
+                self.connection.rollback()
+                raise
+            
+            finally:
+                self.bulk_loading = False
+                for pragma, valeur in pragmas_initiaux.items():
+                    cursor.execute(f"PRAGMA {pragma} = {valeur}")
+            
+            with self.metrics.stage('analyze'):
+                cursor.execute("ANALYZE")
+                self.connection.commit()
+            print("Chargement massif terminé (ANALYZE effectué)")
+    
+    def _create_vente_origin_key(self, cursor: sqlite3.Cursor, table: str):
+        # Une vente est identifiée par son origine (fichier source, numéro de ligne de données), pas
+        # par son contenu: deux ventes identiques le même jour sont deux ventes
+        cursor.execute(f"DROP INDEX IF EXISTS idx_{table.lower()}_cle_naturelle")
+        cursor.execute(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_{table.lower()}_origine 
+            ON {table}(Source, Ligne_Source)
+        """)
+    
+    def _index_legacy_ventes(self, cursor: sqlite3.Cursor, table: str):
+        # Ventes chargées avant l'identification par origine (origine NULL): le fichier dont elles
+        # viennent n'est pas connu ici, et l'ancien import écartait les lignes de même contenu, donc
+        # l'ordre des ID_Vente ne donne pas les numéros de ligne. L'origine leur est attribuée à la
+        # relecture de leur fichier (adopt_legacy_ventes), par contenu; cet index partiel, limité aux
+        # ventes héritées, sert cette recherche et disparaît avec la dernière
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table} WHERE Source IS NULL)")
+        if cursor.fetchone()[0]:
+            cursor.execute(f"""
+                CREATE INDEX IF NOT EXISTS idx_{table.lower()}_heritees 
+                ON {table}(Date, ID_Reference_Produit, Quantite, ID_Magasin) WHERE Source IS NULL
+            """)
+        else:
+            cursor.execute(f"DROP INDEX IF EXISTS idx_{table.lower()}_heritees")
+    
+    def adopt_legacy_ventes(self, cursor: sqlite3.Cursor, table: str, ventes: list) -> int:
+        # Chaque vente relue reprend la plus ancienne vente héritée de même contenu (qui reçoit son
+        # origine) au lieu d'être insérée une seconde fois. Retourne le nombre de ventes reprises
+        index = f"idx_{table.lower()}_heritees"
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index,))
+        if cursor.fetchone() is None:
+            return 0
+        
+        changements_avant = self.connection.total_changes
+        cursor.executemany(f"""
+            UPDATE {table} SET Source = ?, Ligne_Source = ?
+            WHERE ID_Vente = (
+                SELECT MIN(ID_Vente) FROM {table} INDEXED BY {index}
+                WHERE Source IS NULL AND Date = ? AND ID_Reference_Produit = ? AND Quantite = ?
+                  AND ID_Magasin = ?
+            )
+            AND NOT EXISTS (SELECT 1 FROM {table} WHERE Source = ? AND Ligne_Source = ?)
+        """, [(vente[5], vente[6], vente[0], vente[1], vente[2], vente[3], vente[5], vente[6])
+              for vente in ventes])
+        reprises = self.connection.total_changes - changements_avant
+        if reprises:
+            self._index_legacy_ventes(cursor, table)
+            self.metrics.count('ventes_heritees_reprises', reprises)
+        return reprises
+    
+    def _setup_partitions(self, cursor: sqlite3.Cursor):
+        # Le mode partitionné est mémorisé dans la base: une fois activé, il le reste
+        cursor.execute("SELECT Valeur FROM METADONNEES WHERE Cle = 'ventes_partitionnees'")
+        row = cursor.fetchone()
+        if row is not None and row[0] == 1:
+            self.partitioned = True
+        if not self.partitioned:
+            return
+        
+        cursor.execute("INSERT OR REPLACE INTO METADONNEES (Cle, Valeur) VALUES ('ventes_partitionnees', 1)")
+        
+        # Partitions créées avant l'identification des ventes par leur origine
+        for mois in self.list_partitions():
+            table = self.partition_name(mois)
+            self._add_missing_columns(cursor, table, VENTE_ORIGIN_COLUMNS)
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table.lower()}_date ON {table}(Date)")
+            self._create_vente_origin_key(cursor, table)
+        
+        # Bases existantes: les ventes de la table unique sont réparties une fois par mois
+        cursor.execute("SELECT DISTINCT substr(Date, 1, 7) FROM VENTE ORDER BY 1")
+        mois_existants = [row[0] for row in cursor.fetchall()]
+        if mois_existants:
+            print(f"Répartition de VENTE en {len(mois_existants)} partitions mensuelles...")
+        for mois in mois_existants:
+            table = self.ensure_partition(cursor, mois)
+            debut, fin = self._month_bounds(mois)
+            cursor.execute(f"""
+                INSERT INTO {table} 
+                (Date, ID_Reference_Produit, Quantite, ID_Magasin, Montant_Total, Source, Ligne_Source)
+                SELECT Date, ID_Reference_Produit, Quantite, ID_Magasin, Montant_Total, Source, Ligne_Source
+                FROM VENTE WHERE Date >= ? AND Date < ?
+                ORDER BY ID_Vente
+                ON CONFLICT (Source, Ligne_Source) DO NOTHING
+            """, (debut, fin))
+        if mois_existants:
+            cursor.execute("DELETE FROM VENTE")
+        
+        self._refresh_partition_view(cursor)
+    
+    @staticmethod
+    def partition_name(mois: str) -> str:
+        if not MOIS_PATTERN.match(mois):
+            raise ValueError(f"Mois de partition invalide: {mois!r} (attendu: AAAA-MM)")
+        return f"VENTE_{mois.replace('-', '_')}"
+    
+    @staticmethod
+    def _month_bounds(mois: str) -> tuple:
+        annee, numero = int(mois[:4]), int(mois[5:7])
+        suivant = f"{annee + 1}-01" if numero == 12 else f"{annee}-{numero + 1:02d}"
+        return f"{mois}-01", f"{suivant}-01"
+    
+    def ensure_partition(self, cursor: sqlite3.Cursor, mois: str) -> str:
+        table = self.partition_name(mois)
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        if cursor.fetchone() is not None:
+            return table
+        
+        # Le CHECK garantit le routage; l'index sur Date sert les filtres de période
+        debut, fin = self._month_bounds(mois)
+        cursor.execute(f"""
+            CREATE TABLE {table} (
+                ID_Vente INTEGER PRIMARY KEY,
+                Date TEXT NOT NULL CHECK (Date >= '{debut}' AND Date < '{fin}'),
+                ID_Reference_Produit TEXT NOT NULL,
+                Quantite INTEGER NOT NULL CHECK (Quantite > 0),
+                ID_Magasin INTEGER NOT NULL,
+                Montant_Total REAL NOT NULL,
+                Source TEXT,
+                Ligne_Source INTEGER,
+                FOREIGN KEY (ID_Reference_Produit) REFERENCES PRODUIT(ID_Reference),
+                FOREIGN KEY (ID_Magasin) REFERENCES MAGASIN(ID_Magasin)
+            )
+        """)
+        cursor.execute(f"CREATE INDEX idx_{table.lower()}_date ON {table}(Date)")
+        self._create_vente_origin_key(cursor, table)
+        self._refresh_partition_view(cursor)
+        return table
+    
+    def list_partitions(self, connection: Optional[sqlite3.Connection] = None) -> list:
+        cursor = (connection or self.connection).cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? ORDER BY name",
+                       (PARTITION_GLOB,))
+        return [f"{row[0][6:10]}-{row[0][11:13]}" for row in cursor.fetchall()]
+    
+    def _refresh_partition_view(self, cursor: sqlite3.Cursor):
+        tables = [self.partition_name(mois) for mois in self.list_partitions()]
+        selects = [f"SELECT * FROM {table}" for table in tables] or ["SELECT * FROM VENTE WHERE 0"]
+        cursor.execute(f"DROP VIEW IF EXISTS {PARTITION_VIEW}")
+        cursor.execute(f"CREATE VIEW {PARTITION_VIEW} AS {' UNION ALL '.join(selects)}")
+    
+    def vente_tables(self, connection: Optional[sqlite3.Connection] = None) -> list:
+        if not self.partitioned:
+            return ['VENTE']
+        return [self.partition_name(mois) for mois in self.list_partitions(connection)]
+    
+    def vente_source(self, date_debut: Optional[str] = None, date_fin: Optional[str] = None,
+                     connection: Optional[sqlite3.Connection] = None) -> str:
+        # Source SQL des ventes détaillées: VENTE, la vue des partitions, ou seulement les
+        # partitions qui recouvrent [date_debut, date_fin]
+        if not self.partitioned:
+            return 'VENTE'
+        if date_debut is None and date_fin is None:
+            return PARTITION_VIEW
+        
+        mois = [m for m in self.list_partitions(connection)
+                if (date_debut is None or m >= date_debut[:7]) and (date_fin is None or m <= date_fin[:7])]
+        if not mois:
+            return "(SELECT * FROM VENTE WHERE 0)"
+        return f"({' UNION ALL '.join(f'SELECT * FROM {self.partition_name(m)}' for m in mois)})"
+    
+    @instrumented('archivage')
+    def archive_year(self, annee: int, archive_dir: str = "data/archives") -> dict:
+        # Les partitions de l'année sont copiées dans un fichier dédié puis supprimées (DROP TABLE,
+        # sans DELETE ligne à ligne); l'agrégat de l'année est retiré avec elles. Les partitions ne
+        # peuvent pas vivre chacune dans son fichier attaché: la vue VENTE_PARTITIONS ne peut pas lire
+        # une base attachée, et SQLite n'en attache que 10 par défaut
+        if not self.connection:
+            self.connect()
+        if not self.partitioned:
+            raise RuntimeError("L'archivage nécessite le stockage partitionné des ventes")
+        
+        with self.writer():
+            if self.bulk_loading:
+                raise RuntimeError("Archivage impossible pendant un chargement massif")
+            
+            tables = [self.partition_name(mois) for mois in self.list_partitions() if mois.startswith(f"{annee}-")]
+            if not tables:
+                print(f"Aucune partition à archiver pour {annee}")
+                return {'annee': annee, 'partitions': 0, 'ventes': 0, 'fichier': None}
+            
+            os.makedirs(archive_dir, exist_ok=True)
+            fichier = os.path.join(archive_dir, f"ventes_{annee}.db")
+            cursor = self.connection.cursor()
+            ventes = sum(cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables)
+            
+            # ATTACH est interdit dans une transaction
+            self.connection.commit()
+            cursor.execute("ATTACH DATABASE ? AS archive", (fichier,))
+            try:
+                for table in tables:
+                    # Une copie déjà présente (archivage interrompu puis relancé) est conservée
+                    cursor.execute("SELECT 1 FROM archive.sqlite_master WHERE type = 'table' AND name = ?",
+                                   (table,))
+                    if cursor.fetchone() is None:
+                        cursor.execute(f"CREATE TABLE archive.{table} AS SELECT * FROM main.{table}")
+                self.connection.commit()
+            finally:
+                cursor.execute("DETACH DATABASE archive")
+            
+            try:
+                for table in tables:
+                    cursor.execute(f"DROP TABLE {table}")
+                for table_jour in ('VENTE_AGREGAT_JOUR', 'VENTE_SKETCH_JOUR'):
+                    cursor.execute(f"DELETE FROM {table_jour} WHERE Date >= ? AND Date < ?",
+                                   (f"{annee}-01-01", f"{annee + 1}-01-01"))
+                self._refresh_partition_view(cursor)
+                self.bump_data_version(cursor)
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+            
+            # Les pages des partitions supprimées restent dans le fichier, réutilisées par les prochaines
+            # insertions; une base en auto_vacuum incrémental (vacuum(incremental=True)) les rend au système
+            pages_liberees = 0
+            if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+                pages_liberees = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+                # executescript exécute le PRAGMA jusqu'au bout (execute ne libère qu'une page par appel)
+                self.connection.executescript("PRAGMA incremental_vacuum")
+        
+        print(f"{len(tables)} partitions de {annee} archivées dans {fichier} ({ventes} ventes)")
+        return {'annee': annee, 'partitions': len(tables), 'ventes': ventes, 'fichier': fichier,
+                'pages_liberees': pages_liberees}
+    
+    def vacuum(self, incremental: bool = False) -> dict:
+        # Réécrit la base sans ses pages libres (partitions archivées, ventes supprimées): copie complète
+        # du fichier sous verrou exclusif, à lancer démon et API arrêtés. incremental: la base passe aussi
+        # en auto_vacuum incrémental, et archive_year rendra ensuite ses pages sans nouvelle réécriture
+        if not self.connection:
+            self.connect()
+        
+        with self.writer():
+            if self.bulk_loading:
+                raise RuntimeError("VACUUM impossible pendant un chargement massif")
+            
+            taille_avant = os.path.getsize(self.db_path)
+            self.connection.commit()
+            cursor = self.connection.cursor()
+            if incremental:
+                cursor.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+            cursor.execute("VACUUM")
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            taille_apres = os.path.getsize(self.db_path)
+        
+        print(f"VACUUM: {taille_avant / 1024 / 1024:.1f} Mo -> {taille_apres / 1024 / 1024:.1f} Mo")
+        return {'taille_avant': taille_avant, 'taille_apres': taille_apres}
+    
+    def update_sales_cube(self, cursor: sqlite3.Cursor, after_id: int, table: str = 'VENTE'):
+        # Agrège les ventes de table insérées après after_id (ID_Vente croissant dans chaque table)
+        cursor.execute(f"""
+            INSERT INTO VENTE_AGREGAT_JOUR 
+            (Date, ID_Reference_Produit, ID_Magasin, Quantite_Totale, Montant_Total, Nombre_Ventes)
+            SELECT Date, ID_Reference_Produit, ID_Magasin, SUM(Quantite), SUM(Montant_Total), COUNT(*)
+            FROM {table}
+            WHERE ID_Vente > ?
+            GROUP BY Date, ID_Reference_Produit, ID_Magasin
+            ON CONFLICT (Date, ID_Reference_Produit, ID_Magasin) DO UPDATE SET
+                Quantite_Totale = Quantite_Totale + excluded.Quantite_Totale,
+                Montant_Total = Montant_Total + excluded.Montant_Total,
+                Nombre_Ventes = Nombre_Ventes + excluded.Nombre_Ventes
+        """, (after_id,))
+        self.metrics.count('lignes_agregat', cursor.rowcount)
+    
+    def update_sketches(self, cursor: sqlite3.Cursor, after_id: int, table: str = 'VENTE'):
+        # Comme l'agrégat: les ventes de table insérées après after_id enrichissent les sketches de leur jour
+        cursor.execute(f"""
+            SELECT Date, ID_Reference_Produit, ID_Magasin, Montant_Total FROM {table} WHERE ID_Vente > ?
+        """, (after_id,))
+        sketches = build_daily_sketches(cursor.fetchall())
+        merge_daily_sketches(cursor, sketches)
+        self.metrics.count('jours_sketches', len(sketches))
+    
+    def rebuild_sketches(self, cursor: sqlite3.Cursor, produits_table: Optional[str] = None):
+        # Les sketches ne se soustraient pas: les jours concernés sont recalculés depuis les ventes
+        filtre = ""
+        if produits_table:
+            filtre = f"""WHERE Date IN (
+                SELECT DISTINCT Date FROM VENTE_AGREGAT_JOUR
+                WHERE ID_Reference_Produit IN (SELECT ID_Reference FROM {produits_table})
+            )"""
+        else:
+            print("Reconstruction des sketches journaliers des ventes...")
+        
+        cursor.execute(f"DELETE FROM VENTE_SKETCH_JOUR {filtre}")
+        cursor.execute(f"""
+            SELECT Date, ID_Reference_Produit, ID_Magasin, Montant_Total
+            FROM {self.vente_source()}
+            {filtre}
+            ORDER BY Date
+        """)
+        # Par lots de jours complets: la mémoire reste bornée sur un long historique
+        ecriture = cursor.connection.cursor()
+        lot = []
+        for row in cursor:
+            if len(lot) >= SKETCH_REBUILD_BATCH and row[0] != lot[-1][0]:
+                merge_daily_sketches(ecriture, build_daily_sketches(lot))
+                lot = []
+            lot.append(row)
+        if lot:
+            merge_daily_sketches(ecriture, build_daily_sketches(lot))
+    
+    def rebuild_sales_cube(self, cursor: sqlite3.Cursor, produits_table: Optional[str] = None):
+        # Sans table de produits, tout le cube est recalculé; sinon seulement ces produits
+        filtre = ""
+        if produits_table:
+            filtre = f"WHERE ID_Reference_Produit IN (SELECT ID_Reference FROM {produits_table})"
+        else:
+            print("Reconstruction de l'agrégat journalier des ventes...")
+        
+        cursor.execute(f"DELETE FROM VENTE_AGREGAT_JOUR {filtre}")
+        cursor.execute(f"""
+            INSERT INTO VENTE_AGREGAT_JOUR 
+            (Date, ID_Reference_Produit, ID_Magasin, Quantite_Totale, Montant_Total, Nombre_Ventes)
+            SELECT Date, ID_Reference_Produit, ID_Magasin, SUM(Quantite), SUM(Montant_Total), COUNT(*)
+            FROM {self.vente_source()}
+            {filtre}
+            GROUP BY Date, ID_Reference_Produit, ID_Magasin
+        """)
+    
     def get_region_from_city(self, city: str) -> str:
-        regions = {
-            'Paris': 'Île-de-France',
-            'Marseille': 'Provence-Alpes-Côte d\'Azur',
-            'Lyon': 'Auvergne-Rhône-Alpes',
-            'Bordeaux': 'Nouvelle-Aquitaine',
-            'Lille': 'Hauts-de-France',
-            'Nantes': 'Pays de la Loire',
-            'Strasbourg': 'Grand Est'
+        return REGIONS.get(city, REGION_INCONNUE)
+    
+    def source_name(self, chemin: str) -> str:
+        # Nom d'un fichier source dans la base (origine des ventes, clé de INGESTION_ETAT): chemin réel,
+        # relatif au dossier de la base. ventes.csv, ./ventes.csv et son chemin absolu sont le même
+        # fichier, et les noms restent valables si le projet est déplacé avec sa base
+        return os.path.relpath(os.path.realpath(chemin), os.path.dirname(os.path.realpath(self.db_path)))
+    
+    def get_ingestion_state(self, source: str) -> Optional[dict]:
+        if not self.connection:
+            self.connect()
+        
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            SELECT Identite_Fichier, Octets_Consommes, Nombre_Lignes, Hash_Prefixe, Date_Import
+            FROM INGESTION_ETAT WHERE Source = ?
+        """, (source,))
+        row = cursor.fetchone()
+        return self._ingestion_state(row) if row is not None else None
+    
+    def get_ingestion_states(self) -> dict:
+        # Tous les états en une requête, pour l'import d'un dossier de nombreux fichiers
+        if not self.connection:
+            self.connect()
+        
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            SELECT Source, Identite_Fichier, Octets_Consommes, Nombre_Lignes, Hash_Prefixe, Date_Import
+            FROM INGESTION_ETAT
+        """)
+        return {row[0]: self._ingestion_state(row[1:]) for row in cursor.fetchall()}
+    
+    @staticmethod
+    def _ingestion_state(row: tuple) -> dict:
+        return {
+            'identite_fichier': row[0],
+            'octets_consommes': row[1],
+            'nombre_lignes': row[2],
+            'hash_prefixe': row[3],
+            'date_import': row[4]
         }
-        return regions.get(city, 'Région inconnue')
+    
+    def save_ingestion_state(self, source: str, identite_fichier: str, octets_consommes: int,
+                             nombre_lignes: int, hash_prefixe: str):
+        # Pas de commit ici: l'état est validé dans la même transaction que les données
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            INSERT OR REPLACE INTO INGESTION_ETAT 
+            (Source, Identite_Fichier, Octets_Consommes, Nombre_Lignes, Hash_Prefixe, Date_Import)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (source, identite_fichier, octets_consommes, nombre_lignes, hash_prefixe,
+              datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
     
     def check_table_exists(self, table_name: str) -> bool:
         if not self.connection:
@@ -110,11 +784,21 @@ class DatabaseManager:
         if not self.connection:
             self.connect()
             
+        if table_name == 'VENTE':
+            table_name = self.vente_source()
+        
         cursor = self.connection.cursor()
         cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
         return cursor.fetchone()[0]
     
     def close(self):
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        self._readers_ouverts = 0
+        
         if self.connection:
             self.connection.close()
             print("Connexion à la base de données fermée")
@@ -127,7 +811,14 @@ if __name__ == "__main__":
         db_manager.connect()
         db_manager.create_tables()
         
-        tables = ['MAGASIN', 'PRODUIT', 'VENTE', 'ANALYSE_RESULTATS']
+        # python database.py archive AAAA: archive les partitions de ventes d'une année
+        if len(sys.argv) == 3 and sys.argv[1] == 'archive':
+            db_manager.archive_year(int(sys.argv[2]))
+        # python database.py vacuum [incremental]: rend au système les pages libérées
+        if len(sys.argv) >= 2 and sys.argv[1] == 'vacuum':
+            db_manager.vacuum(incremental=sys.argv[2:] == ['incremental'])
+        
+        tables = ['MAGASIN', 'PRODUIT', 'VENTE', 'VENTE_AGREGAT_JOUR', 'ANALYSE_RESULTATS', 'INGESTION_ETAT']
         for table in tables:
             if db_manager.check_table_exists(table):
                 count = db_manager.get_table_count(table)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+from datetime import date, timedelta
+from database import REGIONS
+
+# Lignes de ventes générées et écrites par lot (mémoire bornée jusqu'à 1e8 ventes)
+GENERATION_CHUNK_SIZE = 1000000
+
+VILLES = list(REGIONS)
+
+DEFAULT_OUTPUT_DIR = os.path.join('data', 'bench')
+
+def default_sizes(nombre_ventes: int) -> tuple:
+    # Référentiels proportionnés au volume: ~racine carrée des ventes pour les produits,
+    # ~racine cubique pour les magasins
+    nombre_produits = int(min(100000, max(4, round(nombre_ventes ** 0.5 / 2))))
+    nombre_magasins = int(min(5000, max(len(VILLES), round(nombre_ventes ** (1 / 3)))))
+    return nombre_produits, nombre_magasins
+
+def zipf_weights(nombre: int, skew: float) -> np.ndarray:
+    # Popularité de loi de Zipf: le rang r est tiré avec une probabilité proportionnelle à 1/r^skew
+    poids = 1.0 / np.arange(1, nombre + 1) ** skew
+    return poids / poids.sum()
+
+def generate_dataset(output_dir: str, nombre_ventes: int, nombre_produits: int = None,
+                     nombre_magasins: int = None, skew: float = 1.1, date_debut: str = '2020-01-01',
+                     jours: int = 365, seed: int = 42) -> dict:
+    defaut_produits, defaut_magasins = default_sizes(nombre_ventes)
+    nombre_produits = nombre_produits or defaut_produits
+    nombre_magasins = nombre_magasins or defaut_magasins
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    debut = time.perf_counter()
+    
+    print(f"Génération de {nombre_ventes} ventes, {nombre_produits} produits, "
+          f"{nombre_magasins} magasins dans {output_dir}...")
+    
+    # Magasins: les villes connues tournent, la taille suit une loi log-normale
+    salaries = np.maximum(1, rng.lognormal(2.3, 0.6, nombre_magasins).astype(int))
+    with open(os.path.join(output_dir, 'magasins.csv'), 'w', encoding='utf-8') as f:
+        f.write("ID Magasin,Ville,Nombre de salariés\n")
+        for id_magasin in range(1, nombre_magasins + 1):
+            f.write(f"{id_magasin},{VILLES[(id_magasin - 1) % len(VILLES)]},{salaries[id_magasin - 1]}\n")
+    
+    largeur = max(3, len(str(nombre_produits)))
+    references = [f"REF{numero:0{largeur}d}" for numero in range(1, nombre_produits + 1)]
+    prix = np.round(rng.lognormal(3.2, 0.8, nombre_produits), 2).clip(0.5, None)
+    stocks = rng.integers(0, 1000, nombre_produits)
+    with open(os.path.join(output_dir, 'produits.csv'), 'w', encoding='utf-8') as f:
+        f.write("Nom,ID Référence produit,Prix,Stock\n")
+        for numero, reference in enumerate(references):
+            f.write(f"Produit {numero + 1},{reference},{prix[numero]:.2f},{stocks[numero]}\n")
+    
+    # Ventes chronologiques: chaque lot couvre une tranche de la période, triée par jour.
+    # Les produits suivent une loi de Zipf (permutée pour ne pas favoriser REF001),
+    # les magasins sont tirés selon leur nombre de salariés
+    popularite_produits = zipf_weights(nombre_produits, skew)[rng.permutation(nombre_produits)]
+    poids_magasins = salaries / salaries.sum()
+    premier_jour = date.fromisoformat(date_debut)
+    libelles_jours = np.array([(premier_jour + timedelta(days=jour)).isoformat() for jour in range(jours)])
+    references = np.array(references)
+    
+    ecrites = 0
+    with open(os.path.join(output_dir, 'ventes.csv'), 'w', encoding='utf-8') as f:
+        f.write("Date,ID Référence produit,Quantité,ID Magasin\n")
+        while ecrites < nombre_ventes:
+            taille = min(GENERATION_CHUNK_SIZE, nombre_ventes - ecrites)
+            jour_min = ecrites * jours // nombre_ventes
+            jour_max = max(jour_min + 1, (ecrites + taille) * jours // nombre_ventes)
+            jours_lot = np.sort(rng.integers(jour_min, jour_max, taille))
+            produits_lot = rng.choice(nombre_produits, taille, p=popularite_produits)
+            magasins_lot = rng.choice(nombre_magasins, taille, p=poids_magasins) + 1
+            quantites_lot = rng.geometric(0.35, taille)
+            
+            f.write('\n'.join(
+                f"{jour},{reference},{quantite},{magasin}"
+                for jour, reference, quantite, magasin in zip(
+                    libelles_jours[jours_lot].tolist(), references[produits_lot].tolist(),
+                    quantites_lot.tolist(), magasins_lot.tolist())
+            ))
+            f.write('\n')
+            ecrites += taille
+    
+    duree = time.perf_counter() - debut
+    description = {
+        'ventes': nombre_ventes,
+        'produits': nombre_produits,
+        'magasins': nombre_magasins,
+        'skew': skew,
+        'date_debut': date_debut,
+        'jours': jours,
+        'seed': seed
+    }
+    # Paramètres conservés avec les CSV: le benchmark régénère un jeu qui ne correspond plus
+    with open(os.path.join(output_dir, 'dataset.json'), 'w', encoding='utf-8') as f:
+        json.dump(description, f, indent=2)
+    
+    print(f"Jeu de données généré en {duree:.1f}s")
+    return {**description, 'dossier': output_dir, 'duree': round(duree, 3)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Génère magasins.csv, produits.csv et ventes.csv synthétiques")
+    parser.add_argument('--ventes', type=float, default=1e5, help="nombre de ventes (1e3 à 1e8)")
+    parser.add_argument('--produits', type=int, default=None, help="nombre de produits (défaut: selon le volume)")
+    parser.add_argument('--magasins', type=int, default=None, help="nombre de magasins (défaut: selon le volume)")
+    parser.add_argument('--skew', type=float, default=1.1, help="exposant de Zipf de la popularité des produits")
+    parser.add_argument('--date-debut', default='2020-01-01')
+    parser.add_argument('--jours', type=int, default=365, help="nombre de jours couverts")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sortie', default=None, help=f"dossier de sortie (défaut: {DEFAULT_OUTPUT_DIR}/<ventes>)")
+    args = parser.parse_args()
+    
+    nombre_ventes = int(args.ventes)
+    generate_dataset(args.sortie or os.path.join(DEFAULT_OUTPUT_DIR, str(nombre_ventes)),
+                     nombre_ventes, args.produits, args.magasins, args.skew, args.date_debut,
+                     args.jours, args.seed)
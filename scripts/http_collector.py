@@ -1,57 +1,349 @@
 #!/usr/bin/env python3
 
-import requests
+import hashlib
+import json
 import os
-from typing import Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, List, Optional
+from metrics import MetricsRecorder
+
+if TYPE_CHECKING:
+    import requests
+
+DEFAULT_FILES = ["magasins.csv", "produits.csv", "ventes.csv"]
+
+DOWNLOAD_BLOCK_SIZE = 64 * 1024
+
+STATUT_LOCAL = 'local'
+STATUT_TELECHARGE = 'telecharge'
+STATUT_NON_MODIFIE = 'non_modifie'
+STATUT_ERREUR = 'erreur'
 
 class DataCollector:
     
-    def __init__(self, base_url: str = "http://localhost:8000"):
+    def __init__(self, base_url: str = "http://localhost:8000", max_workers: int = 8, timeout: int = 30,
+                 cache_path: Optional[str] = ".http_cache.json", metrics: Optional[MetricsRecorder] = None):
         self.base_url = base_url
+        self.metrics = metrics or MetricsRecorder()
+        self.max_workers = max_workers
+        self.timeout = timeout
+        
+        # Import différé: requests n'est chargé que lorsqu'une collecte HTTP est configurée
+        import requests
+        from requests.adapters import HTTPAdapter
+        
+        # Session partagée: les connexions keep-alive sont réutilisées entre fichiers et threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        # Métadonnées par URL (ETag, Last-Modified, taille, hash) pour les requêtes conditionnelles
+        self.cache_path = cache_path
+        self._cache_lock = threading.Lock()
+        self._cache = self._load_cache()
+        
+    def _load_cache(self) -> dict:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Cache HTTP illisible, ignoré: {e}")
+            return {}
+    
+    def _save_cache_entry(self, url: str, entry: Optional[dict]):
+        if not self.cache_path:
+            return
+        with self._cache_lock:
+            if entry is None:
+                self._cache.pop(url, None)
+            else:
+                self._cache[url] = entry
+            temp_path = f"{self.cache_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._cache, f, indent=2)
+            os.replace(temp_path, self.cache_path)
+    
+    def _conditional_headers(self, filename: str, url: str) -> dict:
+        with self._cache_lock:
+            entry = self._cache.get(url)
+        if entry is None or entry.get('fichier') != filename or not os.path.exists(filename):
+            return {}
+        
+        # La copie locale doit être celle décrite par le cache, sinon on retélécharge
+        stat = os.stat(filename)
+        if stat.st_size != entry.get('taille') or stat.st_mtime_ns != entry.get('mtime_ns'):
+            return {}
+        
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
         
     def download_csv(self, filename: str, url: Optional[str] = None) -> bool:
+        return self.collect_file(filename, url)['succes']
+    
+    def collect_file(self, filename: str, url: Optional[str] = None) -> dict:
+        import requests
+        
         if url is None:
             url = f"{self.base_url}/{filename}"
             
         print(f"Téléchargement de {filename} depuis {url}...")
         
+        resultat = {'fichier': filename, 'url': url, 'statut': STATUT_ERREUR, 'succes': False,
+                    'octets': 0, 'duree': 0.0, 'reprise': False}
+        debut = time.perf_counter()
+        
         try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
+            octets = self._stream_to_file(filename, url, resultat)
             
-            with open(filename, 'wb') as f:
-                f.write(response.content)
-                
-            print(f"{filename} téléchargé avec succès ({len(response.content)} bytes)")
-            return True
+            resultat['succes'] = True
+            if octets is None:
+                resultat['statut'] = STATUT_NON_MODIFIE
+                print(f"{filename} non modifié sur le serveur (304), transfert évité")
+            else:
+                resultat['statut'] = STATUT_TELECHARGE
+                resultat['octets'] = octets
+                self.metrics.count('octets_telecharges', octets)
+                print(f"{filename} téléchargé avec succès ({octets} bytes)")
             
         except requests.exceptions.RequestException as e:
             print(f"Erreur lors du téléchargement de {filename}: {e}")
-            return False
         except Exception as e:
             print(f"Erreur inattendue pour {filename}: {e}")
-            return False
+        
+        resultat['duree'] = round(time.perf_counter() - debut, 3)
+        self.metrics.count(f"fichiers_{resultat['statut']}")
+        return resultat
+    
+    def _stream_to_file(self, filename: str, url: str, resultat: dict) -> Optional[int]:
+        # Le corps est écrit par blocs dans un fichier .part, renommé atomiquement à la fin;
+        # un .part laissé par un transfert interrompu est repris avec une requête Range
+        partial_path = f"{filename}.part"
+        validator_path = f"{partial_path}.validator"
+        
+        deja_recus = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        if deja_recus and os.path.exists(validator_path):
+            with open(validator_path, 'r', encoding='utf-8') as f:
+                validator = f.read().strip()
+            # If-Range: le serveur renvoie tout le fichier (200) s'il a changé entre-temps
+            headers = {'Range': f'bytes={deja_recus}-', 'If-Range': validator}
+        else:
+            headers = self._conditional_headers(filename, url)
+        
+        with self.session.get(url, timeout=self.timeout, stream=True, headers=headers) as response:
+            if response.status_code == 304:
+                return None
+            if response.status_code == 416 and 'Range' in headers:
+                # Reprise au-delà de la fin: le .part (du même fichier, If-Range ayant été vérifié)
+                # est complet si sa taille est celle annoncée (Content-Range: bytes */N)
+                if self._complete_length(response) == deja_recus:
+                    print(f"{filename}.part déjà complet, transfert évité")
+                    return self._commit_partial(filename, url, validator, response, deja_recus)
+                print(f"{filename}.part ne correspond plus au fichier du serveur: téléchargement complet")
+                self._discard_partial(filename)
+                return self._stream_to_file(filename, url, resultat)
+            if 400 <= response.status_code < 500:
+                # Fichier absent ou requête refusée: un transfert interrompu ne sera pas repris
+                self._discard_partial(filename)
+            response.raise_for_status()
+            
+            empreinte = hashlib.sha256()
+            if response.status_code == 206 and self._range_start(response) == deja_recus:
+                mode = 'ab'
+                resultat['reprise'] = True
+                print(f"Reprise de {filename} à partir de l'octet {deja_recus}")
+                with open(partial_path, 'rb') as f:
+                    for bloc in iter(lambda: f.read(DOWNLOAD_BLOCK_SIZE), b''):
+                        empreinte.update(bloc)
+            else:
+                mode = 'wb'
+                deja_recus = 0
+                validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+                if validator:
+                    with open(validator_path, 'w', encoding='utf-8') as f:
+                        f.write(validator)
+                elif os.path.exists(validator_path):
+                    os.remove(validator_path)
+            
+            octets = deja_recus
+            with open(partial_path, mode) as f:
+                for bloc in response.iter_content(chunk_size=DOWNLOAD_BLOCK_SIZE):
+                    f.write(bloc)
+                    empreinte.update(bloc)
+                    octets += len(bloc)
+                f.flush()
+                os.fsync(f.fileno())
+            
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+        
+        self._commit_download(filename, url, etag, last_modified, octets, empreinte)
+        return octets
+    
+    def _commit_partial(self, filename: str, url: str, validator: str, response: 'requests.Response',
+                        octets: int) -> int:
+        empreinte = hashlib.sha256()
+        with open(f"{filename}.part", 'rb') as f:
+            for bloc in iter(lambda: f.read(DOWNLOAD_BLOCK_SIZE), b''):
+                empreinte.update(bloc)
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            # Validateur du transfert interrompu: un ETag est entre guillemets (éventuellement faible)
+            if validator.startswith(('"', 'W/"')):
+                etag = validator
+            else:
+                last_modified = validator
+        self._commit_download(filename, url, etag, last_modified, octets, empreinte)
+        return octets
+    
+    @staticmethod
+    def _discard_partial(filename: str):
+        for chemin in (f"{filename}.part", f"{filename}.part.validator"):
+            if os.path.exists(chemin):
+                os.remove(chemin)
+    
+    def _commit_download(self, filename: str, url: str, etag: Optional[str], last_modified: Optional[str],
+                         octets: int, empreinte):
+        partial_path = f"{filename}.part"
+        validator_path = f"{partial_path}.validator"
+        os.replace(partial_path, filename)
+        if os.path.exists(validator_path):
+            os.remove(validator_path)
+        
+        if etag or last_modified:
+            self._save_cache_entry(url, {
+                'fichier': filename,
+                'etag': etag,
+                'last_modified': last_modified,
+                'taille': octets,
+                'sha256': empreinte.hexdigest(),
+                'mtime_ns': os.stat(filename).st_mtime_ns
+            })
+        else:
+            self._save_cache_entry(url, None)
+    
+    @contextmanager
+    def open_lines(self, filename: str, url: Optional[str] = None):
+        # Comme collect_file (requête conditionnelle, copie locale remplacée atomiquement), le corps
+        # étant aussi rendu ligne à ligne au fil de la réception; None si non modifié (304).
+        # La copie locale n'est remplacée que si toutes les lignes ont été lues
+        if url is None:
+            url = f"{self.base_url}/{filename}"
+        
+        print(f"Téléchargement de {filename} depuis {url} (lecture au fil de la réception)...")
+        partial_path = f"{filename}.part"
+        with self.session.get(url, timeout=self.timeout, stream=True,
+                              headers=self._conditional_headers(filename, url)) as response:
+            if response.status_code == 304:
+                print(f"{filename} non modifié sur le serveur (304), transfert évité")
+                self.metrics.count(f"fichiers_{STATUT_NON_MODIFIE}")
+                yield None
+                return
+            response.raise_for_status()
+            
+            empreinte = hashlib.sha256()
+            recu = {'octets': 0, 'complet': False}
+            with open(partial_path, 'wb') as f:
+                def lignes():
+                    reste = b''
+                    for bloc in response.iter_content(chunk_size=DOWNLOAD_BLOCK_SIZE):
+                        f.write(bloc)
+                        empreinte.update(bloc)
+                        recu['octets'] += len(bloc)
+                        morceaux = (reste + bloc).split(b'\n')
+                        reste = morceaux.pop()
+                        for morceau in morceaux:
+                            yield morceau.decode('utf-8') + '\n'
+                    if reste:
+                        yield reste.decode('utf-8')
+                    recu['complet'] = True
+                
+                try:
+                    yield lignes()
+                except BaseException:
+                    recu['complet'] = False
+                    raise
+                finally:
+                    # Lecture interrompue (erreur ou arrêt du lecteur): la copie locale est gardée telle quelle
+                    if not recu['complet']:
+                        f.close()
+                        os.remove(partial_path)
+                if not recu['complet']:
+                    return
+                f.flush()
+                os.fsync(f.fileno())
+            
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+        
+        self._commit_download(filename, url, etag, last_modified, recu['octets'], empreinte)
+        self.metrics.count('octets_telecharges', recu['octets'])
+        self.metrics.count(f"fichiers_{STATUT_TELECHARGE}")
+        print(f"{filename} téléchargé avec succès ({recu['octets']} bytes)")
+    
+    @staticmethod
+    def _complete_length(response: 'requests.Response') -> Optional[int]:
+        # Content-Range d'une réponse 416: bytes */5000
+        content_range = response.headers.get('Content-Range', '')
+        try:
+            return int(content_range.split('/')[1])
+        except (IndexError, ValueError):
+            return None
+    
+    @staticmethod
+    def _range_start(response: 'requests.Response') -> Optional[int]:
+        # Content-Range: bytes 1000-4999/5000
+        content_range = response.headers.get('Content-Range', '')
+        try:
+            return int(content_range.split()[1].split('-')[0])
+        except (IndexError, ValueError):
+            return None
+    
+    def collect_files(self, filenames: List[str], max_workers: Optional[int] = None) -> dict:
+        max_workers = max_workers or self.max_workers
+        debut = time.perf_counter()
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            fichiers = list(executor.map(self.collect_file, filenames))
+        
+        succes = sum(1 for fichier in fichiers if fichier['succes'])
+        return {
+            'fichiers': fichiers,
+            'succes': succes,
+            'non_modifies': sum(1 for fichier in fichiers if fichier['statut'] == STATUT_NON_MODIFIE),
+            'echecs': len(fichiers) - succes,
+            'octets': sum(fichier['octets'] for fichier in fichiers),
+            'duree_totale': round(time.perf_counter() - debut, 3),
+            'concurrence': max_workers
+        }
     
-    def collect_all_data(self) -> bool:
+    def collect_all_data(self, max_workers: Optional[int] = None) -> bool:
         print("Début de la collecte des données via HTTP")
         print("=" * 50)
         
-        files_to_download = [
-            "magasins.csv",
-            "produits.csv", 
-            "ventes.csv"
-        ]
+        files_to_download = DEFAULT_FILES
         
-        success_count = 0
+        summary = self.collect_files(files_to_download, max_workers)
         
-        for filename in files_to_download:
-            if self.download_csv(filename):
-                success_count += 1
+        for fichier in summary['fichiers']:
+            statut = {STATUT_TELECHARGE: "OK", STATUT_NON_MODIFIE: "NON MODIFIE"}.get(fichier['statut'], "ECHEC")
+            print(f"  - {fichier['fichier']}: {statut}, {fichier['octets']} bytes en {fichier['duree']}s")
         
         print("=" * 50)
-        print(f"Collecte terminée: {success_count}/{len(files_to_download)} fichiers téléchargés")
+        print(f"Collecte terminée: {summary['succes']}/{len(files_to_download)} fichiers téléchargés "
+              f"en {summary['duree_totale']}s")
         
-        if success_count == len(files_to_download):
+        if summary['succes'] == len(files_to_download):
             print("Tous les fichiers ont été téléchargés avec succès")
             return True
         else:
@@ -62,14 +354,13 @@ class DataCollector:
         print("Création d'un serveur HTTP local pour les tests...")
         
         try:
-            from http.server import HTTPServer, SimpleHTTPRequestHandler
+            from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
             import threading
             import time
             
-            csv_files = ["magasins.csv", "produits.csv", "ventes.csv"]
             missing_files = []
             
-            for file in csv_files:
+            for file in DEFAULT_FILES:
                 if not os.path.exists(file):
                     missing_files.append(file)
             
@@ -77,7 +368,7 @@ class DataCollector:
                 print(f"Fichiers manquants: {missing_files}")
                 return False
             
-            server = HTTPServer(('localhost', 8000), SimpleHTTPRequestHandler)
+            server = ThreadingHTTPServer(('localhost', 8000), SimpleHTTPRequestHandler)
             
             def run_server():
                 print("Serveur HTTP démarré sur http://localhost:8000")
@@ -1,155 +1,1093 @@
 #!/usr/bin/env python3
 
-import pandas as pd
+import csv
+import glob
+import hashlib
+import io
+import itertools
+import os
+import queue
 import sqlite3
-import requests
-from database import DatabaseManager
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date
+from typing import TYPE_CHECKING, Optional
+from database import DatabaseManager, REGIONS, REGION_INCONNUE
+from metrics import instrumented
+from http_collector import DataCollector, STATUT_LOCAL, STATUT_ERREUR, STATUT_NON_MODIFIE
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+VENTE_CSV_COLUMNS = ['Date', 'ID_Reference_Produit', 'Quantite', 'ID_Magasin']
+
+# Lecture des CSV: pandas, ou module csv de la bibliothèque standard (démarrage rapide,
+# sans dépendance à pandas)
+CSV_BACKENDS = ('pandas', 'csv')
+
+FINGERPRINT_BLOCK_SIZE = 1024 * 1024
+
+# Import multi-fichiers: les fichiers sont regroupés en tâches d'au plus ~1 Mo ou 1000 fichiers,
+# chacune analysée par un processus puis écrite en une transaction
+MULTI_FILE_TASK_BYTES = 1024 * 1024
+MULTI_FILE_TASK_FILES = 1000
+
+# Exemples de lignes rejetées conservés par fichier
+MAX_REJECTED_EXAMPLES = 5
+
+# Table des prix de chaque processus d'analyse, transmise une seule fois à son démarrage
+_prix_produits_processus = {}
+
+def _init_parse_process(prix_produits: dict):
+    global _prix_produits_processus
+    _prix_produits_processus = prix_produits
+
+def _validate_vente(row: list) -> tuple:
+    # (jour, référence, quantité, magasin) d'une ligne de ventes, ou ValueError donnant le motif du rejet.
+    # Contrôles communs à tous les lecteurs, y compris les contraintes de VENTE (Quantite > 0)
+    if len(row) != len(VENTE_CSV_COLUMNS):
+        raise ValueError(f"{len(row)} colonnes au lieu de {len(VENTE_CSV_COLUMNS)}")
+    jour, reference, quantite, magasin = row
+    try:
+        quantite_vendue = int(quantite)
+        numero_magasin = int(magasin)
+    except ValueError:
+        raise ValueError(f"quantité ou magasin non entier ({quantite}, {magasin})") from None
+    if quantite_vendue <= 0:
+        raise ValueError(f"quantité non positive ({quantite_vendue})")
+    try:
+        if len(jour) != 10:
+            raise ValueError
+        date.fromisoformat(jour)
+    except ValueError:
+        raise ValueError(f"date invalide ({jour})") from None
+    return jour, reference, quantite_vendue, numero_magasin
+
+def _read_report() -> dict:
+    # Bilan de lecture d'un fichier de ventes: lignes de données lues (rejetées comprises), rejets
+    return {'lignes': 0, 'rejets': 0, 'exemples_rejets': []}
+
+def _record_reject(rapport: dict, position: str, message: str):
+    rapport['rejets'] += 1
+    if len(rapport['exemples_rejets']) < MAX_REJECTED_EXAMPLES:
+        rapport['exemples_rejets'].append(f"{position}: {message}")
+
+def _parse_ventes_files(segments: list) -> list:
+    return [_parse_ventes_file(csv_file, offset, lignes_deja_importees, fin=fin, source=source)
+            for csv_file, source, offset, lignes_deja_importees, fin in segments]
+
+def _parse_ventes_file(csv_file: str, offset: int, lignes_deja_importees: Optional[int],
+                       prix_produits: Optional[dict] = None, lignes_completes: bool = False,
+                       fin: Optional[int] = None, source: Optional[str] = None) -> dict:
+    # Lecture, validation et calcul du montant, sans accès à la base (exécuté dans un processus du pool).
+    # lignes_completes: une dernière ligne sans fin de ligne, peut-être en cours d'écriture, est laissée
+    # pour la lecture suivante.
+    # fin: seules les lignes commençant avant cet octet sont lues (segment d'un gros fichier).
+    # lignes_deja_importees None: segment suivant d'un fichier, commençant à la première ligne après
+    # offset; ses ventes sont numérotées depuis le début du segment et renumérotées par l'écrivain.
+    # source: nom du fichier dans la base (DatabaseManager.source_name), csv_file par défaut
+    debut = time.perf_counter()
+    suite = lignes_deja_importees is None
+    resultat = {'fichier': csv_file, 'offset': offset, 'lignes_deja_importees': lignes_deja_importees,
+                'references_inconnues': 0, 'ventes': [], **_read_report()}
+    if prix_produits is None:
+        prix_produits = _prix_produits_processus
+    if source is None:
+        source = csv_file
+    ventes = resultat['ventes']
+    if suite:
+        lignes_deja_importees = 0
+    
+    def rejeter(numero: int, message: str):
+        _record_reject(resultat, f"ligne {numero} après l'octet {offset}" if suite else f"ligne {numero}", message)
+    
+    try:
+        with open(csv_file, 'rb') as f:
+            if suite and offset:
+                # La ligne commencée avant le segment appartient au segment précédent
+                f.seek(offset - 1)
+                if f.read(1) != b'\n':
+                    f.readline()
+                offset = resultat['offset'] = f.tell()
+            else:
+                f.seek(offset)
+            if fin is None:
+                donnees = f.read()
+            else:
+                donnees = f.read(max(0, fin - offset))
+                if donnees and not donnees.endswith(b'\n'):
+                    donnees += f.readline()
+        if lignes_completes:
+            donnees = donnees[:donnees.rfind(b'\n') + 1]
+        resultat['octets'] = offset + len(donnees)
+        
+        reader = csv.reader(io.StringIO(donnees.decode('utf-8'), newline=''))
+        if offset == 0:
+            next(reader, None)
+        # Numéros de ligne dans le fichier, en-tête et lignes déjà importées comprises
+        decalage = lignes_deja_importees + 1 if offset and not suite else 0
+        for row in reader:
+            if not row:
+                continue
+            resultat['lignes'] += 1
+            try:
+                jour, reference, quantite, magasin = _validate_vente(row)
+            except ValueError as e:
+                rejeter(reader.line_num + decalage, str(e))
+                continue
+            prix = prix_produits.get(reference)
+            if prix is None:
+                # Comme l'import d'un seul fichier: la vente est gardée, au montant nul
+                resultat['references_inconnues'] += 1
+                prix = 0
+            ventes.append((jour, reference, quantite, magasin, quantite * prix, source,
+                           lignes_deja_importees + resultat['lignes']))
+        resultat['statut'] = 'analyse'
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        resultat['statut'] = 'erreur'
+        resultat['erreur'] = str(e)
+        resultat['ventes'] = []
+    
+    resultat['duree_analyse'] = round(time.perf_counter() - debut, 4)
+    return resultat
+
+class _BoundedReader(io.RawIOBase):
+    # Lecture de f arrêtée à l'octet fin: les lecteurs CSV s'arrêtent avant une dernière ligne
+    # en cours d'écriture, même si le fichier grandit pendant l'import
+    def __init__(self, f, fin: int):
+        self.f = f
+        self.fin = fin
+    
+    def readable(self) -> bool:
+        return True
+    
+    def seekable(self) -> bool:
+        return True
+    
+    def readinto(self, tampon) -> int:
+        return self.f.readinto(memoryview(tampon)[:max(0, self.fin - self.f.tell())])
+    
+    def seek(self, position: int, whence: int = io.SEEK_SET) -> int:
+        return self.f.seek(position, whence)
+    
+    def tell(self) -> int:
+        return self.f.tell()
 
 class DataImporter:
     
-    def __init__(self, db_manager: DatabaseManager, use_http: bool = False, base_url: str = "http://localhost:8000"):
+    def __init__(self, db_manager: DatabaseManager, use_http: bool = False, base_url: str = "http://localhost:8000",
+                 http_workers: int = 8, csv_backend: str = 'pandas'):
+        if csv_backend not in CSV_BACKENDS:
+            raise ValueError(f"Lecteur CSV inconnu: {csv_backend} (attendu: {', '.join(CSV_BACKENDS)})")
+        
         self.db_manager = db_manager
+        self.csv_backend = csv_backend
+        self.metrics = db_manager.metrics
         self.use_http = use_http
         self.base_url = base_url
+        self.collector = DataCollector(base_url, max_workers=http_workers, metrics=self.metrics) if use_http else None
+        self._prefetched = {}
+        # Prix des produits pour parse_ventes_file, rechargés après un import des produits
+        self._prix_produits = None
+        
+    @instrumented('collecte_http')
+    def prefetch_via_http(self, filenames: list, max_workers: Optional[int] = None) -> dict:
+        if not self.use_http:
+            return {}
+        
+        print(f"Collecte HTTP concurrente de {len(filenames)} fichiers depuis {self.base_url}...")
+        summary = self.collector.collect_files(filenames, max_workers)
+        for fichier in summary['fichiers']:
+            if fichier['succes']:
+                self._prefetched[fichier['fichier']] = fichier['statut']
+        print(f"{summary['succes']}/{len(filenames)} fichiers collectés en {summary['duree_totale']}s")
+        return summary
         
-    def _collect_csv_via_http(self, filename: str) -> bool:
+    def _collect_csv_via_http(self, filename: str) -> str:
         if not self.use_http:
+            return STATUT_LOCAL
+        
+        if filename in self._prefetched:
+            return self._prefetched.pop(filename)
+        
+        return self.collector.collect_file(filename)['statut']
+    
+    def _skip_after_collect(self, csv_file: str) -> bool:
+        statut = self._collect_csv_via_http(csv_file)
+        if statut == STATUT_ERREUR:
+            print(f"Impossible de collecter {csv_file} via HTTP")
             return True
-            
-        url = f"{self.base_url}/{filename}"
-        print(f"Collecte HTTP de {filename} depuis {url}...")
         
-        try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            
-            with open(filename, 'wb') as f:
-                f.write(response.content)
-                
-            print(f"{filename} collecté via HTTP ({len(response.content)} bytes)")
+        # Un 304 ne dispense de l'import que si ce fichier a déjà été entièrement ingéré
+        if statut == STATUT_NON_MODIFIE and self._already_ingested(csv_file):
+            print(f"{csv_file} non modifié sur le serveur: import ignoré")
             return True
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Erreur collecte HTTP de {filename}: {e}")
-            return False
-        except Exception as e:
-            print(f"Erreur inattendue pour {filename}: {e}")
-            return False
+        return False
+    
+    def _already_ingested(self, csv_file: str) -> bool:
+        etat = self._ingestion_state(csv_file)
+        return etat is not None and etat['octets_consommes'] == os.path.getsize(csv_file)
         
-    def import_magasins(self, csv_file: str = "magasins.csv"):
+    @instrumented('import_magasins')
+    def import_magasins(self, csv_file: str = "magasins.csv", delta: bool = False, incremental: bool = True):
         print(f"Import des magasins depuis {csv_file}...")
         
-        if not self._collect_csv_via_http(csv_file):
-            print(f"Impossible de collecter {csv_file} via HTTP")
+        if self._skip_after_collect(csv_file):
             return
         
-        try:
-            df = pd.read_csv(csv_file)
-            df.columns = ['ID_Magasin', 'Ville', 'Nombre_Salaries']
-            df['Region'] = df['Ville'].apply(self.db_manager.get_region_from_city)
-            
-            cursor = self.db_manager.connection.cursor()
-            
-            for _, row in df.iterrows():
-                cursor.execute("""
+        if incremental and self._source_unchanged(csv_file):
+            print(f"{csv_file} inchangé depuis le dernier import: import ignoré")
+            return
+        
+        with self.db_manager.writer():
+            try:
+                # CSV: ID Magasin, Ville, Nombre de salariés
+                magasins = [(id_magasin, ville, salaries, REGIONS.get(ville, REGION_INCONNUE))
+                            for id_magasin, ville, salaries in self._read_reference_csv(csv_file, (int, str, int))]
+                self.metrics.count('lignes', len(magasins))
+                self._save_source_state(csv_file, os.path.getsize(csv_file), len(magasins))
+                
+                if delta:
+                    return self._import_delta(magasins, 'MAGASIN', 'ID_Magasin', 
+                                              ['Ville', 'Nombre_Salaries', 'Region'], 'magasins')
+                
+                cursor = self.db_manager.connection.cursor()
+                
+                cursor.executemany("""
                     INSERT OR REPLACE INTO MAGASIN 
                     (ID_Magasin, Ville, Nombre_Salaries, Region)
                     VALUES (?, ?, ?, ?)
-                """, (row['ID_Magasin'], row['Ville'], 
-                     row['Nombre_Salaries'], row['Region']))
-            
-            self.db_manager.connection.commit()
-            print(f"{len(df)} magasins importés avec succès")
-            
-        except Exception as e:
-            print(f"Erreur lors de l'import des magasins: {e}")
-            self.db_manager.connection.rollback()
-            raise
+                """, magasins)
+                self.db_manager.bump_data_version(cursor)
+                
+                self.db_manager.commit()
+                print(f"{len(magasins)} magasins importés avec succès")
+                
+            except Exception as e:
+                print(f"Erreur lors de l'import des magasins: {e}")
+                self.db_manager.rollback()
+                raise
     
-    def import_produits(self, csv_file: str = "produits.csv"):
+    @instrumented('import_produits')
+    def import_produits(self, csv_file: str = "produits.csv", delta: bool = False, incremental: bool = True):
         print(f"Import des produits depuis {csv_file}...")
+        self._prix_produits = None
         
-        if not self._collect_csv_via_http(csv_file):
-            print(f"Impossible de collecter {csv_file} via HTTP")
+        if self._skip_after_collect(csv_file):
             return
         
-        try:
-            df = pd.read_csv(csv_file)
-            df.columns = ['Nom', 'ID_Reference', 'Prix', 'Stock']
-            
-            cursor = self.db_manager.connection.cursor()
-            
-            for _, row in df.iterrows():
-                cursor.execute("""
+        if incremental and self._source_unchanged(csv_file):
+            print(f"{csv_file} inchangé depuis le dernier import: import ignoré")
+            return
+        
+        with self.db_manager.writer():
+            try:
+                # CSV: Nom, ID Référence produit, Prix, Stock
+                produits = [(reference, nom, prix, stock)
+                            for nom, reference, prix, stock in self._read_reference_csv(csv_file, (str, str, float, int))]
+                self.metrics.count('lignes', len(produits))
+                self._save_source_state(csv_file, os.path.getsize(csv_file), len(produits))
+                
+                if delta:
+                    return self._import_delta(produits, 'PRODUIT', 'ID_Reference', 
+                                              ['Nom', 'Prix', 'Stock'], 'produits')
+                
+                cursor = self.db_manager.connection.cursor()
+                
+                cursor.executemany("""
                     INSERT OR REPLACE INTO PRODUIT 
                     (ID_Reference, Nom, Prix, Stock)
                     VALUES (?, ?, ?, ?)
-                """, (row['ID_Reference'], row['Nom'], 
-                     row['Prix'], row['Stock']))
-            
-            self.db_manager.connection.commit()
-            print(f"{len(df)} produits importés avec succès")
-            
-        except Exception as e:
-            print(f"Erreur lors de l'import des produits: {e}")
-            self.db_manager.connection.rollback()
-            raise
+                """, produits)
+                self.db_manager.bump_data_version(cursor)
+                
+                self.db_manager.commit()
+                print(f"{len(produits)} produits importés avec succès")
+                
+            except Exception as e:
+                print(f"Erreur lors de l'import des produits: {e}")
+                self.db_manager.rollback()
+                raise
     
-    def import_ventes(self, csv_file: str = "ventes.csv"):
+    def _import_delta(self, records: list, table: str, key: str, columns: list, label: str) -> dict:
+        # records: tuples (clé, *columns); comparés aux lignes existantes, indexées par clé
+        cursor = self.db_manager.connection.cursor()
+        
+        cursor.execute(f"SELECT {key}, {', '.join(columns)} FROM {table}")
+        existant = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+        
+        nouveaux = []
+        modifies = []
+        anciens_prix = {}
+        cles = set()
+        for record in records:
+            cle, valeurs = record[0], tuple(record[1:])
+            cles.add(cle)
+            actuel = existant.get(cle)
+            if actuel is None:
+                nouveaux.append(record)
+            elif actuel != valeurs:
+                modifies.append(valeurs + (cle,))
+                if table == 'PRODUIT':
+                    anciens_prix[cle] = actuel[columns.index('Prix')]
+        supprimes = [(cle,) for cle in existant if cle not in cles]
+        communs = len(cles) - len(nouveaux)
+        
+        if nouveaux:
+            cursor.executemany(f"""
+                INSERT INTO {table} ({key}, {', '.join(columns)})
+                VALUES ({', '.join('?' * (len(columns) + 1))})
+            """, nouveaux)
+        
+        if modifies:
+            cursor.executemany(f"""
+                UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns)}
+                WHERE {key} = ?
+            """, modifies)
+        
+        if supprimes:
+            cursor.executemany(f"DELETE FROM {table} WHERE {key} = ?", supprimes)
+        
+        ventes_recalculees = 0
+        if anciens_prix:
+            indice_prix = columns.index('Prix')
+            ventes_recalculees = self._reprice_ventes(cursor, [
+                modifie[-1] for modifie in modifies if modifie[indice_prix] != anciens_prix[modifie[-1]]
+            ])
+        
+        if nouveaux or modifies or supprimes:
+            self.db_manager.bump_data_version(cursor)
+        self.db_manager.commit()
+        
+        resultat = {
+            'inseres': len(nouveaux),
+            'modifies': len(modifies),
+            'supprimes': len(supprimes),
+            'inchanges': communs - len(modifies)
+        }
+        print(f"Synchronisation des {label}: {resultat['inseres']} insérés, "
+              f"{resultat['modifies']} modifiés, {resultat['supprimes']} supprimés, "
+              f"{resultat['inchanges']} inchangés")
+        if table == 'PRODUIT':
+            resultat['ventes_recalculees'] = ventes_recalculees
+            if ventes_recalculees:
+                print(f"{ventes_recalculees} ventes recalculées suite aux changements de prix")
+        return resultat
+    
+    def _reprice_ventes(self, cursor: sqlite3.Cursor, references: list) -> int:
+        if not references:
+            return 0
+        
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS produits_reprix (ID_Reference TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM temp.produits_reprix")
+        cursor.executemany("INSERT INTO temp.produits_reprix VALUES (?)", 
+                           [(reference,) for reference in references])
+        
+        ventes_recalculees = 0
+        for table in self.db_manager.vente_tables():
+            cursor.execute(f"""
+                UPDATE {table} 
+                SET Montant_Total = Quantite * (
+                    SELECT Prix FROM PRODUIT WHERE ID_Reference = {table}.ID_Reference_Produit
+                )
+                WHERE ID_Reference_Produit IN (SELECT ID_Reference FROM temp.produits_reprix)
+            """)
+            ventes_recalculees += cursor.rowcount
+        
+        self.db_manager.rebuild_sales_cube(cursor, produits_table='temp.produits_reprix')
+        self.db_manager.rebuild_sketches(cursor, produits_table='temp.produits_reprix')
+        return ventes_recalculees
+    
+    @instrumented('import_ventes')
+    def import_ventes(self, csv_file: str = "ventes.csv", chunksize: Optional[int] = None,
+                      incremental: bool = True, final: bool = False):
+        # Seules les lignes complètes sont lues: une dernière ligne sans fin de ligne peut être en cours
+        # d'écriture et attend l'import suivant. final (fichier terminé, comme ventes.csv livré sans
+        # fin de ligne finale): elle est importée aussi, ou laissée en attente si elle est rejetée
         print(f"Import des ventes depuis {csv_file}...")
         
-        if not self._collect_csv_via_http(csv_file):
-            print(f"Impossible de collecter {csv_file} via HTTP")
+        if self._skip_after_collect(csv_file):
             return
         
+        etat = self._ingestion_state(csv_file) if incremental else None
+        offset = self._resume_offset(csv_file, etat)
+        lignes_deja_importees = etat['nombre_lignes'] if offset else 0
+        taille = os.path.getsize(csv_file)
+        fin_lignes = self._complete_lines_end(csv_file, taille)
+        if offset >= (taille if final else fin_lignes):
+            print("Aucune nouvelle ligne depuis le dernier import")
+            return
+        source = self.db_manager.source_name(csv_file)
+        if offset:
+            print(f"Reprise après {lignes_deja_importees} lignes déjà importées (octet {offset})")
+        elif etat is not None:
+            print(f"{csv_file} a été modifié depuis le dernier import: relecture complète")
+        
+        with self.db_manager.writer():
+            try:
+                cursor = self.db_manager.connection.cursor()
+                prix_produits = self._load_prix_produits(cursor)
+                
+                rapport = _read_report()
+                nouvelles_ventes = 0
+                octets_consommes = offset
+                if fin_lignes > offset:
+                    with open(csv_file, 'rb') as f:
+                        f.seek(offset)
+                        lecture = _BoundedReader(f, fin_lignes)
+                        if chunksize:
+                            nouvelles_ventes = self._import_ventes_streaming(
+                                lecture, offset, chunksize, cursor, prix_produits, source, lignes_deja_importees,
+                                rapport
+                            )
+                        else:
+                            for ventes in self._read_ventes_batches(lecture, offset, prix_produits, source,
+                                                                    lignes_deja_importees, rapport):
+                                nouvelles_ventes += self._insert_ventes_records(cursor, ventes)
+                    octets_consommes = fin_lignes
+                nombre_lignes = lignes_deja_importees + rapport['lignes']
+                
+                if final and taille > octets_consommes:
+                    octets_consommes, nombre_lignes, nouvelles_queue = self._import_ventes_tail(
+                        cursor, csv_file, octets_consommes, nombre_lignes, prix_produits
+                    )
+                    nouvelles_ventes += nouvelles_queue
+                
+                self._save_source_state(csv_file, octets_consommes, nombre_lignes, sampled=True)
+                self.db_manager.commit()
+                
+                self._report_rejects(rapport)
+                if nouvelles_ventes:
+                    print(f"{nouvelles_ventes} nouvelles ventes importées")
+                else:
+                    print("Aucune nouvelle vente à importer (toutes existent déjà)")
+                
+            except Exception as e:
+                print(f"Erreur lors de l'import des ventes: {e}")
+                self.db_manager.rollback()
+                raise
+    
+    @instrumented('import_ventes_fichiers')
+    def import_ventes_files(self, source: str, processes: Optional[int] = None,
+                            incremental: bool = True) -> dict:
+        # source: dossier (tous ses *.csv) ou motif glob. L'analyse des fichiers est répartie sur un
+        # pool de processus; ce processus reste l'unique écrivain SQLite
+        fichiers = self._resolve_ventes_files(source)
+        processes = processes or os.cpu_count() or 1
+        print(f"Import de {len(fichiers)} fichiers de ventes depuis {source} ({processes} processus)...")
+        
+        debut = time.perf_counter()
+        resultats = []
+        taches = []
+        tache = []
+        taille_tache = 0
+        etats = self.db_manager.get_ingestion_states() if incremental else {}
+        for csv_file in fichiers:
+            nom_source = self.db_manager.source_name(csv_file)
+            offset, lignes_deja_importees = self.resume_position(csv_file, etats.get(nom_source))
+            taille = os.path.getsize(csv_file)
+            if offset and offset == taille:
+                resultats.append({'fichier': csv_file, 'statut': 'inchange', 'lignes': 0, 'rejets': 0})
+                continue
+            # Un gros fichier est découpé en segments: chaque processus ne lit qu'environ
+            # MULTI_FILE_TASK_BYTES par tâche, et les lots reviennent à l'écrivain au fil de la lecture
+            debut_segment = offset
+            while debut_segment < taille:
+                fin = min(taille, debut_segment + MULTI_FILE_TASK_BYTES - taille_tache)
+                tache.append((csv_file, nom_source, debut_segment,
+                              lignes_deja_importees if debut_segment == offset else None, fin if fin < taille else None))
+                taille_tache += fin - debut_segment
+                debut_segment = fin
+                if taille_tache >= MULTI_FILE_TASK_BYTES or len(tache) >= MULTI_FILE_TASK_FILES:
+                    taches.append(tache)
+                    tache = []
+                    taille_tache = 0
+        if tache:
+            taches.append(tache)
+        
+        cursor = self.db_manager.connection.cursor()
+        prix_produits = self._load_prix_produits(cursor)
+        nouvelles_ventes = 0
+        # Lignes lues de chaque fichier jusqu'au dernier segment reçu (None: segment illisible)
+        lignes_fichiers = {}
+        
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_parse_process,
+                                 initargs=(prix_produits,)) as executor:
+            # Fenêtre bornée de tâches en cours: les lots analysés n'attendent pas l'écrivain sans limite,
+            # et sont écrits dans l'ordre des fichiers
+            restantes = iter(taches)
+            en_cours = deque(executor.submit(_parse_ventes_files, tache)
+                             for tache in itertools.islice(restantes, 2 * processes))
+            try:
+                while en_cours:
+                    lot = en_cours.popleft().result()
+                    suivante = next(restantes, None)
+                    if suivante is not None:
+                        en_cours.append(executor.submit(_parse_ventes_files, suivante))
+                    for resultat in lot:
+                        self._number_segment(resultat, lignes_fichiers)
+                    nouvelles_ventes += self.write_parsed_ventes(lot)
+                    resultats.extend(lot)
+            except BaseException:
+                for future in en_cours:
+                    future.cancel()
+                raise
+        
+        # Un résultat par fichier
+        resultats = self._merge_segments(resultats)
+        duree = time.perf_counter() - debut
+        lignes_lues = sum(resultat['lignes'] for resultat in resultats)
+        for resultat in resultats:
+            resultat.pop('ventes', None)
+            if resultat['statut'] == 'erreur':
+                print(f"   {resultat['fichier']}: erreur de lecture ({resultat['erreur']})")
+            elif resultat['rejets']:
+                print(f"   {resultat['fichier']}: {resultat['rejets']} lignes rejetées "
+                      f"({'; '.join(resultat['exemples_rejets'])})")
+        
+        statuts = {}
+        for resultat in resultats:
+            statuts[resultat['statut']] = statuts.get(resultat['statut'], 0) + 1
+        print(f"{nouvelles_ventes} nouvelles ventes importées depuis {statuts.get('importe', 0)} fichiers "
+              f"({statuts.get('inchange', 0)} inchangés, {statuts.get('erreur', 0)} en erreur)")
+        print(f"{lignes_lues} lignes traitées en {duree:.2f}s "
+              f"({lignes_lues / duree if duree > 0 else 0:.0f} lignes/s)")
+        return {
+            'fichiers': resultats,
+            'statuts': statuts,
+            'lignes_lues': lignes_lues,
+            'lignes_rejetees': sum(resultat['rejets'] for resultat in resultats),
+            'nouvelles_ventes': nouvelles_ventes,
+            'duree': round(duree, 3)
+        }
+    
+    @staticmethod
+    def _number_segment(resultat: dict, lignes_fichiers: dict):
+        # Segments reçus dans l'ordre du fichier: les ventes d'un segment suivant sont numérotées
+        # à la suite des lignes des segments précédents
+        fichier = resultat['fichier']
+        if resultat['lignes_deja_importees'] is None:
+            base = lignes_fichiers.get(fichier)
+            if base is None:
+                if resultat['statut'] != 'erreur':
+                    resultat.update(statut='erreur', erreur="segment précédent illisible", ventes=[])
+                return
+            resultat['lignes_deja_importees'] = base
+            if base:
+                resultat['ventes'] = [vente[:6] + (base + vente[6],) for vente in resultat['ventes']]
+        lignes_fichiers[fichier] = (resultat['lignes_deja_importees'] + resultat['lignes']
+                                    if resultat['statut'] != 'erreur' else None)
+    
+    @staticmethod
+    def _merge_segments(resultats: list) -> list:
+        fusionnes = {}
+        for resultat in resultats:
+            fichier = fusionnes.get(resultat['fichier'])
+            if fichier is None:
+                fusionnes[resultat['fichier']] = resultat
+                continue
+            if fichier['statut'] == 'erreur':
+                continue
+            if resultat['statut'] == 'erreur':
+                fichier.update(statut='erreur', erreur=resultat['erreur'])
+                continue
+            for cle in ('lignes', 'rejets', 'references_inconnues', 'duree_analyse'):
+                fichier[cle] += resultat[cle]
+            fichier['exemples_rejets'] = (fichier['exemples_rejets']
+                                          + resultat['exemples_rejets'])[:MAX_REJECTED_EXAMPLES]
+            fichier['octets'] = resultat['octets']
+        return list(fusionnes.values())
+    
+    @staticmethod
+    def _resolve_ventes_files(source: str) -> list:
+        if os.path.isdir(source):
+            return sorted(glob.glob(os.path.join(source, '*.csv')))
+        return sorted(glob.glob(source))
+    
+    def resume_position(self, csv_file: str, etat: Optional[dict] = None) -> tuple:
+        # (octet, lignes déjà importées) à partir desquels reprendre la lecture d'un fichier de ventes
+        if etat is None:
+            etat = self._ingestion_state(csv_file)
+        offset = self._resume_offset(csv_file, etat)
+        return offset, etat['nombre_lignes'] if offset else 0
+    
+    def parse_ventes_file(self, csv_file: str, offset: int = 0, lignes_deja_importees: int = 0,
+                          lignes_completes: bool = False) -> dict:
+        # Analyse dans ce processus, pour write_parsed_ventes (import au fil de l'eau)
+        if self._prix_produits is None:
+            self._prix_produits = self._load_prix_produits(self.db_manager.connection.cursor())
+        return _parse_ventes_file(csv_file, offset, lignes_deja_importees, self._prix_produits, lignes_completes,
+                                  source=self.db_manager.source_name(csv_file))
+    
+    def write_parsed_ventes(self, lot: list, suivi=None) -> int:
+        # Une transaction pour les ventes de tous les fichiers lisibles du lot et leur état d'ingestion.
+        # suivi (IncrementalAnalyses): relevé de l'agrégat des jours écrits avant et après l'insertion
+        analyses = [resultat for resultat in lot if resultat['statut'] == 'analyse']
+        ventes = [vente for resultat in analyses for vente in resultat['ventes']]
+        jours = sorted({vente[0] for vente in ventes})
+        with self.db_manager.writer():
+            try:
+                cursor = self.db_manager.connection.cursor()
+                avant = suivi.snapshot(cursor, jours) if suivi is not None else None
+                nouvelles_ventes = self._insert_ventes_records(cursor, ventes) if ventes else 0
+                apres = suivi.snapshot(cursor, jours) if suivi is not None and nouvelles_ventes else None
+                for resultat in analyses:
+                    self._save_source_state(resultat['fichier'], resultat['octets'],
+                                            resultat['lignes_deja_importees'] + resultat['lignes'], sampled=True)
+                self.db_manager.commit()
+            except Exception as e:
+                print(f"Erreur lors de l'import des fichiers de ventes: {e}")
+                self.db_manager.rollback()
+                raise
+        
+        if apres is not None:
+            suivi.apply(avant, apres)
+        for resultat in analyses:
+            resultat['statut'] = 'importe'
+            self.metrics.count('lignes_rejetees', resultat['rejets'])
+        self.metrics.count('fichiers_importes', len(analyses))
+        return nouvelles_ventes
+    
+    @instrumented('import_ventes_pipeline')
+    def import_ventes_pipeline(self, csv_file: str = "ventes.csv", batch_size: int = 50000,
+                               queue_size: int = 4, incremental: bool = True, final: bool = False) -> dict:
+        # final: comme import_ventes, pour la dernière ligne sans fin de ligne d'un fichier local
+        # (un corps HTTP est une réponse complète, lu en entier)
+        source = f"{self.base_url}/{csv_file}" if self.use_http else csv_file
+        print(f"Import des ventes en pipeline depuis {source}...")
+        
+        debut = time.perf_counter()
+        with self._open_ventes_lines(csv_file, incremental, final) as (lignes, offset, lignes_deja_importees):
+            if lignes is not None:
+                lignes_lues, nouvelles_ventes, profondeur_max = self._run_ventes_pipeline(
+                    lignes, offset, lignes_deja_importees, self.db_manager.source_name(csv_file), batch_size,
+                    queue_size
+                )
+                # Fichier local: fin de ses lignes complètes; corps HTTP: taille de la copie locale,
+                # remplacée à la sortie du bloc
+                octets_consommes = lignes.buffer.raw.fin if isinstance(lignes, io.TextIOWrapper) else None
+        if lignes is None:
+            return {'lignes_lues': 0, 'nouvelles_ventes': 0, 'duree': 0.0, 'profondeur_max_file': 0}
+        
+        # Lots validés un à un: en cas d'interruption, la relecture depuis l'état précédent
+        # ignore les ventes déjà insérées (clé d'origine)
+        taille = os.path.getsize(csv_file)
+        if octets_consommes is None:
+            octets_consommes = taille
+        nombre_lignes = lignes_deja_importees + lignes_lues
+        with self.db_manager.writer():
+            try:
+                if final and taille > octets_consommes:
+                    cursor = self.db_manager.connection.cursor()
+                    octets_consommes, nombre_lignes, nouvelles_queue = self._import_ventes_tail(
+                        cursor, csv_file, octets_consommes, nombre_lignes, self._load_prix_produits(cursor)
+                    )
+                    lignes_lues = nombre_lignes - lignes_deja_importees
+                    nouvelles_ventes += nouvelles_queue
+                self._save_source_state(csv_file, octets_consommes, nombre_lignes, sampled=True)
+                self.db_manager.commit()
+            except Exception:
+                self.db_manager.rollback()
+                raise
+        
+        duree = time.perf_counter() - debut
+        print(f"{nouvelles_ventes} nouvelles ventes importées")
+        print(f"{lignes_lues} lignes traitées en {duree:.2f}s "
+              f"({lignes_lues / duree if duree > 0 else 0:.0f} lignes/s, file max {profondeur_max}/{queue_size})")
+        return {
+            'lignes_lues': lignes_lues,
+            'nouvelles_ventes': nouvelles_ventes,
+            'duree': round(duree, 3),
+            'profondeur_max_file': profondeur_max
+        }
+    
+    def _run_ventes_pipeline(self, lignes, offset: int, lignes_deja_importees: int, source: str,
+                             batch_size: int, queue_size: int) -> tuple:
+        cursor = self.db_manager.connection.cursor()
+        prix_produits = self._load_prix_produits(cursor)
+        rapport = _read_report()
+        
+        # File bornée: le lecteur se bloque quand l'écrivain SQLite est en retard
+        lots = queue.Queue(maxsize=queue_size)
+        arret = threading.Event()
+        producteur = threading.Thread(
+            target=self._produce_ventes_batches,
+            args=(lignes, offset, lignes_deja_importees, source, prix_produits, batch_size, lots, arret, rapport),
+            daemon=True
+        )
+        
+        nouvelles_ventes = 0
+        profondeur_max = 0
+        producteur.start()
+        
         try:
-            df = pd.read_csv(csv_file)
-            df.columns = ['Date', 'ID_Reference_Produit', 'Quantite', 'ID_Magasin']
+            while True:
+                profondeur_max = max(profondeur_max, lots.qsize())
+                lot = lots.get()
+                if lot is None:
+                    break
+                if isinstance(lot, Exception):
+                    raise lot
+                
+                # Verrou pris par lot: les autres écrivains passent entre deux lots
+                with self.db_manager.writer():
+                    try:
+                        nouvelles_ventes += self._insert_ventes_records(cursor, lot)
+                        self.db_manager.commit()
+                    except Exception:
+                        # Annulé sous le verrou: la connexion principale est partagée avec les autres écrivains
+                        self.db_manager.rollback()
+                        raise
             
-            cursor = self.db_manager.connection.cursor()
+        except Exception as e:
+            print(f"Erreur lors de l'import des ventes en pipeline: {e}")
+            arret.set()
+            raise
             
-            prix_produits = {}
-            cursor.execute("SELECT ID_Reference, Prix FROM PRODUIT")
-            for row in cursor.fetchall():
-                prix_produits[row[0]] = row[1]
+        finally:
+            arret.set()
+            producteur.join()
+        self._report_rejects(rapport)
+        return rapport['lignes'], nouvelles_ventes, profondeur_max
+    
+    def _produce_ventes_batches(self, lignes, offset: int, lignes_deja_importees: int, source: str,
+                                prix_produits: dict, batch_size: int, lots: queue.Queue, arret: threading.Event,
+                                rapport: dict):
+        def publier(element) -> bool:
+            while not arret.is_set():
+                try:
+                    lots.put(element, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        try:
+            reader = csv.reader(lignes)
+            if offset == 0:
+                next(reader, None)
+            for lot in self._parse_ventes_rows(reader, offset, prix_produits, source, lignes_deja_importees,
+                                               rapport, batch_size):
+                if not publier(lot):
+                    return
+            publier(None)
             
-            ventes_to_insert = []
-            nouvelles_ventes = 0
+        except Exception as e:
+            publier(e)
+    
+    @contextmanager
+    def _open_ventes_lines(self, csv_file: str, incremental: bool, final: bool = False):
+        # (lignes à importer ou None, octet de départ, lignes déjà importées). Fichier local: ses lignes
+        # complètes seulement, la dernière ligne sans fin de ligne étant laissée à l'appelant
+        if self.use_http and csv_file not in self._prefetched:
+            # Le corps HTTP est découpé en lignes au fil de la réception, et copié dans csv_file
+            with self.collector.open_lines(csv_file) as lignes:
+                if lignes is not None:
+                    yield lignes, 0, 0
+                    return
+            # 304: la copie locale est à jour, importée comme après une collecte
+            self._prefetched[csv_file] = STATUT_NON_MODIFIE
+        
+        if self._skip_after_collect(csv_file):
+            yield None, 0, 0
+            return
+        
+        etat = self._ingestion_state(csv_file) if incremental else None
+        offset = self._resume_offset(csv_file, etat)
+        lignes_deja_importees = etat['nombre_lignes'] if offset else 0
+        taille = os.path.getsize(csv_file)
+        fin_lignes = self._complete_lines_end(csv_file, taille)
+        if offset >= (taille if final else fin_lignes):
+            print("Aucune nouvelle ligne depuis le dernier import")
+            yield None, 0, 0
+            return
+        if offset:
+            print(f"Reprise après {lignes_deja_importees} lignes déjà importées (octet {offset})")
+        elif etat is not None:
+            print(f"{csv_file} a été modifié depuis le dernier import: relecture complète")
+        
+        with open(csv_file, 'rb') as f:
+            f.seek(offset)
+            lecture = io.BufferedReader(_BoundedReader(f, max(offset, fin_lignes)))
+            yield io.TextIOWrapper(lecture, encoding='utf-8', newline=''), offset, lignes_deja_importees
+    
+    def _read_reference_csv(self, csv_file: str, types: tuple) -> list:
+        # Lignes du fichier (sans en-tête) converties selon types; une valeur vide devient None
+        if self.csv_backend == 'pandas':
+            import pandas as pd
+            # round_trip: les prix doivent être identiques aux REAL déjà stockés pour le diff
+            df = pd.read_csv(csv_file, float_precision='round_trip')
+            return self._to_records(df, list(df.columns))
+        
+        with open(csv_file, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            return [tuple(None if valeur == '' else type_valeur(valeur) for type_valeur, valeur in zip(types, row))
+                    for row in reader if row]
+    
+    def _read_ventes_batches(self, f, offset: int, prix_produits: dict, source: str, premiere_ligne: int,
+                             rapport: dict, chunksize: Optional[int] = None):
+        # Lots de tuples prêts à insérer (Date, Référence, Quantité, Magasin, Montant, Source, Ligne),
+        # un seul sans chunksize. En reprise, f est positionné après l'en-tête et les premiere_ligne
+        # lignes déjà lues. Les lignes invalides sont comptées dans rapport mais gardent leur numéro
+        lignes_pandas = 0
+        if self.csv_backend == 'pandas':
+            import pandas as pd
+            debut = f.tell()
+            try:
+                # Texte brut: les valeurs sont validées comme avec le module csv (une référence "NA" reste "NA")
+                lecture = pd.read_csv(f, header=0 if offset == 0 else None, names=VENTE_CSV_COLUMNS,
+                                      dtype=str, keep_default_na=False, chunksize=chunksize)
+                for df in (lecture if chunksize else [lecture]):
+                    yield self._ventes_records(df, prix_produits, source, premiere_ligne + lignes_pandas, rapport)
+                    lignes_pandas += len(df)
+                return
+            except pd.errors.ParserError as e:
+                # Ligne de trop de colonnes: le lecteur de pandas s'arrête, la suite est lue avec le
+                # module csv, qui la rejette comme les autres lignes invalides
+                print(f"Lecture pandas interrompue ({str(e).strip()}): suite lue avec le module csv")
+                f.seek(debut)
+        
+        lignes = io.TextIOWrapper(f, encoding='utf-8', newline='')
+        try:
+            reader = csv.reader(lignes)
+            if offset == 0:
+                next(reader, None)
+            # Lignes déjà importées par pandas avant son interruption
+            deque(itertools.islice((row for row in reader if row), lignes_pandas), maxlen=0)
+            premiere_ligne += lignes_pandas
+            yield from self._parse_ventes_rows(reader, offset, prix_produits, source, premiere_ligne,
+                                               rapport, chunksize)
+        finally:
+            # f reste ouvert (et sa position lisible) pour l'appelant
+            lignes.detach()
+    
+    @staticmethod
+    def _parse_ventes_rows(reader, offset: int, prix_produits: dict, source: str, premiere_ligne: int,
+                           rapport: dict, batch_size: Optional[int] = None):
+        lot = []
+        ligne = premiere_ligne
+        # Numéros de ligne dans le fichier, en-tête et lignes déjà importées comprises
+        decalage = premiere_ligne + 1 if offset else 0
+        for row in reader:
+            if not row:
+                continue
+            ligne += 1
+            rapport['lignes'] += 1
+            try:
+                date_vente, reference, quantite, magasin = _validate_vente(row)
+            except ValueError as e:
+                _record_reject(rapport, f"ligne {reader.line_num + decalage}", str(e))
+                continue
+            lot.append((date_vente, reference, quantite, magasin,
+                        quantite * prix_produits.get(reference, 0), source, ligne))
+            if batch_size and len(lot) >= batch_size:
+                yield lot
+                lot = []
+        if lot:
+            yield lot
+    
+    def _import_ventes_tail(self, cursor: sqlite3.Cursor, csv_file: str, octets: int, lignes: int,
+                            prix_produits: dict) -> tuple:
+        # Dernière ligne sans fin de ligne d'un fichier terminé: (octets, lignes) après elle et nouvelles
+        # ventes, ou position inchangée si elle est rejetée (peut-être encore incomplète)
+        queue_fichier = _parse_ventes_file(csv_file, octets, lignes, prix_produits,
+                                           source=self.db_manager.source_name(csv_file))
+        if queue_fichier['statut'] == 'erreur' or queue_fichier['rejets']:
+            motif = queue_fichier.get('erreur') or '; '.join(queue_fichier['exemples_rejets'])
+            print(f"Dernière ligne sans fin de ligne laissée en attente ({motif})")
+            return octets, lignes, 0
+        
+        nouvelles_ventes = self._insert_ventes_records(cursor, queue_fichier['ventes']) if queue_fichier['ventes'] else 0
+        return queue_fichier['octets'], lignes + queue_fichier['lignes'], nouvelles_ventes
+    
+    @staticmethod
+    def _complete_lines_end(csv_file: str, taille: int) -> int:
+        # Octet suivant le dernier saut de ligne parmi les taille premiers octets (0 sans ligne complète)
+        with open(csv_file, 'rb') as f:
+            fin = taille
+            while fin > 0:
+                debut = max(0, fin - FINGERPRINT_BLOCK_SIZE)
+                f.seek(debut)
+                position = f.read(fin - debut).rfind(b'\n')
+                if position >= 0:
+                    return debut + position + 1
+                fin = debut
+        return 0
+    
+    def _import_ventes_streaming(self, f, offset: int, chunksize: int, cursor: sqlite3.Cursor,
+                                 prix_produits: dict, source: str, premiere_ligne: int, rapport: dict) -> int:
+        print(f"Mode streaming: lots de {chunksize} lignes")
+        
+        lignes_lues = 0
+        nouvelles_ventes = 0
+        debut_import = time.perf_counter()
+        
+        for numero_lot, ventes in enumerate(self._read_ventes_batches(f, offset, prix_produits, source, premiere_ligne,
+                                                                      rapport, chunksize), start=1):
+            if not ventes:
+                continue
+            debut_lot = time.perf_counter()
             
-            for _, row in df.iterrows():
-                prix = prix_produits.get(row['ID_Reference_Produit'], 0)
-                montant_total = row['Quantite'] * prix
-                
-                cursor.execute("""
-                    SELECT COUNT(*) FROM VENTE 
-                    WHERE Date = ? AND ID_Reference_Produit = ? 
-                    AND Quantite = ? AND ID_Magasin = ?
-                """, (row['Date'], row['ID_Reference_Produit'], 
-                     row['Quantite'], row['ID_Magasin']))
-                
-                if cursor.fetchone()[0] == 0:
-                    ventes_to_insert.append((
-                        row['Date'], row['ID_Reference_Produit'], 
-                        row['Quantite'], row['ID_Magasin'], montant_total
-                    ))
-                    nouvelles_ventes += 1
+            nouvelles_lot = self._insert_ventes_records(cursor, ventes)
+            self.db_manager.commit()
             
-            if ventes_to_insert:
-                cursor.executemany("""
-                    INSERT INTO VENTE 
-                    (Date, ID_Reference_Produit, Quantite, ID_Magasin, Montant_Total)
-                    VALUES (?, ?, ?, ?, ?)
-                """, ventes_to_insert)
-                
-                self.db_manager.connection.commit()
-                print(f"{nouvelles_ventes} nouvelles ventes importées")
+            duree_lot = time.perf_counter() - debut_lot
+            lignes_lues += len(ventes)
+            nouvelles_ventes += nouvelles_lot
+            print(f"Lot {numero_lot}: {len(ventes)} lignes, {nouvelles_lot} nouvelles ventes "
+                  f"({len(ventes) / duree_lot if duree_lot > 0 else 0:.0f} lignes/s)")
+        
+        duree_totale = time.perf_counter() - debut_import
+        print(f"{lignes_lues} lignes traitées en {duree_totale:.2f}s "
+              f"({lignes_lues / duree_totale if duree_totale > 0 else 0:.0f} lignes/s)")
+        return nouvelles_ventes
+    
+    def _report_rejects(self, rapport: dict):
+        if rapport['rejets']:
+            print(f"{rapport['rejets']} lignes rejetées ({'; '.join(rapport['exemples_rejets'])})")
+            self.metrics.count('lignes_rejetees', rapport['rejets'])
+    
+    def _resume_offset(self, csv_file: str, etat: Optional[dict]) -> int:
+        if etat is None:
+            return 0
+        
+        octets = etat['octets_consommes']
+        if os.path.getsize(csv_file) < octets:
+            return 0
+        if self._fingerprint_prefix(csv_file, octets, sampled=True) != etat['hash_prefixe']:
+            return 0
+        return octets
+    
+    def _ingestion_state(self, csv_file: str) -> Optional[dict]:
+        return self.db_manager.get_ingestion_state(self.db_manager.source_name(csv_file))
+    
+    def _source_unchanged(self, csv_file: str) -> bool:
+        etat = self._ingestion_state(csv_file)
+        if etat is None:
+            return False
+        
+        taille = os.path.getsize(csv_file)
+        return (etat['octets_consommes'] == taille 
+                and etat['hash_prefixe'] == self._fingerprint_prefix(csv_file, taille))
+    
+    def _save_source_state(self, csv_file: str, octets: int, nombre_lignes: int, sampled: bool = False):
+        stat = os.stat(csv_file)
+        self.db_manager.save_ingestion_state(
+            self.db_manager.source_name(csv_file), f"{stat.st_dev}:{stat.st_ino}", octets, nombre_lignes,
+            self._fingerprint_prefix(csv_file, octets, sampled=sampled)
+        )
+    
+    @staticmethod
+    def _fingerprint_prefix(csv_file: str, length: int, sampled: bool = False) -> str:
+        # ventes.csv est en ajout seul: l'empreinte échantillonnée (taille, premier et
+        # dernier bloc du préfixe) garde la vérification en O(1) quelle que soit l'historique
+        empreinte = hashlib.sha256(str(length).encode())
+        with open(csv_file, 'rb') as f:
+            if sampled and length > 2 * FINGERPRINT_BLOCK_SIZE:
+                empreinte.update(f.read(FINGERPRINT_BLOCK_SIZE))
+                f.seek(length - FINGERPRINT_BLOCK_SIZE)
+                empreinte.update(f.read(FINGERPRINT_BLOCK_SIZE))
             else:
-                print("Aucune nouvelle vente à importer (toutes existent déjà)")
+                restant = length
+                while restant > 0:
+                    bloc = f.read(min(FINGERPRINT_BLOCK_SIZE, restant))
+                    if not bloc:
+                        break
+                    empreinte.update(bloc)
+                    restant -= len(bloc)
+        return empreinte.hexdigest()
+    
+    def _load_prix_produits(self, cursor: sqlite3.Cursor) -> dict:
+        cursor.execute("SELECT ID_Reference, Prix FROM PRODUIT")
+        return dict(cursor.fetchall())
+    
+    def _ventes_records(self, df: 'pd.DataFrame', prix_produits: dict, source: str, premiere_ligne: int,
+                        rapport: dict) -> list:
+        if df.empty:
+            return []
+        
+        import pandas as pd
+        df = df.assign(Ligne_Source=range(premiere_ligne + 1, premiere_ligne + 1 + len(df)))
+        rapport['lignes'] += len(df)
+        # Contrôle vectorisé strict; les lignes qu'il écarte passent par _validate_vente, qui fait foi
+        valides = (df['Quantite'].str.fullmatch(r'\d+', na=False)
+                   & df['ID_Magasin'].str.fullmatch(r'\d+', na=False)
+                   & df['Date'].str.fullmatch(r'\d{4}-\d{2}-\d{2}', na=False))
+        valides &= pd.to_datetime(df['Date'].where(valides), format='%Y-%m-%d', errors='coerce').notna()
+        valides &= pd.to_numeric(df['Quantite'].where(valides), errors='coerce') > 0
+        if not valides.all():
+            valides = valides.copy()
+            for index in df.index[~valides]:
+                # Champs manquants (ligne trop courte): NaN, retirés pour retrouver la ligne lue
+                row = [valeur for valeur in df.loc[index, VENTE_CSV_COLUMNS] if isinstance(valeur, str)]
+                try:
+                    jour, reference, quantite, magasin = _validate_vente(row)
+                except ValueError as e:
+                    _record_reject(rapport, f"ligne {df.at[index, 'Ligne_Source'] + 1}", str(e))
+                    continue
+                df.loc[index, VENTE_CSV_COLUMNS] = [jour, reference, str(quantite), str(magasin)]
+                valides[index] = True
+            df = df[valides]
+            if df.empty:
+                return []
+        
+        quantites = df['Quantite'].astype('int64')
+        prix = df['ID_Reference_Produit'].map(prix_produits).fillna(0)
+        df = df.assign(Quantite=quantites, ID_Magasin=df['ID_Magasin'].astype('int64'),
+                       Montant_Total=quantites * prix, Source=source)
+        return self._to_records(
+            df, ['Date', 'ID_Reference_Produit', 'Quantite', 'ID_Magasin', 'Montant_Total', 'Source', 'Ligne_Source']
+        )
+    
+    def _insert_ventes_records(self, cursor: sqlite3.Cursor, ventes_to_insert: list) -> int:
+        self.metrics.count('lignes', len(ventes_to_insert))
+        nouvelles_ventes = 0
+        for table, ventes in self._route_ventes(cursor, ventes_to_insert):
+            cursor.execute(f"SELECT COALESCE(MAX(ID_Vente), 0) FROM {table}")
+            dernier_id = cursor.fetchone()[0]
+            self.db_manager.adopt_legacy_ventes(cursor, table, ventes)
             
-        except Exception as e:
-            print(f"Erreur lors de l'import des ventes: {e}")
-            self.db_manager.connection.rollback()
-            raise
+            # Seule une ligne déjà importée (même fichier, même numéro de ligne) est écartée; toute autre
+            # contrainte violée fait échouer l'import (les lignes invalides sont rejetées à la lecture)
+            changements_avant = self.db_manager.connection.total_changes
+            cursor.executemany(f"""
+                INSERT INTO {table} 
+                (Date, ID_Reference_Produit, Quantite, ID_Magasin, Montant_Total, Source, Ligne_Source)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (Source, Ligne_Source) DO NOTHING
+            """, ventes)
+            nouvelles_table = self.db_manager.connection.total_changes - changements_avant
+            
+            # Même transaction que l'insertion: l'agrégat et les sketches restent cohérents avec les ventes
+            if nouvelles_table:
+                self.db_manager.update_sales_cube(cursor, dernier_id, table)
+                self.db_manager.update_sketches(cursor, dernier_id, table)
+            nouvelles_ventes += nouvelles_table
+        
+        if nouvelles_ventes:
+            self.db_manager.bump_data_version(cursor)
+            self.metrics.count('ventes_inserees', nouvelles_ventes)
+        return nouvelles_ventes
+    
+    def _route_ventes(self, cursor: sqlite3.Cursor, ventes_to_insert: list) -> list:
+        if not self.db_manager.partitioned:
+            return [('VENTE', ventes_to_insert)]
+        
+        # Stockage partitionné: une table par mois, créée à la première vente du mois
+        par_mois = {}
+        for vente in ventes_to_insert:
+            par_mois.setdefault(vente[0][:7], []).append(vente)
+        return [(self.db_manager.ensure_partition(cursor, mois), ventes)
+                for mois, ventes in sorted(par_mois.items())]
+    
+    @staticmethod
+    def _to_records(df: 'pd.DataFrame', columns: list) -> list:
+        # tolist() convertit colonne par colonne en types Python natifs pour sqlite3
+        return list(zip(*(df[column].tolist() for column in columns)))
     
     def get_import_summary(self) -> dict:
         summary = {
@@ -173,7 +1111,7 @@ if __name__ == "__main__":
         
         importer.import_magasins()
         importer.import_produits()
-        importer.import_ventes()
+        importer.import_ventes(final=True)
         
         summary = importer.get_import_summary()
         print("\nRésumé de l'import:")
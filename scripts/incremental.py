@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+
+import heapq
+import math
+import sqlite3
+from datetime import datetime
+from typing import Optional
+from analysis import SalesAnalyzer
+
+# Analyses standard de run_analyses tenues à jour: nom -> (type d'analyse, paramètres de son cache)
+TOP_MAGASINS_LIMIT = 5
+SYNTHESE_TOP_N = 5
+ANALYSES_INCREMENTALES = {
+    'chiffre_affaires': ('CA_TOTAL', None),
+    'ventes_produit': ('VENTES_PRODUIT', None),
+    'ventes_region': ('VENTES_REGION', None),
+    'evolution_mensuelle': ('EVOLUTION_VENTES', {'date_debut': None, 'date_fin': None, 'granularite': 'mois',
+                                                 'id_magasin': None, 'region': None}),
+    'top_magasins': ('TOP_MAGASINS', {'date_debut': None, 'date_fin': None, 'region': None,
+                                      'limit': TOP_MAGASINS_LIMIT}),
+    'stocks_ventes': ('STOCKS_VENTES', {'date_debut': None, 'date_fin': None, 'id_magasin': None,
+                                        'region': None, 'limit': None}),
+    'synthese': ('SYNTHESE', {'top_n': SYNTHESE_TOP_N})
+}
+
+def _sql_round(valeur: float, decimales: int = 2) -> float:
+    # ROUND de SQLite arrondit les demis à l'opposé de zéro (round de Python: au pair le plus proche)
+    facteur = 10 ** decimales
+    return math.copysign(math.floor(abs(valeur) * facteur + 0.5) / facteur, valeur)
+
+class IncrementalAnalyses:
+    # Sommes exactes (non arrondies) par produit, magasin et mois, construites par un parcours de
+    # l'agrégat puis mises à jour par la différence de l'agrégat des seuls jours écrits. Les analyses
+    # standard en sont déduites sans requête et publiées dans le cache sous la nouvelle version
+    
+    def __init__(self, analyzer: SalesAnalyzer):
+        self.analyzer = analyzer
+        self.db_manager = analyzer.db_manager
+        self.version = None
+        self.produits = {}
+        self.magasins = {}
+        self.par_produit = {}
+        self.par_magasin = {}
+        self.par_mois = {}
+        self.total = [0, 0.0, 0]
+        self.periode_debut = None
+        self.periode_fin = None
+    
+    def rebuild(self) -> int:
+        # Parcours complet (démarrage, ou après une modification des référentiels ou un autre écrivain)
+        with self.db_manager.reader() as connection:
+            cursor = connection.cursor()
+            self.version = self.db_manager.get_data_version(connection)
+            
+            cursor.execute("SELECT ID_Reference, Nom, Prix, Stock FROM PRODUIT")
+            self.produits = {row[0]: row[1:] for row in cursor.fetchall()}
+            cursor.execute("SELECT ID_Magasin, Ville, Region FROM MAGASIN")
+            self.magasins = {row[0]: row[1:] for row in cursor.fetchall()}
+            
+            self.par_produit = {}
+            self.par_magasin = {}
+            self.par_mois = {}
+            self.total = [0, 0.0, 0]
+            cursor.execute("""
+                SELECT ID_Reference_Produit, ID_Magasin, substr(Date, 1, 7),
+                       SUM(Quantite_Totale), SUM(Montant_Total), SUM(Nombre_Ventes)
+                FROM VENTE_AGREGAT_JOUR
+                GROUP BY ID_Reference_Produit, ID_Magasin, substr(Date, 1, 7)
+            """)
+            for reference, id_magasin, mois, quantite, montant, ventes in cursor:
+                self._add(reference, id_magasin, mois, quantite, montant, ventes)
+            
+            cursor.execute("SELECT MIN(Date), MAX(Date) FROM VENTE_AGREGAT_JOUR")
+            self.periode_debut, self.periode_fin = cursor.fetchone()
+        return self.version
+    
+    def snapshot(self, cursor: sqlite3.Cursor, jours: list) -> dict:
+        # Agrégat des jours donnés par (produit, magasin, jour); lu dans la transaction de l'écrivain
+        if not jours:
+            return {}
+        cursor.execute(f"""
+            SELECT ID_Reference_Produit, ID_Magasin, Date, Quantite_Totale, Montant_Total, Nombre_Ventes
+            FROM VENTE_AGREGAT_JOUR
+            WHERE Date IN ({', '.join('?' * len(jours))})
+        """, jours)
+        return {row[:3]: row[3:] for row in cursor.fetchall()}
+    
+    def apply(self, avant: dict, apres: dict):
+        # Les ventes sont ajoutées: chaque cellule de l'agrégat ne peut qu'apparaître ou croître
+        for cle, (quantite, montant, ventes) in apres.items():
+            precedent = avant.get(cle)
+            if precedent is not None:
+                quantite -= precedent[0]
+                montant -= precedent[1]
+                ventes -= precedent[2]
+            if ventes or quantite or montant:
+                reference, id_magasin, jour = cle
+                self._add(reference, id_magasin, jour[:7], quantite, montant, ventes)
+        
+        jours = [jour for _, _, jour in apres]
+        if jours:
+            self.periode_debut = min(jours) if self.periode_debut is None else min(self.periode_debut, min(jours))
+            self.periode_fin = max(jours) if self.periode_fin is None else max(self.periode_fin, max(jours))
+    
+    def _add(self, reference: str, id_magasin: int, mois: str, quantite: int, montant: float, ventes: int):
+        for cumuls, cle in ((self.par_produit, reference), (self.par_magasin, id_magasin), (self.par_mois, mois)):
+            cumul = cumuls.get(cle)
+            if cumul is None:
+                cumul = cumuls[cle] = [0, 0.0, 0]
+            cumul[0] += quantite
+            cumul[1] += montant
+            cumul[2] += ventes
+        self.total[0] += quantite
+        self.total[1] += montant
+        self.total[2] += ventes
+    
+    def publish(self, version: Optional[int] = None) -> dict:
+        # Résultats au format des méthodes de SalesAnalyzer, enregistrés pour la version des données
+        version = self.version if version is None else version
+        self.version = version
+        resultats = self.results()
+        self.analyzer.store_results([(resultats[nom], parametres)
+                                     for nom, (_, parametres) in ANALYSES_INCREMENTALES.items()], version)
+        return resultats
+    
+    def results(self) -> dict:
+        date_analyse = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        
+        produits = []
+        stocks = []
+        for reference, (nom, prix, stock) in self.produits.items():
+            cumul = self.par_produit.get(reference)
+            quantite, montant, ventes = cumul if cumul is not None else (0, 0.0, 0)
+            produits.append({
+                'reference': reference,
+                'nom': nom,
+                'prix_unitaire': prix,
+                'quantite_totale': quantite,
+                'ca_produit': round(montant, 2),
+                'nombre_ventes': ventes,
+                '_vendu': cumul is not None
+            })
+            # ROUND(Quantite_Vendue * 100.0 / Stock, 2): NULL sans vente ou sans stock
+            stocks.append({
+                'reference': reference,
+                'nom': nom,
+                'stock': stock,
+                'quantite_vendue': quantite,
+                'pourcentage_stock_vendu': _sql_round(quantite * 100.0 / stock) if cumul is not None and stock else None
+            })
+        
+        regions = {}
+        for id_magasin, (_, region) in self.magasins.items():
+            cumul_region = regions.get(region)
+            if cumul_region is None:
+                cumul_region = regions[region] = {'region': region, 'nombre_magasins': 0, 'ca_region': 0.0,
+                                                  'nombre_ventes': 0, 'quantite_totale': 0, '_vendu': False}
+            cumul_region['nombre_magasins'] += 1
+            cumul = self.par_magasin.get(id_magasin)
+            if cumul is not None:
+                cumul_region['quantite_totale'] += cumul[0]
+                cumul_region['ca_region'] += cumul[1]
+                cumul_region['nombre_ventes'] += cumul[2]
+                cumul_region['_vendu'] = True
+        for cumul_region in regions.values():
+            cumul_region['ca_region'] = round(cumul_region['ca_region'], 2)
+        
+        magasins = [{
+            'id_magasin': id_magasin,
+            'ville': self.magasins[id_magasin][0],
+            'region': self.magasins[id_magasin][1],
+            'ca_magasin': round(cumul[1], 2),
+            'nombre_ventes': cumul[2]
+        } for id_magasin, cumul in self.par_magasin.items() if id_magasin in self.magasins]
+        
+        periodes = [{
+            'periode': mois,
+            'nombre_ventes': cumul[2],
+            'ca_periode': round(cumul[1], 2),
+            'quantite_totale': cumul[0]
+        } for mois, cumul in sorted(self.par_mois.items())]
+        
+        # Comme ORDER BY ... DESC en SQL: les lignes sans vente (NULL) en dernier
+        def par_ca_decroissant(cle: str):
+            return lambda ligne: (not ligne['_vendu'], -ligne[cle])
+        
+        synthese_produits = heapq.nlargest(SYNTHESE_TOP_N, produits, key=lambda x: x['ca_produit'])
+        synthese_regions = heapq.nlargest(SYNTHESE_TOP_N, regions.values(), key=lambda x: x['ca_region'])
+        produits.sort(key=par_ca_decroissant('ca_produit'))
+        regions_triees = sorted(regions.values(), key=par_ca_decroissant('ca_region'))
+        stocks.sort(key=lambda ligne: (ligne['pourcentage_stock_vendu'] is None,
+                                       -(ligne['pourcentage_stock_vendu'] or 0)))
+        
+        def sans_marque(lignes) -> list:
+            return [{cle: valeur for cle, valeur in ligne.items() if cle != '_vendu'} for ligne in lignes]
+        
+        ca_total = self.total[1]
+        return {
+            'chiffre_affaires': {
+                'type_analyse': 'CA_TOTAL',
+                'date_analyse': date_analyse,
+                'chiffre_affaires_total': round(ca_total, 2) if ca_total else 0,
+                'nombre_ventes': self.total[2],
+                'periode_debut': self.periode_debut,
+                'periode_fin': self.periode_fin
+            },
+            'ventes_produit': {
+                'type_analyse': 'VENTES_PRODUIT',
+                'date_analyse': date_analyse,
+                'produits': sans_marque(produits),
+                'nombre_produits': len(produits)
+            },
+            'ventes_region': {
+                'type_analyse': 'VENTES_REGION',
+                'date_analyse': date_analyse,
+                'regions': sans_marque(regions_triees),
+                'nombre_regions': len(regions_triees)
+            },
+            'evolution_mensuelle': {
+                'type_analyse': 'EVOLUTION_VENTES',
+                'date_analyse': date_analyse,
+                'parametres': ANALYSES_INCREMENTALES['evolution_mensuelle'][1],
+                'periodes': periodes,
+                'ca_total': round(sum(periode['ca_periode'] for periode in periodes), 2)
+            },
+            'top_magasins': {
+                'type_analyse': 'TOP_MAGASINS',
+                'date_analyse': date_analyse,
+                'parametres': ANALYSES_INCREMENTALES['top_magasins'][1],
+                'magasins': heapq.nlargest(TOP_MAGASINS_LIMIT, magasins, key=lambda x: x['ca_magasin'])
+            },
+            'stocks_ventes': {
+                'type_analyse': 'STOCKS_VENTES',
+                'date_analyse': date_analyse,
+                'parametres': ANALYSES_INCREMENTALES['stocks_ventes'][1],
+                'produits': stocks
+            },
+            'synthese': {
+                'type_analyse': 'SYNTHESE',
+                'date_analyse': date_analyse,
+                'chiffre_affaires_total': round(ca_total, 2),
+                'nombre_ventes': self.total[2],
+                'periode_debut': self.periode_debut,
+                'periode_fin': self.periode_fin,
+                'nombre_produits': len(self.produits),
+                'nombre_regions': len(regions),
+                'top_produits': sans_marque(synthese_produits),
+                'top_regions': sans_marque(synthese_regions)
+            }
+        }
@@ -2,15 +2,22 @@
 
 import sys
 import os
+from contextlib import nullcontext
 from database import DatabaseManager
 from import_data import DataImporter
 from analysis import SalesAnalyzer
+from metrics import MetricsRecorder
 
 def main():
     print("DEMARRAGE DU PROJET D'ANALYSE DES VENTES PME")
     print("=" * 60)
     
-    db_manager = DatabaseManager()
+    analyses_workers = int(os.getenv('ANALYSES_CONCURRENCY', '4'))
+    partitioned = os.getenv('VENTE_PARTITIONS', 'false').lower() == 'true'
+    # Relevé de l'exécution (étapes, compteurs, plans de requêtes), écrit en JSON à la fin
+    metrics_dir = os.getenv('METRICS_DIR', os.path.join('data', 'metrics'))
+    metrics = MetricsRecorder(trace_memory=os.getenv('METRICS_TRACE_MEMORY', 'false').lower() == 'true')
+    db_manager = DatabaseManager(pool_size=analyses_workers, partitioned=partitioned, metrics=metrics)
     
     try:
         print("\nETAPE 1: Initialisation de la base de données")
@@ -27,11 +34,44 @@ def main():
         if use_http:
             print(f"Mode collecte HTTP activé: {http_url}")
         
-        importer = DataImporter(db_manager, use_http=use_http, base_url=http_url)
-        
-        importer.import_magasins()
-        importer.import_produits()
-        importer.import_ventes()
+        http_workers = int(os.getenv('HTTP_CONCURRENCY', '8'))
+        csv_backend = os.getenv('IMPORT_CSV_BACKEND', 'pandas').lower()
+        importer = DataImporter(db_manager, use_http=use_http, base_url=http_url, http_workers=http_workers,
+                                csv_backend=csv_backend)
+        
+        # En pipeline, ventes.csv est lu au fil du téléchargement au lieu d'être collecté d'abord
+        pipeline = os.getenv('IMPORT_PIPELINE', 'false').lower() == 'true'
+        # Dossier ou motif glob de fichiers de ventes locaux (par exemple un fichier par magasin et par jour)
+        ventes_source = os.getenv('VENTES_SOURCE', '')
+        fichiers_http = ['magasins.csv', 'produits.csv'] + ([] if pipeline or ventes_source else ['ventes.csv'])
+        importer.prefetch_via_http(fichiers_http)
+        
+        bulk_load = os.getenv('BULK_LOAD', 'auto').lower()
+        if bulk_load == 'auto':
+            bulk_load = 'true' if db_manager.get_table_count('VENTE') == 0 else 'false'
+        if bulk_load == 'true':
+            print("Mode chargement massif activé")
+        
+        with metrics.stage('import'), db_manager.bulk_load() if bulk_load == 'true' else nullcontext():
+            delta = os.getenv('IMPORT_DELTA', 'false').lower() == 'true'
+            incremental = os.getenv('IMPORT_INCREMENTAL', 'true').lower() == 'true'
+            importer.import_magasins(delta=delta, incremental=incremental)
+            importer.import_produits(delta=delta, incremental=incremental)
+            
+            chunksize = int(os.getenv('IMPORT_CHUNKSIZE', '0')) or None
+            # ventes.csv terminé (ou collecté par HTTP): sa dernière ligne sans fin de ligne est importée;
+            # sinon elle peut être en cours d'écriture et attend l'import suivant
+            final = use_http or os.getenv('IMPORT_FINAL', 'true').lower() == 'true'
+            if ventes_source:
+                importer.import_ventes_files(ventes_source, processes=int(os.getenv('IMPORT_PROCESSES', '0')) or None,
+                                             incremental=incremental)
+            elif pipeline:
+                importer.import_ventes_pipeline(batch_size=chunksize or 50000, incremental=incremental,
+                                                final=final)
+            else:
+                if chunksize:
+                    print(f"Import des ventes en streaming par lots de {chunksize} lignes")
+                importer.import_ventes(chunksize=chunksize, incremental=incremental, final=final)
         
         summary = importer.get_import_summary()
         print(f"\nImport terminé:")
@@ -40,9 +80,19 @@ def main():
         
         print("\nETAPE 3: Exécution des analyses")
         print("-" * 40)
-        analyzer = SalesAnalyzer(db_manager)
+        backend = os.getenv('ANALYSES_BACKEND', 'sql').lower()
+        analyzer = SalesAnalyzer(db_manager, max_workers=analyses_workers, backend=backend)
+        
+        resultats = analyzer.run_analyses()
+        summary_report = resultats['synthese']
+        cache_stats = analyzer.get_cache_stats()
+        print(f"Cache d'analyses: {cache_stats['hits']} hit(s), {cache_stats['misses']} miss(es)")
         
-        summary_report = analyzer.generate_summary_report()
+        retention = os.getenv('ANALYSES_RETENTION', '7,365').split(',')
+        analyzer.purge_analysis_results(
+            horaire_jours=int(retention[0]),
+            max_jours=int(retention[1]) if len(retention) > 1 and retention[1] else None
+        )
         
         print("\nETAPE 4: Résultats détaillés")
         print("-" * 40)
@@ -78,6 +128,11 @@ def main():
         
     finally:
         db_manager.close()
+        if metrics_dir:
+            try:
+                print(f"Métriques d'exécution écrites dans {metrics.write_json(metrics_dir)}")
+            except OSError as e:
+                print(f"Impossible d'écrire les métriques d'exécution: {e}")
 
 if __name__ == "__main__":
     exit_code = main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import functools
+import json
+import os
+import resource
+import sqlite3
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+def peak_rss_mb() -> float:
+    # ru_maxrss est en kio sous Linux, en octets sous macOS
+    pic = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(pic / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+class MetricsRecorder:
+    # Étapes chronométrées (imbriquables, par thread), compteurs cumulés et plans de requêtes
+    # d'une exécution, exportés en un document JSON
+    
+    def __init__(self, trace_memory: bool = False):
+        self.debut = time.perf_counter()
+        self.date_debut = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.etapes = []
+        self.totaux = {}
+        self.plans = {}
+        self.trace_memory = trace_memory
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+    
+    def _stack(self) -> list:
+        if not hasattr(self._local, 'etapes'):
+            self._local.etapes = []
+        return self._local.etapes
+    
+    @contextmanager
+    def stage(self, nom: str):
+        pile = self._stack()
+        etape = {'nom': nom, 'parent': pile[-1]['nom'] if pile else None, 'compteurs': {},
+                 'thread': threading.current_thread().name, '_pic_python': 0}
+        if self.trace_memory:
+            # Le pic tracemalloc est global: celui des étapes englobantes est reporté avant remise à zéro
+            pic = tracemalloc.get_traced_memory()[1]
+            for englobante in pile:
+                englobante['_pic_python'] = max(englobante['_pic_python'], pic)
+            tracemalloc.reset_peak()
+        pile.append(etape)
+        debut = time.perf_counter()
+        etape['debut'] = round(debut - self.debut, 6)
+        
+        try:
+            yield etape
+            etape['succes'] = True
+        except Exception:
+            etape['succes'] = False
+            raise
+        finally:
+            duree = time.perf_counter() - debut
+            pile.pop()
+            etape['duree'] = round(duree, 4)
+            lignes = etape['compteurs'].get('lignes')
+            if lignes:
+                etape['lignes_par_seconde'] = round(lignes / duree, 1) if duree > 0 else None
+            etape['rss_pic_mo'] = peak_rss_mb()
+            pic_python = etape.pop('_pic_python')
+            if self.trace_memory:
+                pic_python = max(pic_python, tracemalloc.get_traced_memory()[1])
+                for englobante in pile:
+                    englobante['_pic_python'] = max(englobante['_pic_python'], pic_python)
+                etape['memoire_python_pic_mo'] = round(pic_python / (1024 * 1024), 2)
+            with self._lock:
+                self.etapes.append(etape)
+    
+    def count(self, compteur: str, valeur: int = 1):
+        # Attribué à l'étape courante du thread, à ses étapes englobantes et aux totaux
+        with self._lock:
+            for etape in self._stack():
+                etape['compteurs'][compteur] = etape['compteurs'].get(compteur, 0) + valeur
+            self.totaux[compteur] = self.totaux.get(compteur, 0) + valeur
+    
+    def propagate(self, fonction):
+        # Pour un pool de threads: les étapes du thread exécutant sont rattachées
+        # à l'étape courante du thread appelant
+        englobantes = list(self._stack())
+        
+        @functools.wraps(fonction)
+        def enveloppe(*args, **kwargs):
+            self._local.etapes = list(englobantes)
+            try:
+                return fonction(*args, **kwargs)
+            finally:
+                self._local.etapes = []
+        return enveloppe
+    
+    def record_query_plan(self, nom: str, connection: sqlite3.Connection, sql: str, parametres=()):
+        # Capturé une fois par requête nommée: le plan ne dépend pas des valeurs des paramètres
+        if nom in self.plans:
+            return
+        try:
+            plan = [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}", parametres).fetchall()]
+        except sqlite3.Error as e:
+            plan = [f"indisponible: {e}"]
+        with self._lock:
+            self.plans.setdefault(nom, plan)
+    
+    def to_dict(self) -> dict:
+        with self._lock:
+            etapes = sorted(self.etapes, key=lambda etape: etape['debut'])
+            return {
+                'date': self.date_debut,
+                'duree_totale': round(time.perf_counter() - self.debut, 4),
+                'rss_pic_mo': peak_rss_mb(),
+                'etapes': etapes,
+                'totaux': dict(self.totaux),
+                'plans_requetes': dict(self.plans)
+            }
+    
+    def reset(self):
+        # Processus de longue durée: relevé écrit périodiquement puis remis à zéro
+        with self._lock:
+            self.debut = time.perf_counter()
+            self.date_debut = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self.etapes = []
+            self.totaux = {}
+            self.plans = {}
+    
+    def write_json(self, output_dir: str) -> str:
+        os.makedirs(output_dir, exist_ok=True)
+        # Démon, API et imports écrivent dans le même dossier: microsecondes et PID dans le nom
+        # (qui reste trié par date), et création exclusive pour ne jamais écraser un relevé
+        while True:
+            chemin = os.path.join(output_dir,
+                                  f"run_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{os.getpid()}.json")
+            try:
+                f = open(chemin, 'x', encoding='utf-8')
+            except FileExistsError:
+                continue
+            with f:
+                json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+            return chemin
+
+def instrumented(nom: str):
+    # Chronomètre une méthode comme étape de self.metrics
+    def decorateur(methode):
+        @functools.wraps(methode)
+        def enveloppe(self, *args, **kwargs):
+            with self.metrics.stage(nom):
+                return methode(self, *args, **kwargs)
+        return enveloppe
+    return decorateur
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+
+import functools
+import hashlib
+import json
+import math
+import sqlite3
+import struct
+import zlib
+from array import array
+from collections import Counter
+from datetime import date, timedelta
+from typing import Optional
+
+# HyperLogLog: 2^12 registres, erreur type 1.04 / sqrt(4096) ≈ 1,6 %
+HLL_PRECISION = 12
+
+# Produits conservés par résumé Space-Saving (par jour et après fusion)
+TOPK_CAPACITY = 100
+
+# DDSketch: chaque quantile est à moins de 1 % (relatif) d'une valeur réelle de ce rang
+QUANTILE_ACCURACY = 0.01
+
+# Compression rapide: les registres HyperLogLog, surtout vides, se compressent déjà très bien
+SKETCH_COMPRESSION_LEVEL = 1
+
+# Au-delà de ce nombre de sketches à fusionner, la fusion est vectorisée avec NumPy
+NUMPY_UNION_THRESHOLD = 8
+
+# 2^-r pour chaque valeur de registre possible
+_PUISSANCES = [2.0 ** -rang for rang in range(66)]
+
+@functools.lru_cache(maxsize=1 << 16)
+def _hll_position(valeur, precision: int) -> tuple:
+    # Hachage stable d'un processus à l'autre (hash() est salé), les sketches étant stockés;
+    # mis en cache: les mêmes produits et magasins reviennent chaque jour
+    h = int.from_bytes(hashlib.blake2b(str(valeur).encode('utf-8'), digest_size=8).digest(), 'big')
+    reste = h & ((1 << (64 - precision)) - 1)
+    return h >> (64 - precision), 64 - precision - reste.bit_length() + 1
+
+class HyperLogLog:
+    # Nombre de valeurs distinctes; fusion: maximum registre par registre
+    
+    def __init__(self, precision: int = HLL_PRECISION, registres: Optional[bytes] = None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registres = bytearray(registres) if registres is not None else bytearray(self.m)
+    
+    def add(self, valeur):
+        indice, rang = _hll_position(valeur, self.precision)
+        if rang > self.registres[indice]:
+            self.registres[indice] = rang
+    
+    @classmethod
+    def union(cls, sketches: list, precision: int = HLL_PRECISION) -> 'HyperLogLog':
+        if not sketches:
+            return cls(precision)
+        if len(sketches) == 1:
+            return cls(precision, sketches[0].registres)
+        if len(sketches) <= NUMPY_UNION_THRESHOLD:
+            # Fusion en un seul passage: max() reçoit le registre de chaque sketch
+            return cls(precision, bytes(map(max, *(sketch.registres for sketch in sketches))))
+        
+        # Long historique: import différé de NumPy, réduction d'une matrice sketches x registres
+        import numpy as np
+        registres = np.frombuffer(b''.join(sketch.registres for sketch in sketches), dtype=np.uint8)
+        return cls(precision, registres.reshape(len(sketches), -1).max(axis=0).tobytes())
+    
+    def estimate(self) -> float:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimation = alpha * m * m / sum(map(_PUISSANCES.__getitem__, self.registres))
+        # Petites cardinalités: comptage linéaire des registres vides
+        vides = self.registres.count(0)
+        if estimation <= 2.5 * m and vides:
+            estimation = m * math.log(m / vides)
+        return estimation
+    
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+    
+    def to_bytes(self) -> bytes:
+        return zlib.compress(bytes(self.registres), SKETCH_COMPRESSION_LEVEL)
+    
+    @classmethod
+    def from_bytes(cls, donnees: bytes, precision: int = HLL_PRECISION) -> 'HyperLogLog':
+        return cls(precision, zlib.decompress(donnees))
+
+class SpaceSaving:
+    # Produits les plus lourds (pondérés par le montant): chaque compteur surestime au plus de
+    # son erreur, et un produit absent pèse au plus le plus petit compteur d'un résumé plein
+    
+    def __init__(self, capacite: int = TOPK_CAPACITY, compteurs: Optional[dict] = None, total: float = 0.0):
+        self.capacite = capacite
+        self.compteurs = compteurs or {}
+        self.total = total
+    
+    @classmethod
+    def from_totals(cls, totaux: dict, capacite: int = TOPK_CAPACITY) -> 'SpaceSaving':
+        # Totaux exacts: les capacite plus gros sont conservés, sans erreur
+        resume = cls(capacite, {cle: [poids, 0.0] for cle, poids in totaux.items()}, sum(totaux.values()))
+        resume._truncate()
+        return resume
+    
+    def minimum(self) -> float:
+        if len(self.compteurs) < self.capacite:
+            return 0.0
+        return min(estimation for estimation, _ in self.compteurs.values())
+    
+    @classmethod
+    def union(cls, resumes: list, capacite: int = TOPK_CAPACITY) -> 'SpaceSaving':
+        # Un produit absent d'un résumé y compte pour le minimum de ce résumé (borne haute),
+        # qui s'ajoute aussi à son erreur
+        minimums = [resume.minimum() for resume in resumes]
+        base = sum(minimums)
+        compteurs = {}
+        for resume, minimum in zip(resumes, minimums):
+            for cle, (estimation, erreur) in resume.compteurs.items():
+                cumul = compteurs.setdefault(cle, [base, base])
+                cumul[0] += estimation - minimum
+                cumul[1] += erreur - minimum
+        fusion = cls(capacite, compteurs, sum(resume.total for resume in resumes))
+        fusion._truncate()
+        return fusion
+    
+    def _truncate(self):
+        if len(self.compteurs) > self.capacite:
+            conserves = sorted(self.compteurs.items(), key=lambda item: item[1][0], reverse=True)[:self.capacite]
+            self.compteurs = dict(conserves)
+    
+    def top(self, limit: int) -> list:
+        return sorted(self.compteurs.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+    
+    def to_bytes(self) -> bytes:
+        return zlib.compress(json.dumps({'capacite': self.capacite, 'total': self.total,
+                                         'compteurs': self.compteurs}, separators=(',', ':')).encode('utf-8'),
+                             SKETCH_COMPRESSION_LEVEL)
+    
+    @classmethod
+    def from_bytes(cls, donnees: bytes) -> 'SpaceSaving':
+        contenu = json.loads(zlib.decompress(donnees))
+        return cls(contenu['capacite'], contenu['compteurs'], contenu['total'])
+
+_DDSKETCH_ENTETE = '<dqdd'
+
+class DDSketch:
+    # Quantiles à précision relative: la valeur x > 0 tombe dans le seau ceil(log_gamma(x));
+    # fusion: somme des seaux
+    
+    def __init__(self, precision: float = QUANTILE_ACCURACY, seaux: Optional[dict] = None,
+                 zeros: int = 0, minimum: Optional[float] = None, maximum: Optional[float] = None):
+        self.precision = precision
+        self.gamma = (1 + precision) / (1 - precision)
+        self._inverse_log_gamma = 1 / math.log(self.gamma)
+        self.seaux = seaux or {}
+        self.zeros = zeros
+        self.minimum = minimum
+        self.maximum = maximum
+    
+    @property
+    def count(self) -> int:
+        return self.zeros + sum(self.seaux.values())
+    
+    def add_all(self, valeurs: list):
+        if not valeurs:
+            return
+        # Les montants se répètent (prix x quantité): un logarithme par valeur distincte
+        inverse = self._inverse_log_gamma
+        for valeur, nombre in Counter(valeurs).items():
+            if valeur > 0:
+                seau = math.ceil(math.log(valeur) * inverse)
+                self.seaux[seau] = self.seaux.get(seau, 0) + nombre
+            else:
+                self.zeros += nombre
+        self.minimum = min(valeurs) if self.minimum is None else min(self.minimum, min(valeurs))
+        self.maximum = max(valeurs) if self.maximum is None else max(self.maximum, max(valeurs))
+    
+    @classmethod
+    def union(cls, sketches: list, precision: float = QUANTILE_ACCURACY) -> 'DDSketch':
+        fusion = cls(precision)
+        if len(sketches) > NUMPY_UNION_THRESHOLD:
+            fusion.seaux = cls._sum_buckets(sketches)
+        else:
+            for sketch in sketches:
+                for seau, nombre in sketch.seaux.items():
+                    fusion.seaux[seau] = fusion.seaux.get(seau, 0) + nombre
+        for sketch in sketches:
+            fusion.zeros += sketch.zeros
+            if sketch.minimum is not None:
+                fusion.minimum = sketch.minimum if fusion.minimum is None else min(fusion.minimum, sketch.minimum)
+                fusion.maximum = sketch.maximum if fusion.maximum is None else max(fusion.maximum, sketch.maximum)
+        return fusion
+    
+    @staticmethod
+    def _sum_buckets(sketches: list) -> dict:
+        # Import différé: les seaux de tous les sketches sont sommés par bincount
+        import numpy as np
+        seaux, nombres = [], []
+        for sketch in sketches:
+            seaux.extend(sketch.seaux)
+            nombres.extend(sketch.seaux.values())
+        if not seaux:
+            return {}
+        seaux = np.array(seaux, dtype=np.int64)
+        decalage = int(seaux.min())
+        sommes = np.bincount(seaux - decalage, weights=np.array(nombres, dtype=np.float64))
+        non_vides = np.flatnonzero(sommes)
+        return dict(zip((non_vides + decalage).tolist(), sommes[non_vides].astype(np.int64).tolist()))
+    
+    def quantile(self, q: float) -> Optional[float]:
+        total = self.count
+        if total == 0:
+            return None
+        rang = q * (total - 1)
+        if rang < self.zeros:
+            return 0.0
+        cumul = self.zeros
+        for seau in sorted(self.seaux):
+            cumul += self.seaux[seau]
+            if cumul > rang:
+                # Milieu (relatif) du seau, borné par les extrêmes observés
+                valeur = 2 * self.gamma ** seau / (self.gamma + 1)
+                return min(max(valeur, self.minimum), self.maximum)
+        return self.maximum
+    
+    def to_bytes(self) -> bytes:
+        # En-tête (précision, zéros, min, max; NaN si vide) puis seaux et effectifs en entiers 64 bits:
+        # décodage bien plus rapide que JSON sur des milliers de jours
+        seaux = array('q', self.seaux.keys())
+        seaux.extend(self.seaux.values())
+        entete = struct.pack(_DDSKETCH_ENTETE, self.precision, self.zeros,
+                             math.nan if self.minimum is None else self.minimum,
+                             math.nan if self.maximum is None else self.maximum)
+        return zlib.compress(entete + seaux.tobytes(), SKETCH_COMPRESSION_LEVEL)
+    
+    @classmethod
+    def from_bytes(cls, donnees: bytes) -> 'DDSketch':
+        donnees = zlib.decompress(donnees)
+        precision, zeros, minimum, maximum = struct.unpack_from(_DDSKETCH_ENTETE, donnees)
+        seaux = array('q', donnees[struct.calcsize(_DDSKETCH_ENTETE):])
+        moitie = len(seaux) // 2
+        return cls(precision, dict(zip(seaux[:moitie], seaux[moitie:])), zeros,
+                   None if math.isnan(minimum) else minimum, None if math.isnan(maximum) else maximum)
+
+# Sketch -> (colonne de VENTE_SKETCH_JOUR, décodage)
+SKETCH_COLUMNS = {
+    'hll_produits': ('HLL_Produits', HyperLogLog.from_bytes),
+    'hll_magasins': ('HLL_Magasins', HyperLogLog.from_bytes),
+    'top_produits': ('Top_Produits', SpaceSaving.from_bytes),
+    'quantiles_montant': ('Quantiles_Montant', DDSketch.from_bytes)
+}
+
+def build_daily_sketches(rows) -> dict:
+    # rows: (Date, ID_Reference_Produit, ID_Magasin, Montant_Total); un jeu de sketches par jour
+    par_jour = {}
+    for jour, reference, id_magasin, montant in rows:
+        cumul = par_jour.get(jour)
+        if cumul is None:
+            cumul = par_jour[jour] = ({}, set(), [])
+        produits, magasins, montants = cumul
+        produits[reference] = produits.get(reference, 0.0) + montant
+        magasins.add(id_magasin)
+        montants.append(montant)
+    
+    sketches = {}
+    for jour, (produits, magasins, montants) in par_jour.items():
+        hll_produits = HyperLogLog()
+        for reference in produits:
+            hll_produits.add(reference)
+        hll_magasins = HyperLogLog()
+        for id_magasin in magasins:
+            hll_magasins.add(id_magasin)
+        quantiles = DDSketch()
+        quantiles.add_all(montants)
+        sketches[jour] = {
+            'nombre_ventes': len(montants),
+            'hll_produits': hll_produits,
+            'hll_magasins': hll_magasins,
+            'top_produits': SpaceSaving.from_totals(produits),
+            'quantiles_montant': quantiles
+        }
+    return sketches
+
+def merge_daily_sketches(cursor: sqlite3.Cursor, sketches: dict):
+    # Fusionne avec les sketches déjà stockés pour ces jours (ventes ajoutées à un jour existant)
+    if not sketches:
+        return
+    colonnes = ', '.join(colonne for colonne, _ in SKETCH_COLUMNS.values())
+    cursor.execute(f"""
+        SELECT Date, Nombre_Ventes, {colonnes} FROM VENTE_SKETCH_JOUR WHERE Date >= ? AND Date <= ?
+    """, (min(sketches), max(sketches)))
+    existants = {row[0]: row[1:] for row in cursor.fetchall() if row[0] in sketches}
+    
+    lignes = []
+    for jour, nouveaux in sketches.items():
+        existant = existants.get(jour)
+        if existant is not None:
+            fusion = {'nombre_ventes': existant[0] + nouveaux['nombre_ventes']}
+            for (sketch, (_, decoder)), donnees in zip(SKETCH_COLUMNS.items(), existant[1:]):
+                fusion[sketch] = type(nouveaux[sketch]).union([decoder(donnees), nouveaux[sketch]])
+            nouveaux = fusion
+        lignes.append((jour, nouveaux['nombre_ventes'], *(nouveaux[sketch].to_bytes() for sketch in SKETCH_COLUMNS)))
+    cursor.executemany(f"""
+        INSERT OR REPLACE INTO VENTE_SKETCH_JOUR (Date, Nombre_Ventes, {colonnes})
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, lignes)
+
+def load_daily_sketches(connection: sqlite3.Connection, date_debut: Optional[str] = None,
+                        date_fin: Optional[str] = None, colonnes: tuple = ()) -> list:
+    # [(jour, {sketch: valeur})] dans l'ordre des jours; seules les colonnes demandées sont décodées
+    cursor = connection.execute(f"""
+        SELECT Date, Nombre_Ventes, {', '.join(SKETCH_COLUMNS[colonne][0] for colonne in colonnes) or 'NULL'}
+        FROM VENTE_SKETCH_JOUR
+        WHERE Date >= ? AND Date <= ?
+        ORDER BY Date
+    """, (date_debut or '', date_fin or '9999'))
+    jours = []
+    for row in cursor.fetchall():
+        sketches = {'nombre_ventes': row[1]}
+        for colonne, donnees in zip(colonnes, row[2:]):
+            sketches[colonne] = SKETCH_COLUMNS[colonne][1](donnees)
+        jours.append((row[0], sketches))
+    return jours
+
+def period_key(jour: str, granularite: str) -> str:
+    if granularite == 'jour':
+        return jour
+    if granularite == 'semaine':
+        # Lundi de la semaine, comme l'agrégation SQL
+        lundi = date.fromisoformat(jour)
+        return (lundi - timedelta(days=lundi.weekday())).isoformat()
+    if granularite == 'mois':
+        return jour[:7]
+    raise ValueError(f"Granularité inconnue: {granularite}")
+
+def compare_with_exact(db_manager, date_debut: Optional[str] = None, date_fin: Optional[str] = None,
+                       limit: int = 10) -> dict:
+    # Réponses approchées (sans cache) face aux valeurs exactes calculées en SQL, avec l'écart relatif
+    from analysis import SalesAnalyzer
+    
+    analyzer = SalesAnalyzer(db_manager, use_cache=False)
+    actifs = analyzer.get_actifs_approx(date_debut, date_fin)
+    top = analyzer.get_top_produits_approx(date_debut, date_fin, limit)
+    quantiles = analyzer.get_quantiles_montant_approx(date_debut, date_fin)
+    
+    where, valeurs = SalesAnalyzer._cube_filter(date_debut, date_fin)
+    with db_manager.reader() as connection:
+        cursor = connection.cursor()
+        cursor.execute(f"""
+            SELECT COUNT(DISTINCT ID_Magasin), COUNT(DISTINCT ID_Reference_Produit)
+            FROM VENTE_AGREGAT_JOUR {where}
+        """, valeurs)
+        magasins, produits = cursor.fetchone()
+        
+        cursor.execute(f"""
+            SELECT ID_Reference_Produit, SUM(Montant_Total) FROM VENTE_AGREGAT_JOUR {where}
+            GROUP BY ID_Reference_Produit ORDER BY 2 DESC
+        """, valeurs)
+        ca_exacts = dict(cursor.fetchall())
+        top_exact = list(ca_exacts)[:limit]
+        
+        source = db_manager.vente_source(date_debut, date_fin, connection)
+        cursor.execute(f"SELECT COUNT(*) FROM {source} {where}", valeurs)
+        nombre_ventes = cursor.fetchone()[0]
+        quantiles_exacts = {}
+        for estimation in quantiles['quantiles']:
+            cursor.execute(f"""
+                SELECT Montant_Total FROM {source} {where} ORDER BY Montant_Total LIMIT 1 OFFSET ?
+            """, valeurs + [int(estimation['quantile'] * (nombre_ventes - 1))])
+            row = cursor.fetchone()
+            quantiles_exacts[estimation['quantile']] = row[0] if row else None
+    
+    def ecart(approche, exact):
+        return round(abs(approche - exact) / exact, 4) if exact else None
+    
+    return {
+        'ACTIFS_APPROX': {
+            'magasins': {'approche': actifs['magasins_actifs'], 'exact': magasins,
+                         'ecart_relatif': ecart(actifs['magasins_actifs'], magasins)},
+            'produits': {'approche': actifs['produits_actifs'], 'exact': produits,
+                         'ecart_relatif': ecart(actifs['produits_actifs'], produits)},
+            'erreur_annoncee': actifs['erreur_relative']
+        },
+        'TOP_PRODUITS_APPROX': {
+            'rappel': len(set(top_exact) & {produit['reference'] for produit in top['produits']}) / max(1, len(top_exact)),
+            'ecart_ca_max': max((ecart(produit['ca_estime'], ca_exacts.get(produit['reference'], 0)) or 0
+                                 for produit in top['produits']), default=0),
+            # CA exact de chaque produit listé compris entre son minimum et son estimation
+            'bornes_respectees': all(produit['ca_minimum'] - 0.01 <= ca_exacts.get(produit['reference'], 0)
+                                     <= produit['ca_estime'] + 0.01 for produit in top['produits'])
+        },
+        'QUANTILES_MONTANT_APPROX': {
+            estimation['quantile']: {'approche': estimation['montant'],
+                                     'exact': quantiles_exacts[estimation['quantile']],
+                                     'ecart_relatif': ecart(estimation['montant'] or 0,
+                                                            quantiles_exacts[estimation['quantile']])}
+            for estimation in quantiles['quantiles']
+        }
+    }
+
+if __name__ == "__main__":
+    import sys
+    from database import DatabaseManager
+    
+    print("Vérification des analyses approchées contre les valeurs exactes...")
+    
+    db_manager = DatabaseManager()
+    
+    try:
+        db_manager.connect()
+        db_manager.create_tables()
+        
+        periode = sys.argv[1:3]
+        for type_analyse, ecarts in compare_with_exact(db_manager, *periode).items():
+            print(f"{type_analyse}: {json.dumps(ecarts, ensure_ascii=False)}")
+    
+    except Exception as e:
+        print(f"Erreur lors de la vérification: {e}")
+    finally:
+        db_manager.close()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import threading
+import time
+import pytest
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RACINE, 'scripts'))
+
+from database import DatabaseManager
+from import_data import DataImporter
+from analysis import SalesAnalyzer
+from columnar import MONTANT_TOLERANCE, compare_with_sql
+from incremental import IncrementalAnalyses, SYNTHESE_TOP_N, TOP_MAGASINS_LIMIT
+
+@pytest.fixture
+def db_manager(tmp_path):
+    db_manager = DatabaseManager(db_path=str(tmp_path / 'ventes.db'))
+    db_manager.connect()
+    db_manager.create_tables()
+    importer = DataImporter(db_manager, csv_backend='csv')
+    importer.import_magasins(os.path.join(RACINE, 'magasins.csv'))
+    importer.import_produits(os.path.join(RACINE, 'produits.csv'))
+    importer.import_ventes(os.path.join(RACINE, 'ventes.csv'), final=True)
+    yield db_manager
+    db_manager.close()
+
+def _resultats_stockes(db_manager: DatabaseManager, type_analyse: str) -> int:
+    with db_manager.reader() as connection:
+        return connection.execute("SELECT COUNT(*) FROM ANALYSE_RESULTATS WHERE Type_Analyse = ?",
+                                  (type_analyse,)).fetchone()[0]
+
+def test_analyse_pendant_chargement_massif(db_manager):
+    # Une analyse lancée pendant un chargement massif ne doit pas attendre l'écrivain:
+    # son résultat est différé puis écrit une fois le chargement terminé
+    chargement_en_cours = threading.Event()
+    fin_chargement = threading.Event()
+    
+    def chargement_massif():
+        with db_manager.bulk_load():
+            chargement_en_cours.set()
+            fin_chargement.wait(10)
+    
+    chargeur = threading.Thread(target=chargement_massif)
+    chargeur.start()
+    try:
+        assert chargement_en_cours.wait(5)
+        analyzer = SalesAnalyzer(db_manager)
+        
+        debut = time.perf_counter()
+        resultat = analyzer.get_chiffre_affaires_total()
+        assert time.perf_counter() - debut < 1.0
+        assert resultat['chiffre_affaires_total'] == 5268.78
+        assert _resultats_stockes(db_manager, 'CA_TOTAL') == 0
+        
+        # Résultat différé toujours servi depuis la mémoire
+        assert analyzer.get_chiffre_affaires_total() == resultat
+        assert db_manager.metrics.totaux.get('resultats_differes', 0) >= 1
+    finally:
+        fin_chargement.set()
+        chargeur.join()
+    
+    analyzer.flush_results()
+    assert _resultats_stockes(db_manager, 'CA_TOTAL') == 1
+
+def test_lots_concurrents(db_manager):
+    # Un lot qui se termine dans un thread ne fait pas écrire un à un les résultats d'un lot
+    # encore ouvert dans un autre
+    analyzer = SalesAnalyzer(db_manager)
+    lot_ouvert = threading.Event()
+    fin_premier_lot = threading.Event()
+    
+    def premier_lot():
+        with analyzer.batch_results():
+            lot_ouvert.set()
+            fin_premier_lot.wait(10)
+    
+    thread = threading.Thread(target=premier_lot)
+    thread.start()
+    assert lot_ouvert.wait(5)
+    with analyzer.batch_results():
+        fin_premier_lot.set()
+        thread.join()
+        analyzer.get_chiffre_affaires_total()
+        analyzer.get_ventes_par_region()
+        assert _resultats_stockes(db_manager, 'CA_TOTAL') == 0
+    assert _resultats_stockes(db_manager, 'CA_TOTAL') == 1
+    assert _resultats_stockes(db_manager, 'VENTES_REGION') == 1
+
+# Analyse incrémentale -> même analyse calculée en SQL
+ANALYSES_SQL = {
+    'chiffre_affaires': lambda analyzer: analyzer.get_chiffre_affaires_total(),
+    'ventes_produit': lambda analyzer: analyzer.get_ventes_par_produit(),
+    'ventes_region': lambda analyzer: analyzer.get_ventes_par_region(),
+    'evolution_mensuelle': lambda analyzer: analyzer.get_evolution_ventes(granularite='mois'),
+    'top_magasins': lambda analyzer: analyzer.get_top_magasins(limit=TOP_MAGASINS_LIMIT),
+    'stocks_ventes': lambda analyzer: analyzer.get_stocks_vs_ventes()
+}
+
+def _sans_date(resultat: dict) -> dict:
+    return {cle: valeur for cle, valeur in resultat.items() if cle != 'date_analyse'}
+
+def _resultats_sql(db_manager: DatabaseManager) -> dict:
+    analyzer = SalesAnalyzer(db_manager, use_cache=False, persist_results=False)
+    resultats = {nom: _sans_date(analyse(analyzer)) for nom, analyse in ANALYSES_SQL.items()}
+    with db_manager.reader() as connection:
+        resultats['synthese'] = _sans_date(analyzer._compute_summary(connection, SYNTHESE_TOP_N))
+    return resultats
+
+@pytest.mark.parametrize('periode', [(None, None), ('2023-06-01', '2023-06-15')])
+def test_moteur_colonnes_egal_sql(db_manager, periode):
+    assert all(not differences for differences in compare_with_sql(db_manager).values())
+    
+    moteurs = {backend: SalesAnalyzer(db_manager, use_cache=False, persist_results=False, backend=backend)
+               for backend in ('sql', 'numpy')}
+    for analyse, cle, lignes in ((lambda analyzer: analyzer.get_ventes_par_produit(*periode), 'reference', 'produits'),
+                                 (lambda analyzer: analyzer.get_ventes_par_region(*periode), 'region', 'regions'),
+                                 (lambda analyzer: analyzer.get_evolution_ventes(*periode, granularite='semaine'),
+                                  'periode', 'periodes')):
+        sql, numpy_ = ({ligne[cle]: ligne for ligne in analyse(moteurs[backend])[lignes]}
+                       for backend in ('sql', 'numpy'))
+        assert sql.keys() == numpy_.keys()
+        for valeur_cle, ligne in sql.items():
+            for champ, valeur in ligne.items():
+                if isinstance(valeur, float):
+                    assert abs(valeur - numpy_[valeur_cle][champ]) <= MONTANT_TOLERANCE
+                else:
+                    assert valeur == numpy_[valeur_cle][champ]
+
+def test_analyses_incrementales_egales_sql(tmp_path):
+    # Reconstruction sur les premières ventes, puis mise à jour par un micro-lot: chaque étape
+    # donne les mêmes analyses que SQL
+    db_manager = DatabaseManager(db_path=str(tmp_path / 'ventes.db'))
+    db_manager.connect()
+    try:
+        db_manager.create_tables()
+        importer = DataImporter(db_manager, csv_backend='csv')
+        importer.import_magasins(os.path.join(RACINE, 'magasins.csv'))
+        importer.import_produits(os.path.join(RACINE, 'produits.csv'))
+        
+        with open(os.path.join(RACINE, 'ventes.csv'), encoding='utf-8') as f:
+            lignes = f.readlines()
+        ventes = tmp_path / 'ventes.csv'
+        ventes.write_text(''.join(lignes[:16]), encoding='utf-8')
+        importer.import_ventes(str(ventes), final=True)
+        
+        suivi = IncrementalAnalyses(SalesAnalyzer(db_manager))
+        suivi.rebuild()
+        assert {nom: _sans_date(resultat) for nom, resultat in suivi.results().items()} == \
+            _resultats_sql(db_manager)
+        
+        # Le micro-lot ajoute aussi une vente à une cellule déjà présente de l'agrégat
+        with open(ventes, 'a', encoding='utf-8') as f:
+            f.write(''.join(lignes[16:]) + "\n" + lignes[1])
+        lot = [importer.parse_ventes_file(str(ventes), *importer.resume_position(str(ventes)))]
+        assert importer.write_parsed_ventes(lot, suivi=suivi) == 16
+        assert {nom: _sans_date(resultat) for nom, resultat in suivi.results().items()} == \
+            _resultats_sql(db_manager)
+    finally:
+        db_manager.close()
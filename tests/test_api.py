@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sqlite3
+import sys
+import pytest
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RACINE, 'scripts'))
+
+from database import DatabaseManager
+from import_data import DataImporter
+from analysis import SalesAnalyzer
+from api_server import AnalysisAPI
+
+@pytest.fixture
+def db_manager(tmp_path):
+    db_manager = DatabaseManager(db_path=str(tmp_path / 'ventes.db'))
+    db_manager.connect()
+    db_manager.create_tables()
+    importer = DataImporter(db_manager, csv_backend='csv')
+    importer.import_magasins(os.path.join(RACINE, 'magasins.csv'))
+    importer.import_produits(os.path.join(RACINE, 'produits.csv'))
+    importer.import_ventes(os.path.join(RACINE, 'ventes.csv'), final=True)
+    yield db_manager
+    db_manager.close()
+
+@pytest.fixture
+def api(db_manager):
+    return AnalysisAPI(db_manager, SalesAnalyzer(db_manager, persist_results=False))
+
+def _nouvelle_version(db_manager: DatabaseManager):
+    with db_manager.writer() as connection:
+        db_manager.bump_data_version(connection.cursor())
+        db_manager.commit()
+
+def test_version_changee_pendant_calcul(api, db_manager, monkeypatch):
+    # Un import validé pendant le calcul: la réponse est servie mais pas gardée sous l'ancienne version
+    calcul = api.analyzer.get_chiffre_affaires_total
+    def calcul_pendant_import():
+        _nouvelle_version(db_manager)
+        return calcul()
+    monkeypatch.setattr(api.analyzer, 'get_chiffre_affaires_total', calcul_pendant_import)
+    
+    statut, etag, _ = api.handle('/api/chiffre-affaires')
+    assert statut == 200 and etag is not None
+    assert api.cache.to_dict()['entrees'] == 0
+
+def test_etag_304(api):
+    statut, etag, corps = api.handle('/api/chiffre-affaires')
+    assert statut == 200 and json.loads(corps)['chiffre_affaires_total'] == 5268.78
+    
+    assert api.handle('/api/chiffre-affaires', if_none_match=etag) == (304, etag, b'')
+    assert api.handle('/api/chiffre-affaires', if_none_match=f'"autre", {etag}')[0] == 304
+    assert api.handle('/api/chiffre-affaires', if_none_match='"autre"') == (200, etag, corps)
+    # Une autre période est une autre réponse
+    assert api.handle('/api/chiffre-affaires?date_fin=2023-06-01', if_none_match=etag)[0] == 200
+    assert api.cache.to_dict()['hits'] == 3
+
+def test_nouvelle_version_invalide_cache(api, db_manager, tmp_path):
+    _, etag, _ = api.handle('/api/chiffre-affaires')
+    
+    ventes = tmp_path / 'ventes_juillet.csv'
+    ventes.write_text("Date,ID Référence produit,Quantité,ID Magasin\n2023-07-01,REF001,1,1\n", encoding='utf-8')
+    DataImporter(db_manager, csv_backend='csv').import_ventes(str(ventes), final=True)
+    
+    statut, nouvel_etag, corps = api.handle('/api/chiffre-affaires', if_none_match=etag)
+    assert statut == 200 and nouvel_etag != etag
+    assert json.loads(corps)['chiffre_affaires_total'] == round(5268.78 + 49.99, 2)
+    cache = api.cache.to_dict()
+    assert cache['invalidations'] == 1 and cache['version_donnees'] == db_manager.get_data_version()
+
+def test_requetes_invalides(api):
+    assert api.handle('/api/inconnu')[0] == 404
+    assert api.handle('/api/chiffre-affaires?top=3')[0] == 400
+    assert api.handle('/api/evolution?granularite=annee')[0] == 400
+    assert api.handle('/api/top-magasins?date_debut=2023-6-1')[0] == 400
+
+def test_base_lecture_seule(db_manager, tmp_path):
+    api_db = DatabaseManager(db_path=db_manager.db_path, read_only=True)
+    api_db.connect()
+    try:
+        api_db.check_schema()
+        api = AnalysisAPI(api_db, SalesAnalyzer(api_db, persist_results=False, verbose=False))
+        assert api.handle('/api/synthese')[0] == 200
+        with pytest.raises(RuntimeError):
+            with api_db.writer():
+                pass
+    finally:
+        api_db.close()
+    
+    # Base absente: pas créée; base sans schéma: refusée
+    with pytest.raises(FileNotFoundError):
+        DatabaseManager(db_path=str(tmp_path / 'absente' / 'ventes.db'), read_only=True).connect()
+    assert not os.path.exists(tmp_path / 'absente')
+    sqlite3.connect(tmp_path / 'vide.db').close()
+    vide = DatabaseManager(db_path=str(tmp_path / 'vide.db'), read_only=True)
+    vide.connect()
+    try:
+        with pytest.raises(RuntimeError, match='VENTE_AGREGAT_JOUR'):
+            vide.check_schema()
+    finally:
+        vide.close()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import sys
+import pytest
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RACINE, 'scripts'))
+
+from database import DatabaseManager
+from import_data import DataImporter
+
+CA_VENTES_CSV = 5268.78
+
+@pytest.fixture
+def db_manager(tmp_path):
+    # Ventes de 2023 (ventes.csv) et deux ventes de 2024, en stockage partitionné
+    with open(os.path.join(RACINE, 'ventes.csv'), encoding='utf-8') as f:
+        contenu = f.read()
+    ventes = tmp_path / 'ventes.csv'
+    ventes.write_text(contenu + "\n2024-01-15,REF001,1,1\n2024-02-03,REF002,2,2\n", encoding='utf-8')
+    
+    db_manager = DatabaseManager(db_path=str(tmp_path / 'ventes.db'), partitioned=True)
+    db_manager.connect()
+    db_manager.create_tables()
+    importer = DataImporter(db_manager, csv_backend='csv')
+    importer.import_magasins(os.path.join(RACINE, 'magasins.csv'))
+    importer.import_produits(os.path.join(RACINE, 'produits.csv'))
+    importer.import_ventes(str(ventes), final=True)
+    yield db_manager
+    db_manager.close()
+
+def _totaux(connection: sqlite3.Connection, source: str) -> tuple:
+    return tuple(connection.execute(f"SELECT COUNT(*), ROUND(SUM(Montant_Total), 2) FROM {source}").fetchone())
+
+def test_partitions_mensuelles(db_manager):
+    assert db_manager.list_partitions() == ['2023-05', '2023-06', '2024-01', '2024-02']
+    with db_manager.reader() as connection:
+        assert _totaux(connection, db_manager.vente_source(connection=connection)) == \
+            (32, round(CA_VENTES_CSV + 49.99 + 2 * 19.99, 2))
+        # Seules les partitions de la période sont lues
+        source = db_manager.vente_source('2024-01-01', '2024-12-31', connection)
+        assert 'VENTE_2023' not in source
+        assert _totaux(connection, source) == (2, round(49.99 + 2 * 19.99, 2))
+        assert connection.execute("SELECT ROUND(SUM(Montant_Total), 2) FROM VENTE_AGREGAT_JOUR").fetchone()[0] == \
+            round(CA_VENTES_CSV + 49.99 + 2 * 19.99, 2)
+
+def test_archive_annee(db_manager, tmp_path):
+    version = db_manager.get_data_version()
+    resultat = db_manager.archive_year(2023, archive_dir=str(tmp_path / 'archives'))
+    assert (resultat['partitions'], resultat['ventes']) == (2, 30)
+    assert db_manager.get_data_version() == version + 1
+    
+    # Ventes de 2023 dans le fichier d'archive, retirées de la base et de l'agrégat
+    archive = sqlite3.connect(resultat['fichier'])
+    try:
+        assert _totaux(archive, "(SELECT * FROM VENTE_2023_05 UNION ALL SELECT * FROM VENTE_2023_06)") == \
+            (30, CA_VENTES_CSV)
+    finally:
+        archive.close()
+    assert db_manager.list_partitions() == ['2024-01', '2024-02']
+    with db_manager.reader() as connection:
+        assert _totaux(connection, db_manager.vente_source(connection=connection))[0] == 2
+        for table in ('VENTE_AGREGAT_JOUR', 'VENTE_SKETCH_JOUR'):
+            assert connection.execute(f"SELECT COUNT(*) FROM {table} WHERE Date < '2024-01-01'").fetchone()[0] == 0
+    
+    # Rien à archiver une seconde fois
+    assert db_manager.archive_year(2023, archive_dir=str(tmp_path / 'archives'))['partitions'] == 0
+
+def test_archive_libere_pages(db_manager, tmp_path):
+    # En auto_vacuum incrémental, les pages des partitions supprimées sont rendues au système
+    db_manager.vacuum(incremental=True)
+    resultat = db_manager.archive_year(2023, archive_dir=str(tmp_path / 'archives'))
+    assert resultat['pages_liberees'] > 0
+    with db_manager.reader() as connection:
+        assert connection.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+def test_archive_sans_partitions(tmp_path):
+    db_manager = DatabaseManager(db_path=str(tmp_path / 'ventes.db'))
+    db_manager.connect()
+    try:
+        db_manager.create_tables()
+        with pytest.raises(RuntimeError):
+            db_manager.archive_year(2023, archive_dir=str(tmp_path / 'archives'))
+    finally:
+        db_manager.close()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RACINE, 'scripts'))
+
+from http_collector import DataCollector, STATUT_TELECHARGE, STATUT_NON_MODIFIE, STATUT_ERREUR
+
+CONTENU = b"Date,ID Reference produit,Quantite,ID Magasin\n" + b"2023-06-01,REF001,2,1\n" * 50
+ETAG = '"v1"'
+
+class FichierHandler(BaseHTTPRequestHandler):
+    # Sert CONTENU sous /ventes.csv avec ETag, If-None-Match, Range et If-Range; journalise les requêtes
+    requetes = []
+    
+    def do_GET(self):
+        self.requetes.append((self.headers.get('Range'), self.headers.get('If-None-Match')))
+        if self.path != '/ventes.csv':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.send_header('ETag', ETAG)
+            self.end_headers()
+            return
+        
+        plage = self.headers.get('Range')
+        if plage and self.headers.get('If-Range', ETAG) == ETAG:
+            debut = int(plage.split('=')[1].rstrip('-'))
+            if debut >= len(CONTENU):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(CONTENU)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            corps = CONTENU[debut:]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {debut}-{len(CONTENU) - 1}/{len(CONTENU)}')
+        else:
+            corps = CONTENU
+            self.send_response(200)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(corps)))
+        self.end_headers()
+        self.wfile.write(corps)
+    
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def serveur():
+    FichierHandler.requetes = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FichierHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def collector(serveur, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    collector = DataCollector(serveur, max_workers=1, cache_path=str(tmp_path / 'cache.json'))
+    yield collector
+    collector.session.close()
+
+def _partiel(contenu: bytes, validator: str = ETAG):
+    with open('ventes.csv.part', 'wb') as f:
+        f.write(contenu)
+    with open('ventes.csv.part.validator', 'w', encoding='utf-8') as f:
+        f.write(validator)
+
+def _sans_partiel() -> bool:
+    return not os.path.exists('ventes.csv.part') and not os.path.exists('ventes.csv.part.validator')
+
+def test_get_conditionnel(collector):
+    assert collector.collect_file('ventes.csv')['statut'] == STATUT_TELECHARGE
+    assert open('ventes.csv', 'rb').read() == CONTENU
+    
+    resultat = collector.collect_file('ventes.csv')
+    assert resultat['statut'] == STATUT_NON_MODIFIE
+    assert FichierHandler.requetes[-1] == (None, ETAG)
+
+def test_reprise_range(collector):
+    _partiel(CONTENU[:100])
+    resultat = collector.collect_file('ventes.csv')
+    assert resultat['statut'] == STATUT_TELECHARGE and resultat['reprise']
+    assert FichierHandler.requetes[-1][0] == 'bytes=100-'
+    assert open('ventes.csv', 'rb').read() == CONTENU
+    assert _sans_partiel()
+
+def test_reprise_partiel_complet(collector):
+    # .part complet: 416, le .part devient la copie locale au lieu d'échouer à chaque collecte
+    _partiel(CONTENU)
+    assert collector.collect_file('ventes.csv')['statut'] == STATUT_TELECHARGE
+    assert open('ventes.csv', 'rb').read() == CONTENU
+    assert _sans_partiel()
+    assert collector.collect_file('ventes.csv')['statut'] == STATUT_NON_MODIFIE
+
+def test_reprise_partiel_trop_long(collector):
+    # .part plus long que le fichier du serveur: écarté, puis téléchargement complet
+    _partiel(CONTENU + b"2023-06-02,REF002,1,1\n")
+    assert collector.collect_file('ventes.csv')['statut'] == STATUT_TELECHARGE
+    assert open('ventes.csv', 'rb').read() == CONTENU
+    assert _sans_partiel()
+
+def test_reprise_fichier_modifie(collector):
+    # Validateur périmé: le serveur renvoie tout le fichier (200) malgré la requête Range
+    _partiel(b"ancien contenu", validator='"v0"')
+    assert collector.collect_file('ventes.csv')['statut'] == STATUT_TELECHARGE
+    assert open('ventes.csv', 'rb').read() == CONTENU
+
+def test_erreur_definitive_supprime_partiel(collector):
+    with open('absent.csv.part', 'wb') as f:
+        f.write(b"debut")
+    with open('absent.csv.part.validator', 'w', encoding='utf-8') as f:
+        f.write(ETAG)
+    assert collector.collect_file('absent.csv')['statut'] == STATUT_ERREUR
+    assert not os.path.exists('absent.csv.part') and not os.path.exists('absent.csv.part.validator')
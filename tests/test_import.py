@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+import csv
+import os
+import sqlite3
+import sys
+import pytest
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RACINE, 'scripts'))
+
+from database import DatabaseManager
+from import_data import DataImporter
+from sketches import QUANTILE_ACCURACY, compare_with_exact
+
+CA_VENTES_CSV = 5268.78
+
+@pytest.fixture
+def db_manager(tmp_path):
+    db_manager = DatabaseManager(db_path=str(tmp_path / 'ventes.db'))
+    db_manager.connect()
+    db_manager.create_tables()
+    importer = DataImporter(db_manager, csv_backend='csv')
+    importer.import_magasins(os.path.join(RACINE, 'magasins.csv'))
+    importer.import_produits(os.path.join(RACINE, 'produits.csv'))
+    yield db_manager
+    db_manager.close()
+
+def _totaux_ventes(db_manager: DatabaseManager, condition: str = '') -> tuple:
+    with db_manager.reader() as connection:
+        ventes = db_manager.vente_source(connection=connection)
+        nombre, total = connection.execute(
+            f"SELECT COUNT(*), ROUND(SUM(Montant_Total), 2) FROM {ventes} {condition}").fetchone()
+    return nombre, total
+
+def _base_initiale(db_path: str):
+    # Base telle que la créait la première version: VENTE sans origine, ventes dédoublonnées
+    # par contenu à l'import
+    connection = sqlite3.connect(db_path)
+    connection.executescript("""
+        CREATE TABLE MAGASIN (
+            ID_Magasin INTEGER PRIMARY KEY,
+            Ville TEXT NOT NULL,
+            Nombre_Salaries INTEGER NOT NULL,
+            Region TEXT NOT NULL
+        );
+        CREATE TABLE PRODUIT (
+            ID_Reference TEXT PRIMARY KEY,
+            Nom TEXT NOT NULL,
+            Prix REAL NOT NULL CHECK (Prix > 0),
+            Stock INTEGER NOT NULL CHECK (Stock >= 0)
+        );
+        CREATE TABLE VENTE (
+            ID_Vente INTEGER PRIMARY KEY AUTOINCREMENT,
+            Date TEXT NOT NULL,
+            ID_Reference_Produit TEXT NOT NULL,
+            Quantite INTEGER NOT NULL CHECK (Quantite > 0),
+            ID_Magasin INTEGER NOT NULL,
+            Montant_Total REAL NOT NULL
+        );
+        CREATE TABLE ANALYSE_RESULTATS (
+            ID_Analyse INTEGER PRIMARY KEY AUTOINCREMENT,
+            Type_Analyse TEXT NOT NULL,
+            Date_Analyse TEXT NOT NULL,
+            Resultat TEXT NOT NULL,
+            Valeur_Numerique REAL
+        );
+        CREATE INDEX idx_vente_date ON VENTE(Date);
+    """)
+    with open(os.path.join(RACINE, 'magasins.csv'), newline='') as f:
+        lignes = list(csv.DictReader(f))
+    connection.executemany("INSERT INTO MAGASIN VALUES (?, ?, ?, '')",
+                           [(int(l['ID Magasin']), l['Ville'], int(l['Nombre de salariés']))
+                            for l in lignes])
+    with open(os.path.join(RACINE, 'produits.csv'), newline='') as f:
+        prix = {}
+        for l in csv.DictReader(f):
+            prix[l['ID Référence produit']] = float(l['Prix'])
+            connection.execute("INSERT INTO PRODUIT VALUES (?, ?, ?, ?)",
+                               (l['ID Référence produit'], l['Nom'], float(l['Prix']), int(l['Stock'])))
+    with open(os.path.join(RACINE, 'ventes.csv'), newline='') as f:
+        for l in csv.DictReader(f):
+            vente = (l['Date'], l['ID Référence produit'], int(l['Quantité']), int(l['ID Magasin']))
+            existe = connection.execute("""
+                SELECT COUNT(*) FROM VENTE
+                WHERE Date = ? AND ID_Reference_Produit = ? AND Quantite = ? AND ID_Magasin = ?
+            """, vente).fetchone()[0]
+            if not existe:
+                connection.execute("INSERT INTO VENTE (Date, ID_Reference_Produit, Quantite, ID_Magasin, Montant_Total) VALUES (?, ?, ?, ?, ?)",
+                                   vente + (vente[2] * prix[vente[1]],))
+    connection.commit()
+    connection.close()
+
+@pytest.mark.parametrize('partitions', [False, True])
+def test_mise_a_niveau_base_initiale(tmp_path, partitions):
+    # Réimporter ventes.csv dans une base créée par la première version ne doit pas doubler les
+    # ventes: les ventes héritées reçoivent l'origine de la ligne qui les a produites
+    db_path = str(tmp_path / 'ventes.db')
+    _base_initiale(db_path)
+    
+    db_manager = DatabaseManager(db_path=db_path, partitioned=partitions)
+    db_manager.connect()
+    try:
+        db_manager.create_tables()
+        assert _totaux_ventes(db_manager) == (30, CA_VENTES_CSV)
+        
+        importer = DataImporter(db_manager, csv_backend='csv')
+        importer.import_ventes(os.path.join(RACINE, 'ventes.csv'), final=True)
+        assert _totaux_ventes(db_manager) == (30, CA_VENTES_CSV)
+        
+        assert _totaux_ventes(db_manager, "WHERE Source IS NULL")[0] == 0
+        with db_manager.reader() as connection:
+            index = connection.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE name LIKE '%_heritees'").fetchone()[0]
+        assert index == 0
+    finally:
+        db_manager.close()
+
+def test_reimport_sans_doublon(db_manager):
+    importer = DataImporter(db_manager, csv_backend='csv')
+    importer.import_ventes(os.path.join(RACINE, 'ventes.csv'), final=True)
+    importer.import_ventes(os.path.join(RACINE, 'ventes.csv'), incremental=False, final=True)
+    assert _totaux_ventes(db_manager) == (30, CA_VENTES_CSV)
+
+@pytest.mark.parametrize('backend', ['csv', 'pandas'])
+def test_lignes_invalides_rejetees(db_manager, tmp_path, backend):
+    # Chaque lecteur applique les mêmes contrôles: les lignes invalides sont comptées et
+    # gardent leur numéro, les suivantes sont importées
+    with open(os.path.join(RACINE, 'ventes.csv'), encoding='utf-8') as f:
+        contenu = f.read()
+    ventes = tmp_path / 'ventes.csv'
+    ventes.write_text(contenu + "\n2023-06-01,REF001,0,1\n2023-06-01,REF001,2,\n2023-06-01,REF001,2\n"
+                      "2023-06-01,REF001,2,1,9\n2023-13-01,REF001,2,1\n2023-06-02,REF001,2,1\n",
+                      encoding='utf-8')
+    
+    DataImporter(db_manager, csv_backend=backend).import_ventes(str(ventes))
+    assert _totaux_ventes(db_manager) == (31, round(CA_VENTES_CSV + 2 * 49.99, 2))
+    assert db_manager.metrics.totaux['lignes_rejetees'] == 5
+    with db_manager.reader() as connection:
+        assert connection.execute("SELECT MAX(Ligne_Source) FROM VENTE").fetchone()[0] == 36
+
+def test_insertion_signale_contraintes(db_manager):
+    # Seul le conflit d'origine est ignoré: une vente qui viole une autre contrainte fait échouer l'insertion
+    importer = DataImporter(db_manager, csv_backend='csv')
+    vente = ('2023-06-01', 'REF001', 2, 1, 99.98, 'test.csv', 1)
+    with db_manager.writer():
+        cursor = db_manager.connection.cursor()
+        assert importer._insert_ventes_records(cursor, [vente]) == 1
+        assert importer._insert_ventes_records(cursor, [vente]) == 0
+        with pytest.raises(sqlite3.IntegrityError):
+            importer._insert_ventes_records(cursor, [('2023-06-01', 'REF001', 0, 1, 0.0, 'test.csv', 2)])
+        db_manager.rollback()
+
+@pytest.mark.parametrize('backend', ['csv', 'pandas'])
+@pytest.mark.parametrize('final', [False, True])
+def test_reprise_derniere_ligne_incomplete(db_manager, tmp_path, backend, final):
+    # Une dernière ligne en cours d'écriture n'est ni perdue ni sautée: sans final elle n'est pas lue,
+    # avec final elle est rejetée mais reste en attente; complétée, elle est importée à l'import suivant
+    with open(os.path.join(RACINE, 'ventes.csv'), encoding='utf-8') as f:
+        contenu = f.read()
+    ventes = tmp_path / 'ventes.csv'
+    ventes.write_text(contenu + "\n2023-06-27,REF001,3", encoding='utf-8')
+    importer = DataImporter(db_manager, csv_backend=backend)
+    
+    importer.import_ventes(str(ventes), final=final)
+    assert _totaux_ventes(db_manager) == (30, CA_VENTES_CSV)
+    assert db_manager.get_ingestion_state(db_manager.source_name(str(ventes)))['nombre_lignes'] == 30
+    
+    with open(ventes, 'a', encoding='utf-8') as f:
+        f.write(",4\n2023-06-28,REF002,1,1\n")
+    importer.import_ventes(str(ventes), final=final)
+    assert _totaux_ventes(db_manager) == (32, round(CA_VENTES_CSV + 3 * 49.99 + 19.99, 2))
+    etat = db_manager.get_ingestion_state(db_manager.source_name(str(ventes)))
+    assert (etat['octets_consommes'], etat['nombre_lignes']) == (os.path.getsize(ventes), 32)
+
+def test_derniere_ligne_fichier_termine(db_manager):
+    # ventes.csv est livré sans fin de ligne finale: sa dernière vente n'est importée qu'avec final
+    importer = DataImporter(db_manager, csv_backend='csv')
+    importer.import_ventes(os.path.join(RACINE, 'ventes.csv'))
+    assert _totaux_ventes(db_manager)[0] == 29
+    importer.import_ventes(os.path.join(RACINE, 'ventes.csv'), final=True)
+    assert _totaux_ventes(db_manager) == (30, CA_VENTES_CSV)
+
+def test_source_chemins_equivalents(db_manager, tmp_path, monkeypatch):
+    # ventes.csv, ./ventes.csv et le chemin absolu sont le même fichier: même origine, même état d'ingestion
+    ventes = tmp_path / 'ventes.csv'
+    ventes.write_bytes(open(os.path.join(RACINE, 'ventes.csv'), 'rb').read())
+    monkeypatch.chdir(tmp_path)
+    importer = DataImporter(db_manager, csv_backend='csv')
+    for chemin in ('ventes.csv', './ventes.csv', str(ventes)):
+        importer.import_ventes(chemin, final=True)
+        importer.import_ventes(chemin, incremental=False, final=True)
+    assert _totaux_ventes(db_manager) == (30, CA_VENTES_CSV)
+    assert db_manager.get_ingestion_state(db_manager.source_name('ventes.csv'))['nombre_lignes'] == 30
+
+def _quantite_vendue(db_manager: DatabaseManager, reference: str) -> int:
+    with db_manager.reader() as connection:
+        return connection.execute(f"SELECT SUM(Quantite) FROM {db_manager.vente_source(connection=connection)} "
+                                  "WHERE ID_Reference_Produit = ?", (reference,)).fetchone()[0]
+
+@pytest.mark.parametrize('partitions', [False, True])
+def test_delta_prix_agregat(tmp_path, partitions):
+    # Un changement de prix importé en delta recalcule les ventes du produit, et l'agrégat
+    # journalier et les sketches restent égaux à ce que donnent les ventes détaillées
+    db_manager = DatabaseManager(db_path=str(tmp_path / 'ventes.db'), partitioned=partitions)
+    db_manager.connect()
+    try:
+        db_manager.create_tables()
+        importer = DataImporter(db_manager, csv_backend='csv')
+        importer.import_magasins(os.path.join(RACINE, 'magasins.csv'))
+        importer.import_produits(os.path.join(RACINE, 'produits.csv'))
+        importer.import_ventes(os.path.join(RACINE, 'ventes.csv'), final=True)
+        
+        with open(os.path.join(RACINE, 'produits.csv'), encoding='utf-8') as f:
+            contenu = f.read()
+        produits = tmp_path / 'produits.csv'
+        produits.write_text(contenu.replace('REF001,49.99', 'REF001,59.99'), encoding='utf-8')
+        resultat = importer.import_produits(str(produits), delta=True)
+        assert resultat['modifies'] == 1 and resultat['ventes_recalculees'] > 0
+        
+        with db_manager.reader() as connection:
+            ventes = db_manager.vente_source(connection=connection)
+            assert connection.execute(f"""
+                SELECT COUNT(*) FROM {ventes} v JOIN PRODUIT p ON p.ID_Reference = v.ID_Reference_Produit
+                WHERE abs(v.Montant_Total - v.Quantite * p.Prix) > 1e-9
+            """).fetchone()[0] == 0
+            ecarts = connection.execute(f"""
+                SELECT COUNT(*) FROM (
+                    SELECT Date, ID_Reference_Produit, ID_Magasin, SUM(Quantite) as Quantite,
+                           SUM(Montant_Total) as Montant, COUNT(*) as Nombre
+                    FROM {ventes} GROUP BY Date, ID_Reference_Produit, ID_Magasin
+                ) v
+                FULL OUTER JOIN VENTE_AGREGAT_JOUR a USING (Date, ID_Reference_Produit, ID_Magasin)
+                WHERE a.Nombre_Ventes IS NOT v.Nombre OR a.Quantite_Totale IS NOT v.Quantite
+                   OR abs(a.Montant_Total - v.Montant) > 1e-6
+            """).fetchone()[0]
+        assert ecarts == 0
+        assert _totaux_ventes(db_manager)[1] == round(CA_VENTES_CSV + 10 * _quantite_vendue(db_manager, 'REF001'), 2)
+        
+        ecarts_sketches = compare_with_exact(db_manager)
+        assert ecarts_sketches['TOP_PRODUITS_APPROX']['bornes_respectees']
+        assert all(estimation['ecart_relatif'] <= QUANTILE_ACCURACY
+                   for estimation in ecarts_sketches['QUANTILES_MONTANT_APPROX'].values())
+    finally:
+        db_manager.close()
@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RACINE, 'scripts'))
+
+from metrics import MetricsRecorder
+
+def test_releves_meme_seconde(tmp_path):
+    # Plusieurs relevés écrits dans la même seconde (démon et API) ne s'écrasent pas
+    chemins = {MetricsRecorder().write_json(str(tmp_path)) for _ in range(20)}
+    assert len(chemins) == 20
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(chemin) for chemin in chemins)
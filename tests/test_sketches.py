@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import sys
+import pytest
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RACINE, 'scripts'))
+
+from database import DatabaseManager
+from import_data import DataImporter
+from sketches import (HyperLogLog, SpaceSaving, DDSketch, QUANTILE_ACCURACY, NUMPY_UNION_THRESHOLD,
+                      compare_with_exact)
+
+# Plus de jours que NUMPY_UNION_THRESHOLD: les deux chemins de fusion sont couverts
+JOURS = [NUMPY_UNION_THRESHOLD // 2, NUMPY_UNION_THRESHOLD * 2]
+
+@pytest.fixture
+def db_manager(tmp_path):
+    db_manager = DatabaseManager(db_path=str(tmp_path / 'ventes.db'))
+    db_manager.connect()
+    db_manager.create_tables()
+    importer = DataImporter(db_manager, csv_backend='csv')
+    importer.import_magasins(os.path.join(RACINE, 'magasins.csv'))
+    importer.import_produits(os.path.join(RACINE, 'produits.csv'))
+    importer.import_ventes(os.path.join(RACINE, 'ventes.csv'), final=True)
+    yield db_manager
+    db_manager.close()
+
+@pytest.mark.parametrize('jours', JOURS)
+def test_hll_erreur_relative(jours):
+    # Valeurs communes à plusieurs jours: la fusion ne compte chaque valeur qu'une fois
+    generateur = random.Random(1)
+    sketches = [HyperLogLog() for _ in range(jours)]
+    for valeur in range(20000):
+        for sketch in generateur.sample(sketches, 2):
+            sketch.add(f"REF{valeur}")
+    fusion = HyperLogLog.union(sketches)
+    assert abs(fusion.estimate() - 20000) / 20000 <= 3 * fusion.relative_error()
+
+@pytest.mark.parametrize('jours', JOURS)
+def test_ddsketch_precision_relative(jours):
+    generateur = random.Random(2)
+    valeurs = [round(generateur.lognormvariate(4, 1.5), 2) for _ in range(20000)] + [0.0] * 100
+    sketches = [DDSketch() for _ in range(jours)]
+    for jour, sketch in enumerate(sketches):
+        sketch.add_all(valeurs[jour::jours])
+    fusion = DDSketch.union(sketches)
+    
+    triees = sorted(valeurs)
+    assert fusion.count == len(valeurs)
+    for q in (0.001, 0.1, 0.5, 0.9, 0.99, 0.999):
+        exact = triees[int(q * (len(triees) - 1))]
+        assert abs(fusion.quantile(q) - exact) <= QUANTILE_ACCURACY * exact + 1e-9
+
+@pytest.mark.parametrize('jours', JOURS)
+def test_space_saving_bornes(jours):
+    # Résumés journaliers tronqués: chaque produit retenu a un poids exact entre
+    # estimation - erreur et estimation
+    generateur = random.Random(3)
+    totaux_jours = []
+    for _ in range(jours):
+        totaux = {}
+        for _ in range(2000):
+            produit = f"REF{int(generateur.paretovariate(1.2))}"
+            totaux[produit] = totaux.get(produit, 0.0) + generateur.uniform(1, 100)
+        totaux_jours.append(totaux)
+    fusion = SpaceSaving.union([SpaceSaving.from_totals(totaux, capacite=20) for totaux in totaux_jours],
+                               capacite=20)
+    
+    exacts = {}
+    for totaux in totaux_jours:
+        for produit, poids in totaux.items():
+            exacts[produit] = exacts.get(produit, 0.0) + poids
+    for produit, (estimation, erreur) in fusion.top(10):
+        assert estimation - erreur - 1e-6 <= exacts[produit] <= estimation + 1e-6
+    # Un produit absent du résumé pèse au plus son minimum
+    assert all(poids <= fusion.minimum() + 1e-6 for produit, poids in exacts.items()
+               if produit not in fusion.compteurs)
+
+@pytest.mark.parametrize('periode', [(None, None), ('2023-06-01', '2023-06-15')])
+def test_analyses_approchees_contre_exact(db_manager, periode):
+    ecarts = compare_with_exact(db_manager, *periode)
+    
+    actifs = ecarts['ACTIFS_APPROX']
+    for cle in ('magasins', 'produits'):
+        assert actifs[cle]['ecart_relatif'] <= 3 * actifs['erreur_annoncee']
+    assert ecarts['TOP_PRODUITS_APPROX']['bornes_respectees']
+    assert ecarts['TOP_PRODUITS_APPROX']['rappel'] == 1.0
+    for estimation in ecarts['QUANTILES_MONTANT_APPROX'].values():
+        assert estimation['ecart_relatif'] <= QUANTILE_ACCURACY